@@ -0,0 +1,262 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+from sample import Sample
+from sample_file import SampleFile
+from sample_pair import SamplePair
+
+
+def journal_key(galaxy_url, library_name, samples_dict):
+    """
+    Get the key an import is journaled under.
+
+    An import is identified by the samples in its JSON parameter file and
+    the library they are imported to. The rest of the parameter file changes
+    every time Galaxy runs the tool, so it is not part of the key.
+
+    :type galaxy_url: str
+    :param galaxy_url: the URL of the Galaxy instance
+    :type library_name: str
+    :param library_name: the name of the library imported to
+    :type samples_dict: dict
+    :param samples_dict: the samples of the JSON parameter file
+    :return: the key, as a hex string
+    """
+    digest = hashlib.sha1()
+    for part in (galaxy_url, library_name,
+                 json.dumps(samples_dict, sort_keys=True)):
+        digest.update(json.dumps(part))
+    return digest.hexdigest()
+
+
+class ImportJournal:
+
+    """
+    A record of the progress of an import, kept in an SQLite database, so an
+    interrupted import can be resumed.
+
+    The resolved samples, the ids of library folders, and the dataset ids and
+    verification outcomes of sample files are recorded as the import goes.
+    Samples are recorded one at a time as they are resolved, so a resumed
+    import only resolves the samples after them.
+    Several imports can share a database: each is recorded under its own key.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS imports (
+            key TEXT PRIMARY KEY, started REAL, resolved INTEGER);
+        CREATE TABLE IF NOT EXISTS samples (
+            key TEXT, position INTEGER, sample TEXT,
+            PRIMARY KEY (key, position));
+        CREATE TABLE IF NOT EXISTS folders (
+            key TEXT, path TEXT, folder_id TEXT, PRIMARY KEY (key, path));
+        CREATE TABLE IF NOT EXISTS files (
+            key TEXT, galaxy_path TEXT, dataset_id TEXT, folder_id TEXT,
+            verified INTEGER, PRIMARY KEY (key, galaxy_path));
+    """
+
+    def __init__(self, path, key, resume=False):
+        """
+        Open the journal of an import.
+
+        :type path: str
+        :param path: the path of the SQLite database, or ':memory:' to keep
+        the journal in memory only
+        :type key: str
+        :param key: the key of the import, see journal_key
+        :type resume: bool
+        :param resume: whether to resume from what was recorded before, or
+        to discard it and start again
+        """
+        self.key = key
+        self._lock = threading.RLock()
+        # The linking and verification stages of a streaming import both
+        # record their progress
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.executescript(self.SCHEMA)
+            if not resume:
+                self._discard()
+            self._connection.execute(
+                'INSERT OR IGNORE INTO imports (key, started) VALUES (?, ?)',
+                (key, time.time()))
+
+        self._num_samples = self._connection.execute(
+            'SELECT COUNT(*) FROM samples WHERE key = ?', (key,)).fetchone()[0]
+        self._folder_ids = dict(self._connection.execute(
+            'SELECT path, folder_id FROM folders WHERE key = ?', (key,)))
+        self._files = {}
+        for galaxy_path, dataset_id, folder_id, verified in \
+                self._connection.execute(
+                    'SELECT galaxy_path, dataset_id, folder_id, verified '
+                    'FROM files WHERE key = ?', (key,)):
+            self._files[galaxy_path] = (dataset_id, folder_id, bool(verified))
+
+    def _discard(self):
+        for table in ('imports', 'samples', 'folders', 'files'):
+            self._connection.execute(
+                'DELETE FROM %s WHERE key = ?' % table, (self.key,))
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def samples(self):
+        """
+        Get the samples that were resolved from IRIDA.
+
+        :return: a list of Samples, or None if they were not all recorded
+        """
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT resolved FROM imports WHERE key = ?', (self.key,)
+            ).fetchone()
+        if row is None or not row[0]:
+            return None
+        return self.resolved_samples()
+
+    def resolved_samples(self):
+        """
+        Get the samples recorded so far, even if not every sample was.
+
+        :return: a list of Samples, in the order they were resolved
+        """
+        with self._lock:
+            rows = self._connection.execute(
+                'SELECT sample FROM samples WHERE key = ? ORDER BY position',
+                (self.key,)).fetchall()
+        return [_load_sample(json.loads(sample)) for sample, in rows]
+
+    def add_samples(self, samples):
+        """
+        Record samples as they are resolved from IRIDA, after the samples
+        recorded so far.
+
+        :type samples: list
+        :param samples: the Samples that were resolved
+        """
+        with self._lock, self._connection:
+            rows = [(self.key, self._num_samples + position,
+                     json.dumps(_dump_sample(sample)))
+                    for position, sample in enumerate(samples)]
+            self._connection.executemany(
+                'INSERT OR REPLACE INTO samples (key, position, sample) '
+                'VALUES (?, ?, ?)', rows)
+            self._num_samples += len(rows)
+
+    def record_samples(self, samples):
+        """
+        Record that every sample was resolved from IRIDA. The samples not
+        added already are added.
+
+        :type samples: list
+        :param samples: every Sample of the import, in order
+        """
+        with self._lock:
+            self.add_samples(samples[self._num_samples:])
+            with self._connection:
+                self._connection.execute(
+                    'UPDATE imports SET resolved = 1 WHERE key = ?',
+                    (self.key,))
+
+    def folder_ids(self, folder_paths):
+        """
+        Get the recorded ids of library folders.
+
+        :type folder_paths: list
+        :param folder_paths: the paths of the folders
+        :return: a dict of folder ids by path, of the folders that were
+        recorded
+        """
+        return dict((folder_path, self._folder_ids[folder_path])
+                    for folder_path in folder_paths
+                    if folder_path in self._folder_ids)
+
+    def record_folders(self, folder_ids):
+        """
+        Record the ids of library folders.
+
+        :type folder_ids: dict
+        :param folder_ids: folder ids by path
+        """
+        with self._lock, self._connection:
+            self._connection.executemany(
+                'INSERT OR REPLACE INTO folders (key, path, folder_id) '
+                'VALUES (?, ?, ?)',
+                [(self.key, folder_path, folder_id)
+                 for folder_path, folder_id in folder_ids.items()])
+            self._folder_ids.update(folder_ids)
+
+    def restore_file(self, sample_file, galaxy_path):
+        """
+        Set a sample file's dataset as recorded, if it was linked.
+
+        :type sample_file: SampleFile
+        :param sample_file: the sample file to restore
+        :type galaxy_path: str
+        :param galaxy_path: the sample file's path in the library
+        :return: True if the sample file was restored
+        """
+        recorded = self._files.get(galaxy_path)
+        if recorded is None or recorded[0] is None:
+            return False
+
+        dataset_id, folder_id, verified = recorded
+        sample_file.library_dataset_id = dataset_id
+        sample_file.library_folder_id = folder_id
+        sample_file.galaxy_path = galaxy_path
+        sample_file.verified = verified
+        return True
+
+    def record_files(self, sample_files):
+        """
+        Record the datasets and verification outcomes of sample files.
+
+        :type sample_files: list
+        :param sample_files: SampleFiles that have been added to the library
+        """
+        rows = [(self.key, sample_file.galaxy_path,
+                 sample_file.library_dataset_id,
+                 sample_file.library_folder_id, int(sample_file.verified))
+                for sample_file in sample_files
+                if sample_file.galaxy_path is not None]
+        with self._lock, self._connection:
+            self._connection.executemany(
+                'INSERT OR REPLACE INTO files (key, galaxy_path, dataset_id, '
+                'folder_id, verified) VALUES (?, ?, ?, ?, ?)', rows)
+            for row in rows:
+                self._files[row[1]] = (row[2], row[3], bool(row[4]))
+
+
+def _dump_sample(sample):
+    """Get a Sample as a JSON compatible dict"""
+    reads = []
+    for sample_item in sample.get_reads():
+        if isinstance(sample_item, SamplePair):
+            reads.append({'pair': sample_item.name,
+                          'forward': _dump_file(sample_item.forward),
+                          'reverse': _dump_file(sample_item.reverse)})
+        else:
+            reads.append({'file': _dump_file(sample_item)})
+    return {'name': sample.name, 'paired_path': sample.paired_path,
+            'unpaired_path': sample.unpaired_path, 'reads': reads}
+
+
+def _dump_file(sample_file):
+    return [sample_file.name, sample_file.path]
+
+
+def _load_sample(data):
+    """Make a Sample from a dict made by _dump_sample"""
+    sample = Sample(data['name'], data['paired_path'], data['unpaired_path'])
+    for read in data['reads']:
+        if 'pair' in read:
+            sample.add_pair(SamplePair(read['pair'],
+                                       SampleFile(*read['forward']),
+                                       SampleFile(*read['reverse'])))
+        else:
+            sample.add_file(SampleFile(*read['file']))
+    return sample
@@ -0,0 +1,199 @@
+import json
+import re
+import threading
+import time
+import urlparse
+
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# The HTTP methods of requests made through a bioblend GalaxyInstance, by
+# the name of the method making them
+GALAXY_REQUEST_METHODS = OrderedDict([
+    ('make_get_request', 'GET'), ('make_post_request', 'POST'),
+    ('make_put_request', 'PUT'), ('make_patch_request', 'PATCH'),
+    ('make_delete_request', 'DELETE')])
+
+
+def endpoint(method, url):
+    """
+    Get the endpoint a request is made to, so that requests for different
+    resources of the same kind are counted together.
+
+    :type method: str
+    :param method: the request's HTTP method e.g. 'GET'
+    :type url: str
+    :param url: the request's URL
+    :return: the method and the URL's path, with each part of the path
+    that contains a digit replaced by '{id}' e.g.
+    'GET /api/folders/{id}/contents'
+    """
+    path = urlparse.urlparse(url).path
+    return method + ' ' + re.sub(r'(?<=/)[^/]*\d[^/]*', '{id}', path)
+
+
+class ImportMetrics:
+
+    """
+    How long each phase of an import took, and how many requests were made
+    to each IRIDA and Galaxy endpoint and how long they took.
+
+    Requests may be recorded from several threads at once.
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self.finished = None
+        # Seconds spent in each phase, in the order the phases began
+        self.phases = OrderedDict()
+        # [count, total seconds, longest seconds] by service and endpoint
+        self.requests = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name):
+        """
+        Time a phase of the import. A phase entered more than once is timed
+        in total.
+
+        :type name: str
+        :param name: the name of the phase e.g. 'linking'
+        """
+        start = time.time()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.phases[name] = (self.phases.get(name, 0) +
+                                     time.time() - start)
+
+    @contextmanager
+    def request(self, service, method, url):
+        """
+        Time a request. Requests that fail are timed too.
+
+        :type service: str
+        :param service: 'IRIDA' or 'Galaxy'
+        :type method: str
+        :param method: the request's HTTP method e.g. 'GET'
+        :type url: str
+        :param url: the request's URL
+        """
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.record_request(service, endpoint(method, url),
+                                time.time() - start)
+
+    def record_request(self, service, request_endpoint, seconds):
+        """
+        Record a request that has been made.
+
+        :type service: str
+        :param service: 'IRIDA' or 'Galaxy'
+        :type request_endpoint: str
+        :param request_endpoint: the endpoint requested, see endpoint()
+        :type seconds: float
+        :param seconds: how long the request took
+        """
+        with self._lock:
+            stats = self.requests.setdefault((service, request_endpoint),
+                                             [0, 0.0, 0.0])
+            stats[0] += 1
+            stats[1] += seconds
+            stats[2] = max(stats[2], seconds)
+
+    def watch(self, client, service, methods=GALAXY_REQUEST_METHODS):
+        """
+        Time the requests made through a client from now on.
+
+        :type client: object
+        :param client: the client e.g. a bioblend GalaxyInstance
+        :type service: str
+        :param service: the service the client makes requests to
+        :type methods: dict
+        :param methods: HTTP methods by the name of the client's method
+        making them. Each method must take the URL as its first argument.
+        """
+        for name, method in methods.items():
+            if hasattr(client, name):
+                setattr(client, name, self._timed(
+                    getattr(client, name), service, method))
+
+    def _timed(self, make_request, service, method):
+        def timed(url, *args, **kwargs):
+            with self.request(service, method, url):
+                return make_request(url, *args, **kwargs)
+        return timed
+
+    def request_count(self, service):
+        """
+        Get the number of requests made to a service so far.
+
+        :type service: str
+        :param service: the service e.g. 'Galaxy'
+        """
+        with self._lock:
+            return sum(stats[0] for (request_service, request_endpoint), stats
+                       in self.requests.items()
+                       if request_service == service)
+
+    def finish(self):
+        """Mark the import as finished"""
+        self.finished = time.time()
+
+    def to_dict(self):
+        """
+        Get the metrics as a JSON compatible dict.
+
+        :return: a dict of the import's wall time, the seconds spent in each
+        phase, and request statistics by service and endpoint
+        """
+        with self._lock:
+            requests = {}
+            for (service, request_endpoint), stats in sorted(
+                    self.requests.items()):
+                count, total, longest = stats
+                requests.setdefault(service, OrderedDict())[
+                    request_endpoint] = OrderedDict([
+                        ('count', count), ('total_seconds', total),
+                        ('mean_seconds', total / count),
+                        ('max_seconds', longest)])
+            return OrderedDict([
+                ('started', self.started),
+                ('wall_seconds',
+                 (self.finished or time.time()) - self.started),
+                ('phases', OrderedDict(self.phases)),
+                ('requests', requests)])
+
+    def write(self, path):
+        """
+        Write the metrics to a JSON file.
+
+        :type path: str
+        :param path: the path of the file
+        """
+        with open(path, 'w') as metrics_file:
+            json.dump(self.to_dict(), metrics_file, indent=2)
+
+    def summary_lines(self):
+        """
+        Describe where the import's time went.
+
+        :return: a list of lines to print
+        """
+        metrics = self.to_dict()
+        lines = ['Time taken: {0:.1f}s'.format(metrics['wall_seconds'])]
+        for name, seconds in metrics['phases'].items():
+            lines.append('    {0}: {1:.1f}s'.format(name, seconds))
+        for service, endpoints in sorted(metrics['requests'].items()):
+            lines.append('Requests to {0}: {1}'.format(
+                service, sum(stats['count'] for stats in endpoints.values())))
+            for request_endpoint, stats in endpoints.items():
+                lines.append(
+                    '    {0}: {1} (mean {2:.0f} ms, max {3:.0f} ms)'.format(
+                        request_endpoint, stats['count'],
+                        stats['mean_seconds'] * 1000,
+                        stats['max_seconds'] * 1000))
+        return lines
@@ -0,0 +1,311 @@
+import logging
+import threading
+import time
+import Queue
+
+
+class StreamingImport:
+
+    """
+    Imports samples into a Galaxy library as they are resolved from IRIDA.
+
+    Samples flow through three stages that run at the same time: resolving
+    samples from IRIDA, linking their files in the library, and verifying
+    the linked files. The linking stage takes everything resolved so far as
+    one batch, so a sample is linked as soon as it is resolved, while later
+    samples are still being requested from IRIDA. The verification stage
+    takes the files linked so far at the start of each of its rounds, so a
+    file that Galaxy is slow to process doesn't hold back later files.
+    """
+
+    def __init__(self, importer, logger=None, history=None):
+        """
+        Create a streaming import.
+
+        :type importer: IridaImport
+        :param importer: the configured importer, with its library set up
+        :type logger: logging.Logger
+        :param logger: the logger to write to
+        :type history: IncrementalHistory
+        :param history: the history to add each sample to once its files
+        are verified, if any
+        """
+        self.importer = importer
+        self.logger = logger or logging.getLogger('irida_import')
+        self.history = history
+
+    def run(self, samples_dict, resolved=None):
+        """
+        Resolve, link and verify every sample.
+
+        Each sample is recorded in the importer's journal as it is resolved.
+
+        :type samples_dict: dict
+        :param samples_dict: the samples dictionary Galaxy passes the tool
+        :type resolved: list
+        :param resolved: the Samples at the start of samples_dict that were
+        resolved by an earlier run of the import, which are not resolved
+        again
+        :return: a tuple of the list of Samples in the order of
+        samples_dict, the number of files added and a list of the sample
+        files that could not be verified. If any stage fails, its exception
+        is raised once the other stages have stopped.
+        """
+        ready = Queue.Queue()
+        linked = Queue.Queue()
+        state = _PipelineState()
+
+        resolver = threading.Thread(
+            target=self._resolve,
+            args=(samples_dict, resolved or [], ready, state))
+        linker = threading.Thread(
+            target=self._link, args=(ready, linked, state))
+        for thread in (resolver, linker):
+            thread.daemon = True
+            thread.start()
+
+        def incoming(wait):
+            if state.stopped:
+                return [], True
+            return _take(linked, wait)
+
+        failed = []
+        try:
+            failed = self.importer.verify_sample_files([], incoming)
+        except Exception as e:
+            state.fail(e)
+
+        resolver.join()
+        linker.join()
+        state.raise_error()
+
+        return state.samples, state.num_files, failed
+
+    def _resolve(self, samples_dict, resolved, ready, state):
+        """Resolve samples from IRIDA, and queue each one to be linked"""
+        try:
+            for sample in resolved:
+                state.samples.append(sample)
+                ready.put(sample)
+            for sample in self.importer.iter_samples(
+                    samples_dict[len(resolved):]):
+                if state.stopped:
+                    break
+                if len(state.samples) == len(resolved):
+                    self.logger.debug(time.strftime("[%D %H:%M:%S]:") +
+                                      ' First sample resolved')
+                self.importer.journal.add_samples([sample])
+                state.samples.append(sample)
+                ready.put(sample)
+        except Exception as e:
+            state.fail(e)
+        finally:
+            ready.put(_DONE)
+
+    def _link(self, ready, linked, state):
+        """Link the files of resolved samples, and queue them to be verified"""
+        try:
+            for samples in _batches(ready):
+                if state.stopped:
+                    continue
+                self.logger.debug(time.strftime("[%D %H:%M:%S]:") +
+                                  ' Linking %d sample(s)' % len(samples))
+                state.num_files += self.importer.add_samples_if_nec(samples)
+                if self.history is not None:
+                    self.history.add_samples(samples)
+                for sample_file in self.importer.get_sample_files(samples):
+                    linked.put(sample_file)
+        except Exception as e:
+            state.fail(e)
+        finally:
+            linked.put(_DONE)
+
+
+class IncrementalHistory:
+
+    """
+    Adds samples' datasets to a history while the rest of the import goes
+    on.
+
+    A sample is ready as soon as every one of its files is verified, so one
+    slow file only holds back its own sample. A thread takes every sample
+    ready so far as one batch and adds its datasets to the history. The
+    collections are made once the import is done, in the order of the
+    samples, with the datasets of any sample that never became ready.
+    """
+
+    def __init__(self, importer, hist_id, logger=None):
+        """
+        Create an incremental history.
+
+        :type importer: IridaImport
+        :param importer: the configured importer, connected to Galaxy
+        :type hist_id: str
+        :param hist_id: the id of the history to add datasets to
+        :type logger: logging.Logger
+        :param logger: the logger to write to
+        """
+        self.importer = importer
+        self.hist_id = hist_id
+        self.logger = logger or logging.getLogger('irida_import')
+        self.samples = []
+        # The ids in the history of the datasets added so far, by library
+        # dataset id
+        self.added = {}
+        self._unverified = {}  # id(sample) -> number of unverified files
+        self._samples_by_file = {}  # id(sample file) -> sample
+        self._ready = Queue.Queue()
+        self._state = _PipelineState()
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._add)
+        self._thread.daemon = True
+
+    def start(self):
+        """Start adding ready samples to the history"""
+        self._thread.start()
+        return self
+
+    def add_samples(self, samples):
+        """
+        Wait for the files of samples to be verified. This must be called
+        before any of their files are verified. A sample whose files are
+        all verified already is ready at once.
+
+        :type samples: list
+        :param samples: the Samples to add to the history
+        """
+        ready = []
+        with self._lock:
+            for sample in samples:
+                self.samples.append(sample)
+                unverified = [
+                    sample_file for sample_file
+                    in self.importer.get_sample_files([sample])
+                    if not sample_file.verified]
+                self._unverified[id(sample)] = len(unverified)
+                for sample_file in unverified:
+                    self._samples_by_file[id(sample_file)] = sample
+                if not unverified:
+                    ready.append(sample)
+        for sample in ready:
+            self._ready.put(sample)
+
+    def file_verified(self, sample_file):
+        """
+        Count a sample file as verified, and make its sample ready if it
+        was the sample's last unverified file.
+
+        :type sample_file: SampleFile
+        :param sample_file: the verified sample file
+        """
+        with self._lock:
+            sample = self._samples_by_file.pop(id(sample_file), None)
+            if sample is None:
+                return
+            self._unverified[id(sample)] -= 1
+            if self._unverified[id(sample)]:
+                return
+        self._ready.put(sample)
+
+    def stop(self):
+        """Wait for the samples that are ready to be added"""
+        if self._thread.is_alive():
+            self._ready.put(_DONE)
+            self._thread.join()
+
+    def finish(self, make_paired_collection=True):
+        """
+        Wait for the samples that are ready, then add the rest of the
+        samples and make the collections.
+
+        :type make_paired_collection: bool
+        :param make_paired_collection: whether to put paired reads in a
+        collection
+        :return: the collection array, see
+        IridaImport.add_samples_to_history. If adding a ready sample failed,
+        its exception is raised.
+        """
+        self.stop()
+        self._state.raise_error()
+        return self.importer.add_samples_to_history(
+            self.samples, self.hist_id,
+            make_paired_collection=make_paired_collection, added=self.added)
+
+    def _add(self):
+        """Add the datasets of ready samples to the history"""
+        try:
+            for samples in _batches(self._ready):
+                if self._state.stopped:
+                    continue
+                self.logger.debug(time.strftime("[%D %H:%M:%S]:") +
+                                  ' Adding %d sample(s) to the history'
+                                  % len(samples))
+                dataset_ids = [
+                    sample_file.library_dataset_id for sample_file
+                    in self.importer.get_sample_files(samples)]
+                history_ids = self.importer.add_datasets_to_history(
+                    self.hist_id, dataset_ids)
+                self.added.update(zip(dataset_ids, history_ids))
+        except Exception as e:
+            self._state.fail(e)
+
+
+# Marks the end of a stage's output
+_DONE = object()
+
+
+def _batches(queue):
+    """
+    Yield lists of everything in a queue, waiting for at least one item
+    each time, until the end of the queue's stage is reached.
+    """
+    done = False
+    while not done:
+        batch, done = _take(queue, True)
+        if batch:
+            yield batch
+
+
+def _take(queue, wait):
+    """
+    Take everything in a queue.
+
+    :type wait: bool
+    :param wait: whether to wait for at least one item
+    :return: a tuple of a list of the items, and whether the end of the
+    queue's stage was reached
+    """
+    items = [queue.get()] if wait else []
+    while True:
+        try:
+            items.append(queue.get_nowait())
+        except Queue.Empty:
+            break
+
+    for index, item in enumerate(items):
+        if item is _DONE:
+            return items[:index], True
+    return items, False
+
+
+class _PipelineState:
+
+    """What the stages of a streaming import have done so far"""
+
+    def __init__(self):
+        self.samples = []
+        self.num_files = 0
+        self.error = None
+        self.stopped = False
+        self.lock = threading.Lock()
+
+    def fail(self, error):
+        """Stop every stage, keeping the first error"""
+        with self.lock:
+            if self.error is None:
+                self.error = error
+            self.stopped = True
+
+    def raise_error(self):
+        if self.error is not None:
+            raise self.error
@@ -0,0 +1,72 @@
+from collections import OrderedDict
+
+
+class ImportPlan:
+
+    """
+    What an import would do, and how many requests it would make, found
+    without changing the library or the history.
+    """
+
+    def __init__(self, library_name):
+        """
+        Create an empty import plan.
+
+        :type library_name: str
+        :param library_name: the name of the library imported to
+        """
+        self.library_name = library_name
+        self.library_exists = True
+        self.folders_to_create = []
+        self.files_to_link = []  # Galaxy paths
+        self.files_to_skip = []  # Galaxy paths
+        self.missing_files = []  # local paths
+        self.add_to_history = True
+        self.history_datasets = 0
+        self.hidden_datasets = 0
+        self.history_collections = 0
+        self.irida_requests = 0
+        # Request counts by what they are made for
+        self.galaxy_requests = OrderedDict()
+
+    def galaxy_request_count(self):
+        """Get the number of requests the import would make to Galaxy"""
+        return sum(self.galaxy_requests.values())
+
+    def lines(self):
+        """
+        Describe the plan.
+
+        :return: a list of lines to print
+        """
+        lines = ['Import plan:']
+        if self.library_exists:
+            lines.append("Library '{0}' exists".format(self.library_name))
+        else:
+            lines.append("Library '{0}' will be created"
+                         .format(self.library_name))
+
+        for message, paths in (
+                ('Folders to create', self.folders_to_create),
+                ('Files to link', self.files_to_link),
+                ('Files to skip because they are already in the library',
+                 self.files_to_skip),
+                ('Local files that could not be found', self.missing_files)):
+            lines.append('{0} ({1}):'.format(message, len(paths)))
+            lines.extend('    ' + path for path in paths)
+
+        if self.add_to_history:
+            lines.append('History: {0} dataset(s) to add, {1} to hide, and '
+                         '{2} collection(s) to create'.format(
+                             self.history_datasets, self.hidden_datasets,
+                             self.history_collections))
+        else:
+            lines.append('History: samples will not be added')
+
+        lines.append('Requests to IRIDA: {0}'.format(self.irida_requests))
+        lines.append('Requests to Galaxy: at least {0}'.format(
+            self.galaxy_request_count()))
+        for purpose, count in self.galaxy_requests.items():
+            lines.append('    {0}: {1}'.format(purpose, count))
+        return lines
+
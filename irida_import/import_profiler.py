@@ -0,0 +1,169 @@
+import cProfile
+import gc
+import json
+import resource
+import sys
+import threading
+import time
+
+from collections import Counter
+
+
+class ImportProfiler:
+
+    """
+    Profiles a function, such as IridaImport.import_to_galaxy, and writes
+    what it found to a file.
+
+    In 'deterministic' mode every call made by the calling thread is timed
+    with cProfile, and the stats are written for pstats to read. In
+    'sampling' mode the stacks of every thread are sampled at a fixed
+    interval, and written in the collapsed format read by flame graph tools:
+    one line per distinct stack, with the number of times it was sampled.
+
+    Memory snapshots can be taken as well. Each is a census of the live
+    objects tracked by the garbage collector, counted and sized by type.
+    """
+
+    MODES = ('deterministic', 'sampling')
+    # The number of types listed in each memory snapshot
+    SNAPSHOT_TYPES = 50
+
+    def __init__(self, path, mode='deterministic', interval=0.01,
+                 memory=False, memory_interval=10):
+        """
+        Create a profiler.
+
+        :type path: str
+        :param path: the file to write the profile to. Memory snapshots are
+        written to the same path with '.memory.json' added.
+        :type mode: str
+        :param mode: 'deterministic' or 'sampling'
+        :type interval: float
+        :param interval: seconds between stack samples, in 'sampling' mode
+        :type memory: bool
+        :param memory: whether to take memory snapshots
+        :type memory_interval: float
+        :param memory_interval: seconds between memory snapshots. One is
+        also taken when the function starts and when it returns.
+        """
+        if mode not in self.MODES:
+            raise ValueError('Unknown profiling mode: ' + mode)
+        self.path = path
+        self.mode = mode
+        self.interval = interval
+        self.memory = memory
+        self.memory_interval = memory_interval
+        self.stacks = Counter()
+        self.snapshots = []
+        self._stopped = threading.Event()
+
+    def profiled(self, function):
+        """
+        Wrap a function so that it is profiled each time it is called.
+
+        :type function: function
+        :param function: the function to profile
+        :return: a function taking the same arguments. The profile is
+        written whether the function returns or raises.
+        """
+        def profiled(*args, **kwargs):
+            return self.run(function, *args, **kwargs)
+        return profiled
+
+    def run(self, function, *args, **kwargs):
+        """
+        Call a function, profiling it.
+
+        :type function: function
+        :param function: the function to profile
+        :return: what the function returns
+        """
+        self.stacks.clear()
+        self.snapshots = []
+        self._stopped.clear()
+        threads = []
+        if self.mode == 'sampling':
+            threads.append(threading.Thread(target=self._sample))
+        if self.memory:
+            self.snapshots.append(self._snapshot())
+            threads.append(threading.Thread(target=self._take_snapshots))
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+
+        profile = cProfile.Profile() if self.mode == 'deterministic' else None
+        try:
+            if profile is not None:
+                return profile.runcall(function, *args, **kwargs)
+            return function(*args, **kwargs)
+        finally:
+            self._stopped.set()
+            for thread in threads:
+                thread.join()
+            if profile is not None:
+                profile.dump_stats(self.path)
+            else:
+                self.write_stacks(self.path)
+            if self.memory:
+                self.snapshots.append(self._snapshot())
+                self.write_snapshots(self.path + '.memory.json')
+
+    def write_stacks(self, path):
+        """Write the sampled stacks in the collapsed format"""
+        with open(path, 'w') as stacks_file:
+            for stack, count in sorted(self.stacks.items()):
+                stacks_file.write('{0} {1}\n'.format(stack, count))
+
+    def write_snapshots(self, path):
+        """Write the memory snapshots as JSON"""
+        with open(path, 'w') as snapshots_file:
+            json.dump(self.snapshots, snapshots_file, indent=2)
+
+    def _sample(self):
+        """Sample the stack of every other thread until stopped"""
+        own_id = threading.current_thread().ident
+        while not self._stopped.wait(self.interval):
+            names = dict((thread.ident, thread.name)
+                         for thread in threading.enumerate())
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id != own_id:
+                    self.stacks[_collapse(names.get(thread_id, thread_id),
+                                          frame)] += 1
+
+    def _take_snapshots(self):
+        """Take memory snapshots until stopped"""
+        while not self._stopped.wait(self.memory_interval):
+            self.snapshots.append(self._snapshot())
+
+    def _snapshot(self):
+        """
+        Count and size the live objects tracked by the garbage collector.
+
+        Objects that are not tracked, such as strings and numbers, are only
+        counted in the process' peak resident size.
+        """
+        counts = Counter()
+        sizes = Counter()
+        for obj in gc.get_objects():
+            type_name = type(obj).__name__
+            counts[type_name] += 1
+            sizes[type_name] += sys.getsizeof(obj, 0)
+        return {
+            'time': time.time(),
+            'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            'objects': sum(counts.values()),
+            'types': [[type_name, counts[type_name], size] for type_name, size
+                      in sizes.most_common(self.SNAPSHOT_TYPES)]}
+
+
+def _collapse(thread_name, frame):
+    """Get a stack as one line, from the thread down to the frame"""
+    calls = []
+    while frame is not None:
+        code = frame.f_code
+        calls.append('{0}:{1}:{2}'.format(code.co_filename, code.co_name,
+                                          frame.f_lineno))
+        frame = frame.f_back
+    calls.append(str(thread_name))
+    return ';'.join(reversed(calls))
@@ -0,0 +1,184 @@
+import logging
+import threading
+
+from multiprocessing.pool import ThreadPool
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class PipelinedIridaClient:
+
+    """
+    Resolves samples from the IRIDA REST API without waiting for each level
+    of the sample -> sequenceFiles -> pairs/unpaired resource tree to finish.
+
+    A sample's pairs and unpaired resources are requested as soon as its
+    sample resource arrives, while other samples are still being requested.
+    Requests are made by a pool of workers on a plain requests session that
+    carries the OAuth2 access token already obtained from IRIDA.
+    """
+
+    def __init__(self, token, max_concurrent_requests=1, logger=None):
+        """
+        Create a pipelined IRIDA client.
+
+        :type token: dict
+        :param token: an OAuth2 token containing an 'access_token'
+        :type max_concurrent_requests: int
+        :param max_concurrent_requests: the maximum number of requests made
+        to IRIDA at the same time
+        :type logger: logging.Logger
+        :param logger: the logger to write to
+        """
+        self.max_concurrent_requests = max(1, max_concurrent_requests)
+        self.logger = logger or logging.getLogger('irida_import')
+
+        self.session = requests.Session()
+        self.session.headers['Authorization'] = (
+            'Bearer ' + token['access_token'])
+        self.session.headers['Accept'] = 'application/json'
+        adapter = HTTPAdapter(pool_maxsize=self.max_concurrent_requests)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def get_resource(self, request_url):
+        """
+        Requests a json object from IRIDA REST API.
+
+        :type request_url: str
+        :param request_url: a url to make a get request to
+        :return: the 'resource' of the response
+        """
+        response = self.session.get(request_url)
+
+        # Raise an exception if we get 4XX or 5XX server response
+        response.raise_for_status()
+
+        return response.json()['resource']
+
+    def resolve_samples(self, sample_requests, make_sample, add_sample_reads):
+        """
+        Resolve every sample and its reads.
+
+        :type sample_requests: list
+        :param sample_requests: tuples of a sample's name and the URL of its
+        IRIDA resource
+        :type make_sample: function
+        :param make_sample: called with a sample name and sample resource,
+        returns a Sample
+        :type add_sample_reads: function
+        :param add_sample_reads: called with a Sample, its pairs resource and
+        its unpaired resource
+        :return: a list of Samples in the same order as sample_requests. If
+        any request fails, the requests of later samples are skipped, but
+        earlier samples are still resolved, and the exception of the first
+        failed sample in sample_requests is raised.
+        """
+        if not sample_requests:
+            return []
+
+        resolution = _Resolution(len(sample_requests))
+        pool = ThreadPool(self.max_concurrent_requests)
+
+        def request(url, on_resource, index):
+            """Request a resource without blocking the caller"""
+            if resolution.skips(index):
+                resolution.finish(index)
+                return
+
+            def callback(result):
+                error, resource = result
+                if error is not None:
+                    resolution.fail(index, error)
+                    return
+                try:
+                    on_resource(resource)
+                except Exception as e:
+                    resolution.fail(index, e)
+
+            pool.apply_async(self._get_resource_safely, (url,),
+                             callback=callback)
+
+        def on_sample(index, sample_name, sample_resource):
+            """Start requesting the reads of a newly resolved sample"""
+            sample = make_sample(sample_name, sample_resource)
+            read_resources = {}
+            lock = threading.Lock()
+
+            def on_reads(kind, resource):
+                with lock:
+                    read_resources[kind] = resource
+                    complete = len(read_resources) == 2
+                if complete:
+                    add_sample_reads(sample, read_resources.pop('paired'),
+                                     read_resources.pop('unpaired'))
+                    resolution.finish(index, sample)
+
+            request(sample.paired_path,
+                    lambda resource: on_reads('paired', resource), index)
+            request(sample.unpaired_path,
+                    lambda resource: on_reads('unpaired', resource), index)
+
+        try:
+            for index, (sample_name, sample_path) in enumerate(
+                    sample_requests):
+                request(sample_path,
+                        lambda resource, index=index, sample_name=sample_name:
+                        on_sample(index, sample_name, resource),
+                        index)
+            return resolution.wait()
+        finally:
+            pool.terminate()
+
+    def _get_resource_safely(self, request_url):
+        """Request a resource, returning an error instead of raising it"""
+        try:
+            return None, self.get_resource(request_url)
+        except Exception as e:
+            self.logger.debug('Request to IRIDA failed: ' + request_url)
+            return e, None
+
+
+class _Resolution:
+
+    """
+    Tracks which samples of a pipelined resolution are complete.
+
+    Once a sample fails, the samples after it are skipped, as they can't
+    change which failure is raised.
+    """
+
+    def __init__(self, num_samples):
+        self.samples = [None] * num_samples
+        self.errors = {}
+        self.remaining = set(range(num_samples))
+        self.lock = threading.Lock()
+        self.done = threading.Event()
+
+    def finish(self, index, sample=None):
+        with self.lock:
+            if sample is not None:
+                self.samples[index] = sample
+            self.remaining.discard(index)
+            if not self.remaining:
+                self.done.set()
+
+    def fail(self, index, error):
+        with self.lock:
+            self.errors.setdefault(index, error)
+        self.finish(index)
+
+    def skips(self, index):
+        """Whether a sample comes after a failed one"""
+        with self.lock:
+            return bool(self.errors) and min(self.errors) < index
+
+    def wait(self):
+        # Wait in short intervals so the wait can be interrupted
+        while not self.done.wait(1):
+            pass
+
+        if self.errors:
+            raise self.errors[min(self.errors)]
+        return self.samples
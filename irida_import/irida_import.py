@@ -7,18 +7,31 @@ import os.path
 import pprint
 import re
 import shutil
+import stat
 import sys
 import time
 
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
 from xml.etree import ElementTree
 
-from bioblend import galaxy
+from bioblend import ConnectionError, galaxy
 from bioblend.galaxy.objects import GalaxyInstance
 from requests_oauthlib import OAuth2Session
 
+from import_journal import ImportJournal, journal_key
+from import_metrics import ImportMetrics
+from import_pipeline import IncrementalHistory, StreamingImport
+from import_plan import ImportPlan
+from import_profiler import ImportProfiler
+from irida_client import PipelinedIridaClient
+from library_cache import LibraryStateCache
+from library_index import LibraryIndex
 from sample import Sample
 from sample_file import SampleFile
 from sample_pair import SamplePair
+from verification import VerificationScheduler
+from wait_policy import BackoffWaitPolicy, FixedWaitPolicy
 
 # FOR DEVELOPMENT ONLY!!
 # This value only exists for this process and processes that fork from it
@@ -39,24 +52,118 @@ class IridaImport:
     CONFIG_FILE = 'config.ini'
     XML_FILE_SAMPLE = 'irida_import.xml.sample'
     XML_FILE = 'irida_import.xml'
-    folds = {}
+    # The most sample files of a directory statted by one worker
+    STAT_GROUP_SIZE = 100
+    # The first Galaxy release that can hide a collection's datasets as the
+    # collection is created
+    HIDE_SOURCE_ITEMS_VERSION = (15, 5)
+    # Library states are shared by every import in this process
+    library_cache = LibraryStateCache()
 
     def __init__(self):
         self.logger = logging.getLogger('irida_import')
+        self.pp = pprint.PrettyPrinter(indent=4)
+        self.metrics = ImportMetrics()
+        # Whether Galaxy can hide datasets as it makes a collection, found
+        # when it is first needed
+        self.hides_source_items = None
+        # The datasets each history has copied from library datasets, by
+        # LDDA id, listed once per import
+        self.history_copies = {}
+        # Adds samples to the history as their files are verified, if the
+        # import does so, see IncrementalHistory
+        self.incremental_history = None
+        # The library key and state used by the current import
+        self.current_library_state = None
+        # What happened to each file, for the summary. Set here too so that
+        # an import that fails before it starts can still be summarised
+        self.uploaded_files_log = []
+        self.skipped_files_log = []
+        self.retried_files_log = OrderedDict()
+        self.failed_files_log = []
+        self.resumed_files_log = []
+
+    def library_state(self):
+        """
+        Get the known state of the current library.
+
+        The state is taken from the library cache the first time it is
+        needed, and kept until the import ends, so that it can't expire
+        partway through an import.
+
+        :rtype: LibraryIndex
+        :return: the library's index, which is empty and not loaded if the
+        library has not been read recently
+        """
+        key = (self.GALAXY_URL, self.library.id)
+        if (self.current_library_state is None or
+                self.current_library_state[0] != key):
+            self.current_library_state = (
+                key, self.library_cache.get_or_create(key, LibraryIndex))
+        return self.current_library_state[1]
+
+    def invalidate_library_state(self):
+        """
+        Discard the known state of the current library, so that it is read
+        from Galaxy again when next needed.
+        """
+        self.library_cache.invalidate((self.GALAXY_URL, self.library.id))
+        self.current_library_state = None
 
     def initial_lib_state(self):
 
-        if not self.folds:
+        lib_state = self.library_state()
+        if not lib_state.loaded and not self.LAZY_LIBRARY_LOADING:
             library_info = self.reg_gi.libraries.show_library(self.library.id,contents=True)
-            for lib_item in library_info:
-                name = lib_item['name']
-                self.folds[name]={}
-                self.folds[name]['id']=lib_item['id']
-                self.folds[name]['type']=lib_item['type']
-                self.folds[name]['name']=name
+            lib_state.load(library_info)
 
         return True
 
+    def load_lib_folder(self, folder_path):
+        """
+        Make sure the contents of a library folder are known, by listing the
+        folder and, if necessary, the folders above it.
+
+        :type folder_path: str
+        :param folder_path: The folder's path e.g. '/bobfolder/bobfolder2',
+        or '' for the library's root folder
+        """
+        lib_state = self.library_state()
+        if lib_state.folder_loaded(folder_path):
+            return
+
+        if folder_path == '':
+            if lib_state.root_folder_id is None:
+                lib_state.root_folder_id = self.reg_gi.libraries.show_library(
+                    self.library.id)['root_folder_id']
+            folder_id = lib_state.root_folder_id
+        else:
+            self.load_lib_folder(folder_path.rsplit("/", 1)[0])
+            folder_ids = lib_state.ids('folder', folder_path)
+            # to ensure consistent results, always pick first entry
+            folder_id = folder_ids[0] if folder_ids else None
+
+        if folder_id is None:
+            # The folder doesn't exist, so it has no contents
+            lib_state.load_folder(folder_path, [])
+        else:
+            self.list_lib_folder(folder_path, folder_id)
+
+    def list_lib_folder(self, folder_path, folder_id):
+        """
+        Add the contents of a library folder, including the size and state
+        of its datasets, to the library's state.
+
+        :type folder_path: str
+        :param folder_path: The folder's path e.g. '/bobfolder/bobfolder2'
+        :type folder_id: str
+        :param folder_id: The folder's id
+        """
+        self.logger.debug('Listing library folder: \'%s\'' % folder_path)
+        contents = self.reg_gi.folders.show_folder(folder_id, contents=True)
+        self.library_state().load_folder(folder_path,
+                                         contents['folder_contents'])
+
 
     def get_samples(self, samples_dict):
         """
@@ -70,32 +177,131 @@ class IridaImport:
         """
         samples = self.get_sample_meta(samples_dict)
 
-        for sample in samples:
+        # Each sample's reads are made as soon as its pairs and unpaired
+        # resources arrive, so only the resources of the samples being
+        # requested are held at once
+        self._map_concurrently(self.get_sample_reads,
+                               [(sample,) for sample in samples],
+                               self.IRIDA_MAX_CONCURRENT_REQUESTS)
+        return samples
 
-            # Add a tuple of sample_file objects for each pair
-            paired_resource = self.make_irida_request(sample.paired_path)
-            for pair in paired_resource['resources']:
-                pair_name = str(pair['identifier'])
-                for link in pair['links']:
-                    temp_link = dict()
-                    temp_link['rel'] = "self"
-                    temp_link["href"] = link['href']
-
-                    for curr_file in pair['files']:
-                        if temp_link in curr_file['links']:
-                            if link['rel'] == "pair/forward":
-                                forward = self.get_sample_file(curr_file)
-                            elif link['rel'] == "pair/reverse":
-                                reverse = self.get_sample_file(curr_file)
-
-                sample.add_pair(SamplePair(pair_name, forward, reverse))
-
-            # Add a sample_file object for each single end read
-            unpaired_resource = self.make_irida_request(sample.unpaired_path)
-            for single in unpaired_resource['resources']:
-                sample.add_file(self.get_sample_file(single['sequenceFile']))
+    def get_samples_pipelined(self, samples_dict):
+        """
+        Gets sample objects from a dictionary, using the pipelined IRIDA
+        client instead of the OAuth2 session.
 
-        return samples
+        :type samples_dict: dict
+        :param samples_dict: a dictionary to parse, as for get_samples
+        :return: a list of Samples with all necessary information
+        """
+        client = PipelinedIridaClient(self.irida.token,
+                                      self.IRIDA_MAX_CONCURRENT_REQUESTS,
+                                      self.logger)
+        self.metrics.watch(client, 'IRIDA', {'get_resource': 'GET'})
+        sample_requests = [self.get_sample_request(sample_input)
+                           for sample_input in samples_dict]
+
+        return client.resolve_samples(sample_requests, self.make_sample,
+                                      self.add_sample_reads)
+
+    def iter_samples(self, samples_dict):
+        """
+        Gets sample objects from a dictionary one at a time, as soon as each
+        sample is resolved.
+
+        Up to IRIDA_MAX_CONCURRENT_REQUESTS samples are resolved at once.
+
+        :type samples_dict: dict
+        :param samples_dict: a dictionary to parse, as for get_samples
+        :return: a generator of Samples in the order of samples_dict. If a
+        sample can't be resolved, its exception is raised when it is reached.
+        """
+        sample_requests = [self.get_sample_request(sample_input)
+                           for sample_input in samples_dict]
+        workers = min(self.IRIDA_MAX_CONCURRENT_REQUESTS,
+                      len(sample_requests))
+        if workers <= 1:
+            for sample_request in sample_requests:
+                yield self.resolve_sample(sample_request)
+            return
+
+        pool = ThreadPool(workers)
+        try:
+            for sample in pool.imap(self.resolve_sample, sample_requests):
+                yield sample
+        finally:
+            pool.terminate()
+
+    def resolve_sample(self, sample_request):
+        """
+        Gets a sample object and its reads from IRIDA.
+
+        :type sample_request: tuple
+        :param sample_request: the sample's name and the URL of its IRIDA
+        resource, see get_sample_request
+        :return: a Sample with all necessary information
+        """
+        sample_name, sample_path = sample_request
+        sample = self.make_sample(sample_name,
+                                  self.make_irida_request(sample_path))
+        self.get_sample_reads(sample)
+        return sample
+
+    def get_sample_reads(self, sample):
+        """
+        Gets a sample's pairs and unpaired resources from IRIDA, and adds
+        its reads.
+
+        :type sample: Sample
+        :param sample: a sample with its paired and unpaired paths
+        """
+        self.add_sample_reads(sample,
+                              self.make_irida_request(sample.paired_path),
+                              self.make_irida_request(sample.unpaired_path))
+
+    def add_sample_reads(self, sample, paired_resource, unpaired_resource):
+        """
+        Adds a sample's pairs and single end reads to it.
+
+        :type sample: Sample
+        :param sample: the sample to add the reads to
+        :type paired_resource: dict
+        :param paired_resource: the sample's pairs resource from IRIDA
+        :type unpaired_resource: dict
+        :param unpaired_resource: the sample's unpaired resource from IRIDA
+        """
+        # Index the files of every pair by their self links once, so each
+        # pair's forward and reverse links are resolved by a single lookup
+        files_by_href = {}
+        for pair in paired_resource['resources']:
+            for curr_file in pair['files']:
+                for file_link in curr_file['links']:
+                    if file_link['rel'] == "self":
+                        files_by_href[file_link['href']] = curr_file
+
+        # Add a tuple of sample_file objects for each pair
+        for pair in paired_resource['resources']:
+            pair_name = str(pair['identifier'])
+
+            mates = {}
+            for link in pair['links']:
+                if link['rel'] in ("pair/forward", "pair/reverse"):
+                    mates[link['rel']] = files_by_href.get(link['href'])
+
+            for rel in ("pair/forward", "pair/reverse"):
+                if mates.get(rel) is None:
+                    error = ("The {0} file of pair '{1}' of sample '{2}' "
+                             "could not be found").format(
+                                 rel.split("/")[1], pair_name, sample.name)
+                    raise ValueError(error)
+
+            forward = self.get_sample_file(mates["pair/forward"])
+            reverse = self.get_sample_file(mates["pair/reverse"])
+            sample.add_pair(SamplePair(pair_name, forward, reverse))
+
+        # Add a sample_file object for each single end read
+        for single in unpaired_resource['resources']:
+            sample.add_file(self.get_sample_file(single['sequenceFile']))
 
     def make_irida_request(self, request_url):
         """
@@ -107,7 +313,8 @@ class IridaImport:
         :return: a list of either single output samples(string) or paired
         output samples(tuple)
         """
-        response = self.irida.get(request_url)
+        with self.metrics.request('IRIDA', 'GET', request_url):
+            response = self.irida.get(request_url)
 
         # Raise an exception if we get 4XX or 5XX server response
         response.raise_for_status()
@@ -118,6 +325,42 @@ class IridaImport:
 
         return resource
 
+    def fetch_irida_resources(self, request_urls):
+        """
+        Requests several json objects from IRIDA REST API.
+
+        At most IRIDA_MAX_CONCURRENT_REQUESTS requests are made at once.
+
+        :type request_urls: list
+        :param request_urls: the urls to make get requests to
+        :return: a list of resources in the same order as request_urls. If
+        any request fails, the exception of the first failed request in
+        request_urls is raised, as if the requests had been made one by one.
+        """
+        return self._map_concurrently(
+            self.make_irida_request, [(url,) for url in request_urls],
+            self.IRIDA_MAX_CONCURRENT_REQUESTS)
+
+    def _map_concurrently(self, function, args_list, max_workers):
+        """
+        Call a function with each tuple of arguments in args_list, at most
+        max_workers calls at once.
+
+        :return: a list of results in the same order as args_list. If any
+        call fails, the exception of the first failed call in args_list is
+        raised, as if the calls had been made one by one.
+        """
+        workers = min(max_workers, len(args_list))
+        if workers <= 1:
+            return [function(*args) for args in args_list]
+
+        pool = ThreadPool(workers)
+        try:
+            pending = [pool.apply_async(function, args) for args in args_list]
+            return [result.get() for result in pending]
+        finally:
+            pool.terminate()
+
     def get_sample_meta(self, samples_dict):
         """
         Gets Sample object meta information.
@@ -129,28 +372,54 @@ class IridaImport:
         :return: a list of Sample objects with it's name and paired/unpaired
         path
         """
+        sample_requests = [self.get_sample_request(sample_input)
+                           for sample_input in samples_dict]
+        sample_resources = self.fetch_irida_resources(
+            [sample_path for sample_name, sample_path in sample_requests])
+
         samples = []
+        for index, (sample_name, sample_path) in enumerate(sample_requests):
+            samples.append(self.make_sample(sample_name,
+                                            sample_resources[index]))
+            sample_resources[index] = None
+        return samples
+
+    def get_sample_request(self, sample_input):
+        """
+        Gets the name of a sample and the URL of its IRIDA resource.
 
-        for sample_input in samples_dict:
-            sample_dir_paths = sample_input['_embedded']['sample_files']
-            sample_name = sample_input['name']
+        :type sample_input: dict
+        :param sample_input: one sample of the samples dictionary
+        :return: a tuple of the sample's name and resource URL
+        """
+        sample_dir_paths = sample_input['_embedded']['sample_files']
 
-            for sample_file_path in sample_dir_paths:
-                sample_path = sample_file_path['_links']['self']['href']
+        for sample_file_path in sample_dir_paths:
+            sample_path = sample_file_path['_links']['self']['href']
 
-            sample_resource = self.make_irida_request(sample_path)
-            paths = sample_resource['links']
-            paired_path = ""
-            unpaired_path = ""
+        return sample_input['name'], sample_path
 
-            for link in paths:
-                if link['rel'] == "sample/sequenceFiles/pairs":
-                    paired_path = link['href']
-                elif link['rel'] == "sample/sequenceFiles/unpaired":
-                    unpaired_path = link['href']
+    def make_sample(self, sample_name, sample_resource):
+        """
+        Makes a Sample from its IRIDA resource.
 
-            samples.append(Sample(sample_name, paired_path, unpaired_path))
-        return samples
+        :type sample_name: str
+        :param sample_name: the name of the sample
+        :type sample_resource: dict
+        :param sample_resource: the sample's resource from IRIDA
+        :return: a Sample with its name and paired/unpaired path
+        """
+        paths = sample_resource['links']
+        paired_path = ""
+        unpaired_path = ""
+
+        for link in paths:
+            if link['rel'] == "sample/sequenceFiles/pairs":
+                paired_path = link['href']
+            elif link['rel'] == "sample/sequenceFiles/unpaired":
+                unpaired_path = link['href']
+
+        return Sample(sample_name, paired_path, unpaired_path)
 
     def get_sample_file(self, file_dict):
         """
@@ -182,10 +451,7 @@ class IridaImport:
         API key
 
         """
-        lib = None
-        libs = self.gi.libraries.list(name=desired_lib_name)
-        if len(libs) > 0:
-            lib = next(lib_i for lib_i in libs if lib_i.deleted is False)
+        lib = self.find_lib(desired_lib_name)
 
         if(lib is None):
             roles = self.reg_gi.roles.get_roles()
@@ -203,6 +469,20 @@ class IridaImport:
                 lib.id, access_in=[rid], modify_in=[rid], add_in=[rid])
         return lib
 
+    def find_lib(self, desired_lib_name):
+        """
+        Get a library that matches a given name, without creating it.
+
+        :type desired_lib_name: str
+        :param desired_lib_name: the desired library name
+        :return: the first library with the name that is not deleted, or
+        None if there is no library with the name
+        """
+        # Previews don't list the libraries' contents, which are only read
+        # as the library loading mode says
+        libs = self.gi.libraries.get_previews(name=desired_lib_name)
+        return next((lib for lib in libs if lib.deleted is False), None)
+
     def create_folder_if_nec(self, folder_path):
         """
         Add a folder to a library, if it does not already exist.
@@ -210,52 +490,108 @@ class IridaImport:
         :type folder_path: str
         :param folder_path: The folder's path e.g. '/bobfolder/bobfolder2'
         """
-        final_id=None
-        # Get the folder name from the path, e.g. 'bobfolder2' from
-        # '/bobfolder/bobfolder2'
-        folder_name = folder_path.rsplit("/", 1)[1]
-        # Get the base folder path from the path e.g '/bobfolder' from
-        # '/bobfolder/bobfolder2'
-        base_folder_path = folder_path.rsplit("/", 1)[0]
-        self.logger.debug(
-            'If neccessary, making a folder named \'%s\' on base folder path'
-            '\'%s\' from folder path \'%s\'' %
-            (folder_name, base_folder_path, folder_path))
+        return self.create_folders_if_nec([folder_path])[folder_path]
 
-        exist_id = self.exists_in_lib('folder', 'name', folder_path)
+    def plan_folders(self, samples):
+        """
+        Get the paths of every library folder that samples' files go in.
 
-        if not exist_id:
+        :type samples: list
+        :param samples: the list of samples to upload
+        :return: a list of unique folder paths, each sample's folder followed
+        by the folders of its pairs
+        """
+        folder_paths = OrderedDict()
+        for sample in samples:
+            sample_folder_path = self.ILLUMINA_PATH + '/' + sample.name
+            folder_paths[sample_folder_path] = True
+            for sample_item in sample.get_reads():
+                if isinstance(sample_item, SamplePair):
+                    pair_path = sample_folder_path + "/" + sample_item.name
+                    folder_paths[pair_path] = True
+        return list(folder_paths)
 
-            base_folder_id = self.exists_in_lib('folder', 'name', base_folder_path)
-            ans = []
-            name = ''
+    def create_folders_if_nec(self, folder_paths):
+        """
+        Add folders to a library, if they do not already exist.
 
-            if base_folder_id:
-                ans = self.reg_gi.libraries.create_folder(self.library.id,folder_name,base_folder_id=base_folder_id[0])
-                name = base_folder_path + "/" + ans[0]['name']
-            elif base_folder_path == '':
-                ans = self.reg_gi.libraries.create_folder(self.library.id,folder_name)
-                name = "/" + ans[0]['name']
-            else:
-                raise IOError('base_folder_path must include an existing base '
-                              + 'folder, or nothing')
-
-            #add to the current state of the library
-            self.folds[name]={}
-            self.folds[name]['id']=ans[0]['id']
-            self.folds[name]['type']='folder'
-            self.folds[name]['name']=name
-            final_id=ans[0]['id']
-
-            self.logger.debug(
-                'Made folder with path:' + '\'%s\'' % folder_path)
-        else:
-            #to ensure consistent results, always pick first entry
-            #we have no other way of knowing which one to use.
-            final_id=exist_id[0]
+        Folders are created parents first. Folders with the same depth are
+        created concurrently, at most GALAXY_MAX_CONCURRENT_REQUESTS at once.
+
+        :type folder_paths: list
+        :param folder_paths: The folders' paths e.g. ['/bobfolder/bobfolder2']
+        :return: a dict of folder ids by folder path
+        """
+        folder_ids = {}
+        by_depth = {}
+        for folder_path in folder_paths:
+            by_depth.setdefault(folder_path.count("/"), []).append(folder_path)
+
+        for depth in sorted(by_depth):
+            missing = []
+            for folder_path in by_depth[depth]:
+                exist_id = self.exists_in_lib('folder', 'name', folder_path)
+                if exist_id:
+                    #to ensure consistent results, always pick first entry
+                    #we have no other way of knowing which one to use.
+                    folder_ids[folder_path] = exist_id[0]
+                else:
+                    missing.append(folder_path)
+
+            to_create = []
+            for folder_path in missing:
+                # Get the folder name from the path, e.g. 'bobfolder2' from
+                # '/bobfolder/bobfolder2'
+                folder_name = folder_path.rsplit("/", 1)[1]
+                # Get the base folder path from the path e.g '/bobfolder' from
+                # '/bobfolder/bobfolder2'
+                base_folder_path = folder_path.rsplit("/", 1)[0]
+                self.logger.debug(
+                    'If neccessary, making a folder named \'%s\' on base '
+                    'folder path\'%s\' from folder path \'%s\'' %
+                    (folder_name, base_folder_path, folder_path))
+
+                if base_folder_path in folder_ids:
+                    base_folder_id = [folder_ids[base_folder_path]]
+                else:
+                    base_folder_id = self.exists_in_lib('folder', 'name',
+                                                        base_folder_path)
+
+                if base_folder_id:
+                    to_create.append((folder_name, base_folder_id[0]))
+                elif base_folder_path == '':
+                    to_create.append((folder_name, None))
+                else:
+                    raise IOError('base_folder_path must include an '
+                                  'existing base folder, or nothing')
+
+            created = self._map_concurrently(
+                self._create_folder, to_create,
+                self.GALAXY_MAX_CONCURRENT_REQUESTS)
+
+            lib_state = self.library_state()
+            for folder_path, ans in zip(missing, created):
+                name = folder_path.rsplit("/", 1)[0] + "/" + ans[0]['name']
+
+                #add to the current state of the library
+                lib_state.add({'id': ans[0]['id'], 'type': 'folder',
+                               'name': name})
+                # A new folder is empty, so there is nothing to list
+                lib_state.load_folder(name, [])
+                folder_ids[folder_path] = ans[0]['id']
 
+                self.logger.debug(
+                    'Made folder with path:' + '\'%s\'' % folder_path)
 
-        return final_id
+        return folder_ids
+
+    def _create_folder(self, folder_name, base_folder_id):
+        """Create a library folder in a base folder, or the root folder"""
+        if base_folder_id is None:
+            return self.reg_gi.libraries.create_folder(self.library.id,
+                                                       folder_name)
+        return self.reg_gi.libraries.create_folder(
+            self.library.id, folder_name, base_folder_id=base_folder_id)
 
     def exists_in_lib(self, item_type, item_attr_name, desired_attr_value):
         """
@@ -271,23 +607,25 @@ class IridaImport:
         :rtype: List of Ids or Empty list
         :return: Return item unique IDs or empty list if item(s) does not exist in the library
         """
-        ans = []
-
         # check cache before fetching from galaxy.
-        # current state of the library should only change between irida_import.py invocation
-        if not self.folds:
+        # known library states are discarded when they expire or are
+        # invalidated
+        lib_state = self.library_state()
+        if self.LAZY_LIBRARY_LOADING:
+            # only the folder that would contain the item needs to be known
+            if item_attr_name == 'name' and desired_attr_value:
+                self.load_lib_folder(desired_attr_value.rsplit("/", 1)[0])
+        elif not lib_state.loaded:
             self.initial_lib_state()
 
-        for item_name in self.folds:
-            if item_type == self.folds[item_name]['type']:
-                if desired_attr_value == self.folds[item_name][item_attr_name]:
-                    ans.append(self.folds[item_name]['id'])
-
-        return ans
-
+        if item_attr_name == 'name':
+            return lib_state.ids(item_type, desired_attr_value)
 
+        return [item['id'] for item in lib_state
+                if item['type'] == item_type and
+                item.get(item_attr_name) == desired_attr_value]
 
-    def existing_file(self, sample_file_path, galaxy_name):
+    def existing_file(self, sample_file_path, galaxy_name, size=None):
         """
         Find out dataset id for an existing file
 
@@ -296,6 +634,8 @@ class IridaImport:
         :type galaxy_name: str
         :param galaxy_name: the full path to the sample file as it
         exists in Galaxy
+        :type size: int
+        :param size: the local file's size, if it is already known
         :rtype: Boolean
         :return: Return file unique ID otherwise Boolean False
         """
@@ -303,88 +643,225 @@ class IridaImport:
             "Getting dataset ID for existing file: " +
             galaxy_name)
         found = False
-        size = os.path.getsize(sample_file_path)
-
-        # check cache before fetching from galaxy.
-        # current state of the library should only change between irida_import.py invocation
-        if not self.folds:
-            self.initial_lib_state()
+        if size is None:
+            size = os.path.getsize(sample_file_path)
 
         #found all datasets with the galaxy_name
         #first attempt will assume there is only one which is not right
         datasets = self.exists_in_lib('file', 'name', galaxy_name)
 
         if datasets:
-            for data_id in datasets:
-                item = self.reg_gi.libraries.show_dataset(self.library.id,data_id)
+            lib_state = self.library_state()
+            candidates = lib_state.get('file', galaxy_name)
+
+            # A full library listing doesn't include dataset sizes or states,
+            # so list the folder once for all of its datasets
+            folder_path = galaxy_name.rsplit("/", 1)[0]
+            if (folder_path not in lib_state.loaded_folders and
+                    any(self._missing_metadata(item) for item in candidates)):
+                folder_ids = lib_state.ids('folder', folder_path)
+                if folder_ids:
+                    self.list_lib_folder(folder_path, folder_ids[0])
+                    candidates = lib_state.get('file', galaxy_name)
+
+            for item in candidates:
+                if self._missing_metadata(item):
+                    item = self.reg_gi.libraries.show_dataset(
+                        self.library.id, item['id'])
+                    if item['state'] == 'ok':
+                        # Keep the size and LDDA id of a finished dataset
+                        lib_state.add(dict(item, type='file',
+                                           name=galaxy_name))
                 if item['file_size'] in (size, size + 1) and item['state'] == 'ok':
                     found = item['id']
                     break
 
         return found
 
-    def verify_sample_integrity(self, sample_file):
+    def stat_sample_file(self, sample_file):
         """
-        Checks to see if a sample was uploaded successfully
+        Find out if a sample file's local file exists, and keep its size and
+        modification time on the sample file. A sample file is only statted
+        once.
 
-        :type sample: SampleFile
-        :param samples: the sample to verify upload
-        :return: boolean indicating whether the sample was uploaded successfully
+        :type sample_file: SampleFile
+        :param sample_file: the sample file to stat
+        :return: True if the local file exists
         """
-        sample_integrity_verified = sample_file.verified
+        if sample_file.size is None:
+            try:
+                file_stat = os.stat(sample_file.path)
+            except OSError:
+                return False
+            if not stat.S_ISREG(file_stat.st_mode):
+                return False
+            sample_file.size = file_stat.st_size
+            sample_file.mtime = file_stat.st_mtime
+        return True
 
-        if not sample_integrity_verified:
-            self.logger.debug(time.strftime("[%D %H:%M:%S]:") +
-                              ' Verifying integrity of: ' +
-                              sample_file.name)
-            num_waits = 0
-            while num_waits <= self.MAX_WAITS:
-                state = sample_file.state(self.reg_gi, self.library.id)
-                if state == 'ok': # uploaded succesfully
-                    self.logger.debug(time.strftime("[%D %H:%M:%S]:") + ' OK! ')
-                    sample_integrity_verified = True
-                    sample_file.verified = True
-                    break
-                elif state in ['new', 'upload', 'queued', 'running', 'setting_metadata']: # pending
-                    self.logger.debug(time.strftime("[%D %H:%M:%S]:") + ' PENDING! (%s)' % (state))
-                    num_waits += 1
-                    time.sleep(5)
-                else:
-                    self.logger.debug(time.strftime("[%D %H:%M:%S]:") + ' NOT OK! ')
-                    # delete the dataset from the library
-                    retries = 0
-                    while retries <= self.MAX_RETRIES:
-                        if sample_file.delete(self.reg_gi, self.library.id):
-                            sample_file.library_dataset_id = None
-                            break
-                    break
+    def stat_sample_files(self, sample_files):
+        """
+        Stat the local files of sample files, see stat_sample_file.
 
-        return sample_integrity_verified
+        Files are grouped by their directory, in groups of at most
+        STAT_GROUP_SIZE files. Groups are statted concurrently, at most
+        MAX_CONCURRENT_FILE_STATS at once.
 
-    def samples_uploaded_successfully(self, samples=[]):
+        :type sample_files: list
+        :param sample_files: the SampleFiles to stat
+        :return: a list of the SampleFiles whose local files don't exist
         """
-        Checks to see if all of our samples were uploaded successfully
+        by_directory = OrderedDict()
+        for sample_file in sample_files:
+            if sample_file.size is None:
+                by_directory.setdefault(os.path.dirname(sample_file.path),
+                                        []).append(sample_file)
+
+        groups = []
+        for directory_files in by_directory.values():
+            for start in range(0, len(directory_files), self.STAT_GROUP_SIZE):
+                groups.append(
+                    (directory_files[start:start + self.STAT_GROUP_SIZE],))
+
+        missing = self._map_concurrently(self._stat_group, groups,
+                                         self.MAX_CONCURRENT_FILE_STATS)
+        return [sample_file for directory_missing in missing
+                for sample_file in directory_missing]
+
+    def _stat_group(self, sample_files):
+        """Stat a group of sample files, and get the missing ones"""
+        return [sample_file for sample_file in sample_files
+                if not self.stat_sample_file(sample_file)]
+
+    def check_sample_files(self, samples):
+        """
+        Make sure the local file of every sample file of a list of samples
+        exists, before any of them are added to Galaxy.
 
         :type samples: list
-        :param samples: the list of samples to verify upload
-        :return: boolean indicating whether all of the samples were uploaded successfully
+        :param samples: the list of samples
+        :raises ValueError: listing every local file that doesn't exist
+        """
+        missing = self.stat_sample_files(self.get_sample_files(samples))
+        if missing:
+            raise ValueError(
+                "{0} file(s) not found:\n".format(len(missing)) +
+                "\n".join("Local path:" + sample_file.path
+                          for sample_file in missing))
+
+    def _missing_metadata(self, item):
+        """Find out if a library item's size or state is unknown"""
+        return 'file_size' not in item or 'state' not in item
+
+    def verification_scheduler(self):
+        """
+        Create a scheduler to verify datasets in the current library.
+
+        :rtype: VerificationScheduler
         """
-        samples_uploaded_successfully = True
+        on_verified = None
+        if self.incremental_history is not None:
+            on_verified = self.incremental_history.file_verified
+        return VerificationScheduler(self.reg_gi, self.library.id,
+                                     self.MAX_WAITS, self.MAX_RETRIES,
+                                     lib_state=self.library_state(),
+                                     logger=self.logger,
+                                     wait_policy=self.wait_policy,
+                                     on_verified=on_verified,
+                                     max_concurrent_requests=(
+                                         self.GALAXY_MAX_CONCURRENT_REQUESTS))
+
+    def get_sample_files(self, samples=[]):
+        """
+        Get every sample file of a list of samples
 
-        # Check that samples have been added
+        :type samples: list
+        :param samples: the list of samples
+        :return: a list of SampleFiles, with the forward file of each pair
+        before its reverse file
+        """
+        sample_files = []
         for sample in samples:
             for sample_item in sample.get_reads():
                 if isinstance(sample_item, SamplePair):
-                    forward_result = self.verify_sample_integrity(sample_item.forward)
-                    reverse_result = self.verify_sample_integrity(sample_item.reverse)
-                    if not forward_result or not reverse_result:
-                        samples_uploaded_successfully = False
+                    sample_files.append(sample_item.forward)
+                    sample_files.append(sample_item.reverse)
                 else:
-                    sample_result = self.verify_sample_integrity(sample_item)
-                    if not sample_result:
-                        samples_uploaded_successfully = False
+                    sample_files.append(sample_item)
+        return sample_files
+
+    def verify_sample_files(self, sample_files, incoming=None):
+        """
+        Verify that sample files were imported successfully
+
+        :type sample_files: list
+        :param sample_files: the SampleFiles to verify
+        :type incoming: function
+        :param incoming: gives the sample files linked while these are being
+        verified, see VerificationScheduler.verify. The files verified so
+        far are recorded in the journal each time it is called.
+        :return: a list of the sample files that could not be verified
+        """
+        sample_files = list(sample_files)
+        take = None
+        if incoming is not None:
+            unrecorded = list(sample_files)
+
+            def take(wait):
+                verified = [sample_file for sample_file in unrecorded
+                            if sample_file.verified]
+                unrecorded[:] = [sample_file for sample_file in unrecorded
+                                 if not sample_file.verified]
+                self.journal.record_files(verified)
+
+                arrived, done = incoming(wait)
+                sample_files.extend(arrived)
+                unrecorded.extend(arrived)
+                return arrived, done
+
+        failed = self.verification_scheduler().verify(sample_files, take)
+        self.journal.record_files(sample_files)
+        return failed
+
+    def retry_sample_files(self, failed):
+        """
+        Link and verify sample files that failed verification again, up to
+        MAX_RETRIES times. Only the failed files are retried: files that were
+        verified already are not checked again.
+
+        :type failed: list
+        :param failed: the SampleFiles that could not be verified
+        :return: a list of the sample files that still could not be verified
+        """
+        retries = 0
+        while failed and retries < self.MAX_RETRIES:
+            retries += 1
+            self.logger.debug(time.strftime("[%D %H:%M:%S]:") +
+                              ' Retrying %d file(s)' % len(failed))
+            for sample_file in failed:
+                self.retried_files_log[sample_file.galaxy_path] = retries
+            self.relink_sample_files(failed)
+            failed = self.verify_sample_files(failed)
+        return failed
+
+    def relink_sample_files(self, sample_files):
+        """
+        Link sample files again whose failed datasets were deleted. A sample
+        file is linked to the same folder it was linked to before.
+
+        :type sample_files: list
+        :param sample_files: the SampleFiles to link again
+        """
+        links = OrderedDict()
+        for sample_file in sample_files:
+            if sample_file.library_dataset_id is None:
+                link_key = (sample_file.library_folder_id,
+                            self._file_type(sample_file.path))
+                links.setdefault(link_key, []).append(
+                    (sample_file.galaxy_path, sample_file))
 
-        return samples_uploaded_successfully
+        for (folder_id, file_type), folder_links in links.items():
+            self.link_files(folder_links, folder_id, file_type, retry=True)
 
     def add_samples_if_nec(self, samples=[]):
         """
@@ -396,10 +873,26 @@ class IridaImport:
         """
         file_sum = 0
         hist = self.histories
+        # Files to link, grouped by the folder they go to and their type
+        links = OrderedDict()
+
+        # Fail before changing the library if any file is missing
+        self.check_sample_files(samples)
+
+        # Make every folder before linking any files, apart from folders
+        # made by an earlier run of the same import
+        folder_paths = self.plan_folders(samples)
+        folder_ids = self.journal.folder_ids(folder_paths)
+        created = self.create_folders_if_nec(
+            [folder_path for folder_path in folder_paths
+             if folder_path not in folder_ids])
+        self.journal.record_folders(created)
+        folder_ids.update(created)
 
         for sample in samples:
             self.logger.debug("sample name is" + sample.name)
-            sample_root_folder_id = self.create_folder_if_nec(self.ILLUMINA_PATH + '/' + sample.name)
+            sample_root_folder_id = folder_ids[self.ILLUMINA_PATH + '/' +
+                                               sample.name]
 
             added_to_galaxy = []
 
@@ -412,17 +905,17 @@ class IridaImport:
                     pair_path = sample_folder_path + "/" + sample_item.name
 
                     #since doing pair, will not be writting to the 'main' folder for the sample
-                    sample_folder_id = self.create_folder_if_nec(pair_path)
+                    sample_folder_id = folder_ids[pair_path]
 
                     added_to_galaxy = self._add_file(added_to_galaxy,
                                                      pair_path,sample_folder_id,
-                                                     forward)
+                                                     forward, links=links)
 
                     file_sum += 1
 
                     added_to_galaxy = self._add_file(added_to_galaxy,
                                                      pair_path,sample_folder_id,
-                                                     reverse)
+                                                     reverse, links=links)
 
                     file_sum += 1
 
@@ -430,108 +923,282 @@ class IridaImport:
                     # Processing for a SampleFile
                     added_to_galaxy = self._add_file(added_to_galaxy,
                                                      sample_folder_path,sample_root_folder_id,
-                                                     sample_item)
+                                                     sample_item, links=links)
                     file_sum += 1
 
+        for (folder_id, file_type), folder_links in links.items():
+            self.link_files(folder_links, folder_id, file_type)
+
+        # Linked files are recorded as they are linked, this records the
+        # files that were skipped
+        self.journal.record_files(
+            [sample_file for sample_file in self.get_sample_files(samples)
+             if sample_file.library_dataset_id is not None])
+
         return file_sum
 
     def add_samples_to_history(
-            self, samples=[], hist_id=None, make_paired_collection=True):
+            self, samples=[], hist_id=None, make_paired_collection=True,
+            added=None):
         """
         Adds samples to history in Galaxy
 
+        Datasets are added to the history, and hidden, at most
+        GALAXY_MAX_CONCURRENT_REQUESTS at once. Collections are named and
+        ordered by the samples' reads whatever order the requests finish in.
+
+        Library datasets that were copied to the history before, e.g. by an
+        earlier import that failed, are reused rather than copied again.
+
+        Paired reads are put in one list:paired collection, or if
+        MAX_PAIRS_PER_COLLECTION is set, in as many collections of up to that
+        many pairs as are needed.
+
         :type samples: list
         :param samples: the list of samples to upload to history
+        :type added: dict
+        :param added: the ids in the history of library datasets that were
+        already added to it, by library dataset id, see IncrementalHistory
         :return: The collection array of added samples
         """
         collection_array = []
         collection_name_count = {}
         hist = self.histories
+        # The library datasets to add, in the order of the samples' reads
+        dataset_ids = []
+        # The collection name of each pair, and the index of its forward
+        # dataset in dataset_ids
+        pairs = []
         for sample in samples:
             self.logger.debug("sample name is" + sample.name)
 
-            added_to_galaxy = []
-
             for sample_item in sample.get_reads():
-                sample_folder_path = self.ILLUMINA_PATH + '/' + sample.name
                 if isinstance(sample_item, SamplePair):
                     # Processing for a SamplePair
-                    datasets = dict()
-
-                    pair_path = sample_folder_path + "/" + sample_item.name
-
                     if sample.name in collection_name_count:
-                        collection_name = str(sample.name) + "__" + str(collection_name_count[sample.name])
+                        collection_name = (
+                            str(sample.name) + "__" +
+                            str(collection_name_count[sample.name]))
                         collection_name_count[sample.name] += 1
                     else:
                         collection_name = str(sample.name)
                         collection_name_count[sample.name] = 2
 
-                    # Add datasets to the current history
-                    datasets['forward'] = hist.upload_dataset_from_library(
-                        hist_id,
-                        sample_item.forward.library_dataset_id
-                    )['id']
-
-                    datasets['reverse'] = hist.upload_dataset_from_library(
-                        hist_id,
-                        sample_item.reverse.library_dataset_id
-                    )['id']
-
-                    if make_paired_collection:
-                        # Put datasets into the collection
-                        collection_elem_ids = [{
-                            "src": "hda",
-                            "name": "forward",
-                            "id": datasets['forward']
-                        }, {
-                            "src": "hda",
-                            "name": "reverse",
-                            "id": datasets['reverse']
-                        }]
-                        collection_array.append({
-                            'src': 'new_collection',
-                            'name': collection_name,
-                            'collection_type': 'paired',
-                            'element_identifiers': collection_elem_ids,
-                        })
-
-                        # Hide datasets in history
-                        hist.update_dataset(
-                            hist_id,
-                            datasets['forward'],
-                            visible=False
-                        )
-                        hist.update_dataset(
-                            hist_id,
-                            datasets['reverse'],
-                            visible=False
-                        )
-
+                    pairs.append((collection_name, len(dataset_ids)))
+                    dataset_ids.append(sample_item.forward.library_dataset_id)
+                    dataset_ids.append(sample_item.reverse.library_dataset_id)
                 else:
                     # Processing for a SampleFile
-
-                    hist.upload_dataset_from_library(
-                        hist_id,
-                        sample_item.library_dataset_id
-                    )
+                    dataset_ids.append(sample_item.library_dataset_id)
+
+        # Add datasets to the current history, unless they are there already
+        added = dict(added or {})
+        to_add = [dataset_id for dataset_id in dataset_ids
+                  if dataset_id not in added]
+        added.update(zip(to_add,
+                         self.add_datasets_to_history(hist_id, to_add)))
+        history_ids = [added[dataset_id] for dataset_id in dataset_ids]
+
+        hide_source_items = False
+        if make_paired_collection:
+            hidden = []
+            for collection_name, index in pairs:
+                # Put datasets into the collection
+                collection_elem_ids = [{
+                    "src": "hda",
+                    "name": "forward",
+                    "id": history_ids[index]
+                }, {
+                    "src": "hda",
+                    "name": "reverse",
+                    "id": history_ids[index + 1]
+                }]
+                collection_array.append({
+                    'src': 'new_collection',
+                    'name': collection_name,
+                    'collection_type': 'paired',
+                    'element_identifiers': collection_elem_ids,
+                })
+                hidden.extend(history_ids[index:index + 2])
+
+            # Galaxy can hide the datasets as it makes the collection,
+            # otherwise they are hidden one by one
+            hide_source_items = bool(hidden) and self.can_hide_source_items()
+            if not hide_source_items:
+                self._hide_datasets(hist_id, hidden)
 
         if collection_array != []:
             collection_title = 'IridaImport - ' + str(datetime.datetime.now())
-            collection_desc = {
-                "name": collection_title,
-                "collection_type": "list:paired",
-                "element_identifiers": collection_array
-            }
-            added_to_history = hist.create_dataset_collection(
-                hist_id,
-                collection_desc
-            )
+            chunks = self.chunk_collection(collection_array)
+            pairs_made = 0
+            for chunk_num, chunk in enumerate(chunks):
+                name = collection_title
+                if len(chunks) > 1:
+                    name += ' (%d of %d)' % (chunk_num + 1, len(chunks))
+                collection_desc = {
+                    "name": name,
+                    "collection_type": "list:paired",
+                    "element_identifiers": chunk
+                }
+                if hide_source_items:
+                    try:
+                        added_to_history = (
+                            self.create_collection_hiding_sources(
+                                hist_id, collection_desc))
+                    except ConnectionError:
+                        self.logger.exception(
+                            'Could not hide datasets while making the '
+                            'collection, hiding them one by one')
+                        self.hides_source_items = False
+                        hide_source_items = False
+                        # Earlier collections' datasets are already hidden
+                        self._hide_datasets(
+                            hist_id, hidden[2 * pairs_made:])
+                if not hide_source_items:
+                    added_to_history = hist.create_dataset_collection(
+                        hist_id,
+                        collection_desc
+                    )
+                pairs_made += len(chunk)
+                if len(chunks) > 1:
+                    self.logger.info(
+                        'Created collection %d of %d (%d pairs)' % (
+                            chunk_num + 1, len(chunks), len(chunk)))
 
         return collection_array
 
+    def add_datasets_to_history(self, hist_id, dataset_ids):
+        """
+        Add library datasets to a history, reusing those that were copied to
+        it before. Datasets are added at most GALAXY_MAX_CONCURRENT_REQUESTS
+        at once.
+
+        :type hist_id: str
+        :param hist_id: the history's id
+        :type dataset_ids: list
+        :param dataset_ids: the ids of the library datasets
+        :return: a list of the id in the history of each library dataset
+        """
+        history_ids = self.reusable_history_datasets(hist_id, dataset_ids)
+        to_add = [index for index, history_id in enumerate(history_ids)
+                  if history_id is None]
+        if len(to_add) < len(dataset_ids):
+            self.logger.info('Reusing %d dataset(s) already in the history' %
+                             (len(dataset_ids) - len(to_add)))
+        added = self._map_concurrently(
+            self._add_to_history,
+            [(hist_id, dataset_ids[index]) for index in to_add],
+            self.GALAXY_MAX_CONCURRENT_REQUESTS)
+        for index, history_id in zip(to_add, added):
+            history_ids[index] = history_id
+        return history_ids
+
+    def reusable_history_datasets(self, hist_id, dataset_ids):
+        """
+        Find the datasets of a history that were copied from library
+        datasets. The history's contents are listed once per import, and
+        only if the LDDA id of one of the library datasets is known.
+
+        :type hist_id: str
+        :param hist_id: the history's id
+        :type dataset_ids: list
+        :param dataset_ids: the ids of the library datasets
+        :return: a list of the id in the history of each library dataset, or
+        None where it is not in the history
+        """
+        lib_state = self.library_state()
+        ldda_ids = []
+        for dataset_id in dataset_ids:
+            item = lib_state.find(dataset_id)
+            ldda_ids.append(item.get('ldda_id') if item else None)
+        if not any(ldda_ids):
+            return [None] * len(dataset_ids)
+
+        if hist_id not in self.history_copies:
+            copied = {}
+            contents = self.histories.show_history(
+                hist_id, contents=True, deleted=False, details='all')
+            for content in contents:
+                if (content.get('history_content_type',
+                                'dataset') == 'dataset' and
+                        not content.get('deleted') and
+                        not content.get('purged') and
+                        content.get('state') not in ('error', 'discarded') and
+                        content.get('copied_from_ldda_id')):
+                    copied.setdefault(content['copied_from_ldda_id'],
+                                      content['id'])
+            self.history_copies[hist_id] = copied
+        copied = self.history_copies[hist_id]
+        return [copied.get(ldda_id) for ldda_id in ldda_ids]
+
+    def chunk_collection(self, collection_array):
+        """
+        Split the pairs of a collection into the collections to make.
+
+        :type collection_array: list
+        :param collection_array: the element identifiers of every pair
+        :return: a list of lists of up to MAX_PAIRS_PER_COLLECTION element
+        identifiers, or one list of all of them if it is not set
+        """
+        chunk_size = self.MAX_PAIRS_PER_COLLECTION or len(collection_array)
+        return [collection_array[start:start + chunk_size]
+                for start in range(0, len(collection_array), chunk_size)]
+
+    def can_hide_source_items(self):
+        """
+        Find out if Galaxy can hide a collection's datasets as it creates the
+        collection. Galaxy is only asked once.
+
+        :return: True if Galaxy is HIDE_SOURCE_ITEMS_VERSION or later
+        """
+        if self.hides_source_items is None:
+            try:
+                version = self.reg_gi.config.get_version()['version_major']
+                self.hides_source_items = (
+                    tuple(int(part) for part in version.split('.')[:2]) >=
+                    self.HIDE_SOURCE_ITEMS_VERSION)
+            except (ConnectionError, KeyError, ValueError):
+                # Galaxy is older than the version API
+                self.hides_source_items = False
+        return self.hides_source_items
+
+    def create_collection_hiding_sources(self, hist_id, collection_desc):
+        """
+        Create a dataset collection in a history, hiding the datasets that
+        it is made of.
+
+        :type hist_id: str
+        :param hist_id: the history's id
+        :type collection_desc: dict
+        :param collection_desc: the collection's name, type and element
+        identifiers, as for create_dataset_collection
+        :return: the new collection
+        """
+        # The history client doesn't pass on hide_source_items
+        payload = dict(collection_desc, type='dataset_collection',
+                       hide_source_items=True)
+        return self.reg_gi.make_post_request(
+            '%s/histories/%s/contents' % (self.reg_gi.url, hist_id),
+            payload=payload)
+
+    def _hide_datasets(self, hist_id, history_ids):
+        """Hide datasets in a history, one request each"""
+        self._map_concurrently(
+            self._hide_in_history,
+            [(hist_id, history_id) for history_id in history_ids],
+            self.GALAXY_MAX_CONCURRENT_REQUESTS)
+
+    def _add_to_history(self, hist_id, dataset_id):
+        """Add a library dataset to a history, and get its id there"""
+        return self.histories.upload_dataset_from_library(
+            hist_id, dataset_id)['id']
+
+    def _hide_in_history(self, hist_id, history_id):
+        """Hide a dataset in a history"""
+        self.histories.update_dataset(hist_id, history_id, visible=False)
+
     def _add_file(self, added_to_galaxy=None, sample_folder_path=None,sample_folder_id=None,
-                  sample_file=None):
+                  sample_file=None, links=None):
         """
         Upload a sample's sample files into Galaxy
 
@@ -540,13 +1207,28 @@ class IridaImport:
         get_roles
         :type sample_file: SampleFile
         :param sample_file: A file object containing the file to upload
+        :type links: dict
+        :param links: if given, a file that needs linking is not linked
+        right away, but added to the list in links for its folder id and
+        file type, as a tuple of its Galaxy path and the sample file
         :return: dataset object or the id of an existing dataset
         """
         galaxy_sample_file_name = sample_folder_path + '/' + sample_file.name
-        if os.path.isfile(sample_file.path):
+        sample_file.galaxy_path = galaxy_sample_file_name
+        if self.stat_sample_file(sample_file):
+            if (sample_file.library_dataset_id == None and
+                    self.journal.restore_file(sample_file,
+                                              galaxy_sample_file_name)):
+                self.logger.debug(
+                    "  Sample file was added by an earlier run of the import")
+                self.resumed_files_log.append(
+                    {'galaxy_name': galaxy_sample_file_name})
+
             if sample_file.library_dataset_id == None:
                 #grab dataset_id if it does exist, if not will be given False
-                dataset_id = self.existing_file(sample_file.path,galaxy_sample_file_name)
+                dataset_id = self.existing_file(sample_file.path,
+                                                galaxy_sample_file_name,
+                                                size=sample_file.size)
 
                 if dataset_id:
                     # Return dataset id of existing file
@@ -557,6 +1239,16 @@ class IridaImport:
                     sample_file.verified = True
                     self.skipped_files_log.append(
                         {'galaxy_name': galaxy_sample_file_name})
+                elif links is not None:
+                    self.logger.debug(
+                        "  Sample file does not exist so queueing it to be "
+                        "linked")
+                    link_key = (sample_folder_id,
+                                self._file_type(sample_file.path))
+                    links.setdefault(link_key, []).append(
+                        (galaxy_sample_file_name, sample_file))
+                    sample_file.library_folder_id = sample_folder_id
+                    return added_to_galaxy
                 else:
                     self.logger.debug(
                         "  Sample file does not exist so uploading/linking it")
@@ -564,13 +1256,10 @@ class IridaImport:
                         sample_file, sample_folder_id)
                     if(added):
                         added_to_galaxy = added
-                        self.print_logged(time.strftime("[%D %H:%M:%S]:") +
-                                          ' Imported file with Galaxy path: ' +
-                                          galaxy_sample_file_name)
-                        self.uploaded_files_log.append(
-                            {'galaxy_name': galaxy_sample_file_name})
+                        self._linked(galaxy_sample_file_name, added[0]['id'])
 
                 sample_file.library_dataset_id = added_to_galaxy[0]['id']
+                sample_file.library_folder_id = sample_folder_id
 
         else:
             error = ("File not found:\n Galaxy path:{0}\nLocal path:{1}"
@@ -595,10 +1284,7 @@ class IridaImport:
         file_path = sample_file.path
         self.logger.debug(
             "       Sample file's local path is" + file_path)
-        file_type = 'auto'
-        # Assume fastq files are fastqsanger:
-        if os.path.splitext(file_path)[1] == '.fastq':
-            file_type = 'fastqsanger'
+        file_type = self._file_type(file_path)
 
         added = self.reg_gi.libraries.upload_from_galaxy_filesystem(
             self.library.id,
@@ -610,6 +1296,93 @@ class IridaImport:
 
         return added
 
+    def link_files(self, links, folder_id, file_type, retry=False):
+        """
+        Add sample files of the same type to a folder in Galaxy, linking to
+        them locally. Galaxy is sent up to MAX_FILES_PER_LINK file paths per
+        request.
+
+        :type links: list
+        :param links: tuples of each sample file's Galaxy path and SampleFile
+        :type folder_id: str
+        :param folder_id: ID of folder to link the files to
+        :type file_type: str
+        :param file_type: the Galaxy file type of every file
+        :type retry: bool
+        :param retry: whether the files were linked before, in which case
+        they are not counted as imported again
+        """
+        batch_size = max(self.MAX_FILES_PER_LINK, 1)
+        for start in range(0, len(links), batch_size):
+            batch = links[start:start + batch_size]
+            file_paths = [sample_file.path
+                          for galaxy_name, sample_file in batch]
+            self.logger.debug('      Attempting to link %d file(s)'
+                              % len(batch))
+
+            added = self.reg_gi.libraries.upload_from_galaxy_filesystem(
+                self.library.id,
+                '\n'.join(file_paths),
+                folder_id=folder_id,
+                link_data_only='link_to_files',
+                file_type=file_type
+            )
+
+            for (galaxy_name, sample_file), dataset in zip(
+                    batch, self._match_datasets(file_paths, added)):
+                sample_file.library_dataset_id = dataset['id']
+                sample_file.library_folder_id = folder_id
+                self._linked(galaxy_name, dataset['id'], retry)
+            self.journal.record_files(
+                [sample_file for galaxy_name, sample_file in batch])
+
+    def _match_datasets(self, file_paths, added):
+        """
+        Match the datasets Galaxy made for linked files to the files' paths.
+
+        :type file_paths: list
+        :param file_paths: the local paths of the linked files
+        :type added: list
+        :param added: the dataset dicts returned by Galaxy
+        :return: a list of dataset dicts, one for each path in order
+        """
+        added = added or []
+        names = [os.path.basename(file_path) for file_path in file_paths]
+        if (len(added) == len(file_paths) and
+                all('name' not in dataset or dataset['name'] == name
+                    for dataset, name in zip(added, names))):
+            return added
+
+        # Galaxy names datasets after their files, so match them by name
+        by_name = {}
+        for dataset in added:
+            by_name.setdefault(dataset.get('name'), []).append(dataset)
+        matched = []
+        for file_path, name in zip(file_paths, names):
+            if not by_name.get(name):
+                raise IOError('Galaxy did not make a dataset for the linked '
+                              'file: ' + file_path)
+            matched.append(by_name[name].pop(0))
+        return matched
+
+    def _linked(self, galaxy_name, dataset_id, retry=False):
+        """Record a sample file that was just linked in Galaxy"""
+        self.library_state().add({'id': dataset_id, 'type': 'file',
+                                  'name': galaxy_name})
+        self.print_logged(time.strftime("[%D %H:%M:%S]:") +
+                          ' Imported file with Galaxy path: ' +
+                          galaxy_name)
+        if not retry:
+            self.uploaded_files_log.append({'galaxy_name': galaxy_name})
+
+    def _file_type(self, file_path):
+        """Get the Galaxy file type to link a file as"""
+        file_type = 'auto'
+        # Assume fastq files are fastqsanger:
+        if os.path.splitext(file_path)[1] == '.fastq':
+            file_type = 'fastqsanger'
+        return file_type
+
     def print_summary(self, failed=False):
         """
         Print a final summary of the tool's activity
@@ -624,15 +1397,51 @@ class IridaImport:
 
         if failed:
             self.print_logged('Import failed.')
+        elif self.failed_files_log:
+            self.print_logged('Import partially completed: {0} file(s) '
+                              'could not be verified.'
+                              .format(len(self.failed_files_log)))
         else:
             self.print_logged('Import completed successfully.')
         self.print_logged('Final summary:\n'
                           '{0} file(s) imported and {1} file(s) skipped.'
                           .format(len(self.uploaded_files_log),
                                   len(self.skipped_files_log)))
+        if self.resumed_files_log:
+            self.print_logged('{0} file(s) were added by an earlier run.'
+                              .format(len(self.resumed_files_log)))
         print_files_log(
             '\nSome files were skipped because they were not unique:',
             self.skipped_files_log)
+        if self.retried_files_log:
+            self.print_logged('\nSome files were retried:')
+            for galaxy_name, retries in self.retried_files_log.items():
+                self.print_logged('File with Galaxy path: {0} ({1} retries)'
+                                  .format(galaxy_name, retries))
+        print_files_log(
+            '\nSome files could not be verified after retrying:',
+            self.failed_files_log)
+        self.print_logged('')
+        for line in self.metrics.summary_lines():
+            self.print_logged(line)
+
+    def write_metrics(self, log):
+        """
+        Write the import's metrics as JSON next to its log, e.g. to
+        'log_file.metrics.json' for the log 'log_file'.
+
+        :type log: str
+        :param log: the name of the file the tool's log is written to, or
+        None to not write the metrics
+        """
+        if not log:
+            return
+        metrics_file = log + '.metrics.json'
+        try:
+            self.metrics.write(metrics_file)
+        except IOError:
+            self.logger.exception('Could not write the metrics file: ' +
+                                  metrics_file)
 
     def print_logged(self, message):
         """Print a message and log it"""
@@ -654,9 +1463,10 @@ class IridaImport:
                                   token={'access_token': self.token})
         else:
             irida = OAuth2Session(self.CLIENT_ID, redirect_uri=redirect_uri)
-            irida.fetch_token(
-                self.TOKEN_ENDPOINT, client_secret=self.CLIENT_SECRET,
-                authorization_response=redirect_uri + '?code=' + auth_code)
+            with self.metrics.request('IRIDA', 'POST', self.TOKEN_ENDPOINT):
+                irida.fetch_token(
+                    self.TOKEN_ENDPOINT, client_secret=self.CLIENT_SECRET,
+                    authorization_response=redirect_uri + '?code=' + auth_code)
         if PRINT_TOKEN_INSECURELY:
             self.print_logged(irida.token)
         return irida
@@ -688,13 +1498,77 @@ class IridaImport:
             self.ILLUMINA_PATH = config.get('Galaxy', 'illumina_path')
             self.REFERENCE_PATH = config.get('Galaxy', 'reference_path')
             self.XML_FILE = config.get('Galaxy', 'xml_file')
-            self.MAX_WAITS = config.get('Galaxy', 'max_waits')
+            self.MAX_WAITS = int(config.get('Galaxy', 'max_waits'))
             self.MAX_RETRIES = 3
+
+            # Limits how many requests are made to Galaxy at the same time
+            self.GALAXY_MAX_CONCURRENT_REQUESTS = 1
+            if config.has_option('Galaxy', 'max_concurrent_requests'):
+                self.GALAXY_MAX_CONCURRENT_REQUESTS = int(
+                    config.get('Galaxy', 'max_concurrent_requests'))
+
+            # Limits how many directories of sample files are statted at the
+            # same time
+            self.MAX_CONCURRENT_FILE_STATS = 1
+            if config.has_option('Galaxy', 'max_concurrent_file_stats'):
+                self.MAX_CONCURRENT_FILE_STATS = int(
+                    config.get('Galaxy', 'max_concurrent_file_stats'))
+
+            # The most pairs put in one collection in the history. Larger
+            # carts get several collections. 0 puts every pair in one.
+            self.MAX_PAIRS_PER_COLLECTION = 0
+            if config.has_option('Galaxy', 'max_pairs_per_collection'):
+                self.MAX_PAIRS_PER_COLLECTION = int(
+                    config.get('Galaxy', 'max_pairs_per_collection'))
+
+            # The most files linked to a library folder by one request
+            self.MAX_FILES_PER_LINK = 100
+            if config.has_option('Galaxy', 'max_files_per_link'):
+                self.MAX_FILES_PER_LINK = int(
+                    config.get('Galaxy', 'max_files_per_link'))
+
+            # How long to wait between checks of pending datasets
+            self.wait_policy = FixedWaitPolicy()
+            if (config.has_option('Galaxy', 'wait_policy') and
+                    config.get('Galaxy', 'wait_policy') == 'backoff'):
+                def wait_option(name, default):
+                    if config.has_option('Galaxy', name):
+                        return float(config.get('Galaxy', name))
+                    return default
+
+                self.wait_policy = BackoffWaitPolicy(
+                    initial=wait_option('wait_initial', 1),
+                    factor=wait_option('wait_factor', 2),
+                    maximum=wait_option('wait_max', 30),
+                    jitter=wait_option('wait_jitter', 0.25),
+                    bytes_per_second=wait_option('wait_bytes_per_second',
+                                                 None))
  
             # Used to reconnect to Galaxy instance when connection is lost
             self.MAX_CLIENT_ATTEMPTS = int(config.get('Galaxy', 'max_client_http_attempts'))
             self.CLIENT_RETRY_DELAY = int(config.get('Galaxy', 'client_http_retry_delay'))
 
+            # Either read the whole library at once ('full'), or only the
+            # folders that are used ('lazy')
+            self.LAZY_LIBRARY_LOADING = False
+            if config.has_option('Galaxy', 'library_loading'):
+                self.LAZY_LIBRARY_LOADING = (
+                    config.get('Galaxy', 'library_loading') == 'lazy')
+
+            # The progress of imports is recorded here, so they can be
+            # resumed
+            self.JOURNAL_FILE = None
+            if config.has_option('Galaxy', 'journal_file'):
+                self.JOURNAL_FILE = config.get('Galaxy', 'journal_file')
+
+            # Known library states are reused by later imports in this process
+            if config.has_option('Galaxy', 'library_cache_size'):
+                self.library_cache.max_libraries = int(
+                    config.get('Galaxy', 'library_cache_size'))
+            if config.has_option('Galaxy', 'library_cache_ttl'):
+                self.library_cache.ttl = float(
+                    config.get('Galaxy', 'library_cache_ttl'))
+
             self.TOKEN_ENDPOINT_SUFFIX = config.get('IRIDA',
                                                     'token_endpoint_suffix')
             self.INITIAL_ENDPOINT_SUFFIX = config.get('IRIDA',
@@ -707,6 +1581,12 @@ class IridaImport:
             self.CLIENT_ID = config.get('IRIDA', 'client_id')
             self.CLIENT_SECRET = config.get('IRIDA', 'client_secret')
 
+            # Limits how many requests are made to IRIDA at the same time
+            self.IRIDA_MAX_CONCURRENT_REQUESTS = 1
+            if config.has_option('IRIDA', 'max_concurrent_requests'):
+                self.IRIDA_MAX_CONCURRENT_REQUESTS = int(
+                    config.get('IRIDA', 'max_concurrent_requests'))
+
             # Configure the tool XML file
             # The Galaxy server must be restarted for XML configuration
             # changes to take effect.
@@ -731,8 +1611,190 @@ class IridaImport:
 
             tree.write(xml_path)
 
+    def connect_to_galaxy(self):
+        """Create the clients used to make requests to Galaxy"""
+        self.gi = GalaxyInstance(self.GALAXY_URL, self.ADMIN_KEY)
+        self.gi.gi.max_get_attempts = self.MAX_CLIENT_ATTEMPTS
+        self.gi.gi.get_retry_delay = self.CLIENT_RETRY_DELAY
+
+
+        # This is necessary for uploads from arbitary local paths
+        # that require setting the "link_to_files" flag:
+        self.reg_gi = galaxy.GalaxyInstance(
+            url=self.GALAXY_URL,
+            key=self.ADMIN_KEY)
+        self.reg_gi.max_get_attempts = self.MAX_CLIENT_ATTEMPTS
+        self.reg_gi.get_retry_delay = self.CLIENT_RETRY_DELAY
+
+        self.histories = self.reg_gi.histories
+        self.hides_source_items = None
+
+        for galaxy_instance in (self.gi.gi, self.reg_gi):
+            self.metrics.watch(galaxy_instance, 'Galaxy')
+
+    def plan_import(self, json_parameter_file, token=None, config_file=None,
+                    irida_engine='session'):
+        """
+        Print what importing samples into Galaxy from IRIDA would do, and how
+        many requests it would make, without changing the library or history.
+
+        Samples are requested from IRIDA, and the library is read, as they
+        would be for the import. Without a token, the OAuth2 code in the
+        parameter file is exchanged for one, and can't be used again by the
+        import.
+
+        :type json_parameter_file: str
+        :param json_parameter_file: a path that Galaxy passes,
+        to the stub datasource it created
+        :type token: str
+        :param token: An access token that can be passed to the tool when it
+        is manually run.
+        :type config_file: str
+        :param config_file: the name of a file to configure from
+        :type irida_engine: str
+        :param irida_engine: how to request samples from IRIDA, as for
+        import_to_galaxy
+        :return: the ImportPlan
+        """
+        self.logger.setLevel(logging.INFO)
+        self.configure()
+        self.current_library_state = None
+        with open(json_parameter_file, 'r') as param_file_handle:
+            full_param_dict = json.loads(param_file_handle.read())
+            param_dict = full_param_dict['param_dict']
+            json_params_dict = json.loads(param_dict['json_params'])
+            embedded = json_params_dict['_embedded']
+
+            self.print_logged("Planning the import of files from IRIDA to "
+                              "Galaxy...")
+
+            self.token = token
+            self.irida = self.get_IRIDA_session(embedded['oauth2'])
+            self.connect_to_galaxy()
+
+            if irida_engine == 'pipelined':
+                samples = self.get_samples_pipelined(embedded['samples'])
+            else:
+                samples = self.get_samples(embedded['samples'])
+
+            plan = self.make_plan(
+                samples, embedded['library']['name'],
+                add_to_history=embedded['addtohistory'],
+                make_paired_collection=embedded.get('makepairedcollection',
+                                                    True))
+            for line in plan.lines():
+                self.print_logged(line)
+            return plan
+
+    def make_plan(self, samples, desired_lib_name, add_to_history=True,
+                  make_paired_collection=True):
+        """
+        Find out what importing samples would do, by reading the library the
+        same way the import would.
+
+        :type samples: list
+        :param samples: the samples to import
+        :type desired_lib_name: str
+        :param desired_lib_name: the name of the library to import to
+        :type add_to_history: bool
+        :param add_to_history: whether the samples would be added to a
+        history
+        :type make_paired_collection: bool
+        :param make_paired_collection: whether a collection would be made of
+        the samples' pairs
+        :return: an ImportPlan
+        """
+        plan = ImportPlan(desired_lib_name)
+        # Each sample, its pairs and its unpaired files are requested, after
+        # getting an access token if none was given
+        plan.irida_requests = 3 * len(samples) + (0 if self.token else 1)
+
+        # Galaxy's clients are watched by the metrics since connecting
+        galaxy_requests = self.metrics.request_count('Galaxy')
+
+        self.library = self.find_lib(desired_lib_name)
+        if self.library is None:
+            plan.library_exists = False
+
+        for folder_path in ([self.ILLUMINA_PATH, self.REFERENCE_PATH] +
+                            self.plan_folders(samples)):
+            if (self.library is None or
+                    not self.exists_in_lib('folder', 'name', folder_path)):
+                plan.folders_to_create.append(folder_path)
+        new_folders = set(plan.folders_to_create)
+        self.stat_sample_files(self.get_sample_files(samples))
+
+        # Files to link, grouped by the folder they go to and their type
+        links = OrderedDict()
+        num_pairs = 0
+        for sample in samples:
+            sample_folder_path = self.ILLUMINA_PATH + '/' + sample.name
+            for sample_item in sample.get_reads():
+                if isinstance(sample_item, SamplePair):
+                    num_pairs += 1
+                    folder_path = sample_folder_path + "/" + sample_item.name
+                    sample_files = [sample_item.forward, sample_item.reverse]
+                else:
+                    folder_path = sample_folder_path
+                    sample_files = [sample_item]
+
+                for sample_file in sample_files:
+                    galaxy_name = folder_path + '/' + sample_file.name
+                    if sample_file.size is None:
+                        plan.missing_files.append(sample_file.path)
+                    elif (folder_path not in new_folders and
+                          self.existing_file(sample_file.path, galaxy_name,
+                                             size=sample_file.size)):
+                        plan.files_to_skip.append(galaxy_name)
+                    else:
+                        plan.files_to_link.append(galaxy_name)
+                        links.setdefault(
+                            (folder_path, self._file_type(sample_file.path)),
+                            []).append(galaxy_name)
+
+        batch_size = max(self.MAX_FILES_PER_LINK, 1)
+        plan.galaxy_requests['Reading the library'] = (
+            self.metrics.request_count('Galaxy') - galaxy_requests)
+        if self.library is None:
+            # Finding the user's role, creating the library and setting its
+            # permissions
+            plan.galaxy_requests['Creating the library'] = 3
+        plan.galaxy_requests['Creating folders'] = len(plan.folders_to_create)
+        plan.galaxy_requests['Linking files'] = sum(
+            (len(folder_links) + batch_size - 1) // batch_size
+            for folder_links in links.values())
+        # Each folder is listed at least once, more if Galaxy is still
+        # processing its files
+        plan.galaxy_requests['Verifying files'] = len(
+            set(folder_path for folder_path, file_type in links))
+
+        plan.add_to_history = add_to_history
+        if add_to_history:
+            plan.history_datasets = (len(plan.files_to_link) +
+                                     len(plan.files_to_skip))
+            if make_paired_collection and num_pairs:
+                plan.hidden_datasets = 2 * num_pairs
+                plan.history_collections = len(self.chunk_collection(
+                    range(num_pairs)))
+            if plan.files_to_skip:
+                # Files already in the library may be in the history too
+                plan.galaxy_requests['Reading the history'] = 1
+            plan.galaxy_requests['Adding datasets to the history'] = (
+                plan.history_datasets)
+            if plan.hidden_datasets:
+                plan.galaxy_requests['Checking the Galaxy version'] = 1
+            plan.galaxy_requests['Hiding paired datasets'] = (
+                0 if plan.hidden_datasets and self.can_hide_source_items()
+                else plan.hidden_datasets)
+            plan.galaxy_requests['Creating collections'] = (
+                plan.history_collections)
+
+        return plan
+
     def import_to_galaxy(self, json_parameter_file, log, hist_id, token=None,
-                         config_file=None):
+                         config_file=None, irida_engine='session',
+                         streaming=False, resume=False,
+                         incremental_history=False):
         """
         Import samples and their sample files into Galaxy from IRIDA
 
@@ -740,19 +1802,44 @@ class IridaImport:
         :param json_parameter_file: a path that Galaxy passes,
         to the stub datasource it created
         :type log: str
-        :param log: the name of a file to write the tool's log to.
+        :param log: the name of a file to write the tool's log to. The
+        import's metrics are written next to it, see write_metrics.
         :type token: str
         :param token: An access token that can be passed to the tool when it
         is manually run.
         :type config_file: str
         :param config_file: the name of a file to configure from
+        :type irida_engine: str
+        :param irida_engine: 'session' to request samples from IRIDA through
+        the OAuth2 session, or 'pipelined' to use the pipelined IRIDA client
+        :type streaming: bool
+        :param streaming: whether to link and verify each sample's files as
+        soon as the sample is resolved from IRIDA, see StreamingImport. The
+        OAuth2 session is used to request samples whatever irida_engine is.
+        :type resume: bool
+        :param resume: whether to continue the import from where an earlier
+        run of it stopped, see ImportJournal. Otherwise the import starts
+        again from the beginning. journal_file must be configured.
+        :type incremental_history: bool
+        :param incremental_history: whether to add each sample's datasets to
+        the history as soon as its files are verified, see
+        IncrementalHistory. Otherwise they are added once every file is
+        verified. The collections are made at the end either way.
         """
         collection_array = []
         num_files = 0
-        self.pp = pprint.PrettyPrinter(indent=4)
+        self.metrics = ImportMetrics()
+        self.history_copies = {}
+        self.incremental_history = None
+        # The library's state is looked up in the cache once per import
+        self.current_library_state = None
 
         self.logger.setLevel(logging.INFO)
         self.configure()
+        if resume and not self.JOURNAL_FILE:
+            # An import journaled in memory can't be resumed
+            raise ValueError('Resuming an import needs journal_file to be '
+                             'set in config.ini')
         with open(json_parameter_file, 'r') as param_file_handle:
 
             full_param_dict = json.loads(param_file_handle.read())
@@ -763,6 +1850,9 @@ class IridaImport:
 
             self.uploaded_files_log = []
             self.skipped_files_log = []
+            self.retried_files_log = OrderedDict()
+            self.failed_files_log = []
+            self.resumed_files_log = []
 
             samples_dict = json_params_dict['_embedded']['samples']
             email = json_params_dict['_embedded']['user']['email']
@@ -775,59 +1865,132 @@ class IridaImport:
             if "makepairedcollection" in json_params_dict['_embedded']:
                 make_paired_collection = json_params_dict['_embedded']['makepairedcollection']
 
-            self.token = token
-            self.irida = self.get_IRIDA_session(oauth_dict)
-
-            self.gi = GalaxyInstance(self.GALAXY_URL, self.ADMIN_KEY)
-            self.gi.gi.max_get_attempts = self.MAX_CLIENT_ATTEMPTS
-            self.gi.gi.get_retry_delay = self.CLIENT_RETRY_DELAY
-
-
-            # This is necessary for uploads from arbitary local paths
-            # that require setting the "link_to_files" flag:
-            self.reg_gi = galaxy.GalaxyInstance(
-                url=self.GALAXY_URL,
-                key=self.ADMIN_KEY)
-            self.reg_gi.max_get_attempts = self.MAX_CLIENT_ATTEMPTS
-            self.reg_gi.get_retry_delay = self.CLIENT_RETRY_DELAY
-
-            self.histories = self.reg_gi.histories
-
-            # Each sample contains a list of sample files
-            samples = self.get_samples(samples_dict)
-
-            # Set up the library
-            self.library = self.get_first_or_make_lib(desired_lib_name, email)
-            self.create_folder_if_nec(self.ILLUMINA_PATH)
-            self.create_folder_if_nec(self.REFERENCE_PATH)
-
-            # Add each sample's files to the library
-            retries = 0
-            while (retries <= self.MAX_RETRIES):
-                num_files = self.add_samples_if_nec(samples)
-
-                self.logger.debug(time.strftime("[%D %H:%M:%S]:") + ' Checking if Samples uploaded successfully! ')
-                if self.samples_uploaded_successfully(samples):
-                    break
+            # Record the import's progress, so it can be resumed
+            self.journal = ImportJournal(
+                self.JOURNAL_FILE or ':memory:',
+                journal_key(self.GALAXY_URL, desired_lib_name, samples_dict),
+                resume=resume)
+            try:
+                samples = None
+                resolved = []
+                if resume:
+                    samples = self.journal.samples()
+                    if samples is None:
+                        resolved = self.journal.resolved_samples()
+                if samples is not None:
+                    self.print_logged('Resuming the import of {0} sample(s)'
+                                      .format(len(samples)))
+                    # The samples are already resolved, so there is nothing to
+                    # stream from IRIDA
+                    streaming = False
                 else:
-                    retries += 1
-
-            if addtohistory:
-                if make_paired_collection:
-                    collection_array = self.add_samples_to_history(samples, hist_id)
+                    if resolved:
+                        self.print_logged(
+                            'Resuming the import after {0} resolved sample(s)'
+                            .format(len(resolved)))
+                    self.token = token
+                    with self.metrics.phase('token exchange'):
+                        self.irida = self.get_IRIDA_session(oauth_dict)
+
+                self.connect_to_galaxy()
+
+                # Each sample contains a list of sample files. A streaming
+                # import resolves them while the library is being filled
+                if samples is None and not streaming:
+                    remaining = samples_dict[len(resolved):]
+                    with self.metrics.phase('sample resolution'):
+                        if irida_engine == 'pipelined':
+                            samples = resolved + self.get_samples_pipelined(
+                                remaining)
+                        else:
+                            samples = resolved + self.get_samples(remaining)
+                    self.journal.record_samples(samples)
+
+                # Fail before touching Galaxy if any file is missing. A
+                # streaming import checks each batch of samples as it is linked
+                if samples is not None:
+                    with self.metrics.phase('file checks'):
+                        self.check_sample_files(samples)
+
+                # Set up the library
+                with self.metrics.phase('library setup'):
+                    self.library = self.get_first_or_make_lib(desired_lib_name,
+                                                              email)
+                if addtohistory and incremental_history:
+                    self.incremental_history = IncrementalHistory(
+                        self, hist_id, self.logger).start()
+                try:
+                    with self.metrics.phase('library setup'):
+                        for folder_path in (self.ILLUMINA_PATH,
+                                            self.REFERENCE_PATH):
+                            if not self.journal.folder_ids([folder_path]):
+                                folder_id = self.create_folder_if_nec(
+                                    folder_path)
+                                self.journal.record_folders(
+                                    {folder_path: folder_id})
+
+                    # Add each sample's files to the library
+                    if streaming:
+                        # The stages overlap, so they are timed together
+                        with self.metrics.phase(
+                                'sample resolution, linking and verification'):
+                            samples, num_files, failed = StreamingImport(
+                                self, self.logger,
+                                self.incremental_history).run(samples_dict,
+                                                              resolved)
+                        self.journal.record_samples(samples)
+                    else:
+                        with self.metrics.phase('linking'):
+                            num_files = self.add_samples_if_nec(samples)
+                        if self.incremental_history is not None:
+                            self.incremental_history.add_samples(samples)
+
+                        self.logger.debug(
+                            time.strftime("[%D %H:%M:%S]:") +
+                            ' Checking if Samples uploaded successfully! ')
+                        with self.metrics.phase('verification'):
+                            failed = self.verify_sample_files(
+                                self.get_sample_files(samples))
+
+                    # Retry only the files that failed
+                    with self.metrics.phase('retrying'):
+                        self.failed_files_log = [
+                            {'galaxy_name': sample_file.galaxy_path}
+                            for sample_file in self.retry_sample_files(failed)]
+                except Exception:
+                    # The library may have changed in ways its known state
+                    # doesn't reflect, so read it again on the next import
+                    self.invalidate_library_state()
+                    if self.incremental_history is not None:
+                        self.incremental_history.stop()
+                    raise
+
+                if addtohistory:
+                    with self.metrics.phase('history population'):
+                        if self.incremental_history is not None:
+                            collection_array = self.incremental_history.finish(
+                                make_paired_collection)
+                        elif make_paired_collection:
+                            collection_array = self.add_samples_to_history(
+                                samples, hist_id)
+                        else:
+                            collection_array = self.add_samples_to_history(
+                                samples, hist_id, make_paired_collection=False)
                     self.print_logged("Samples added to history!")
-                    self.logger.debug("Collection items: \n" + self.pp.pformat(
-                        collection_array))
+                    if make_paired_collection:
+                        self.logger.debug("Collection items: \n" +
+                                          self.pp.pformat(collection_array))
                 else:
-                    collection_array = self.add_samples_to_history(
-                        samples, hist_id, make_paired_collection=False)
-                    self.print_logged("Samples added to history!")
-            else:
-                self.print_logged("Samples not added to history!")
+                    self.print_logged("Samples not added to history!")
 
-            self.logger.debug("Number of files on galaxy: " + str(num_files))
+                self.logger.debug("Number of files on galaxy: " +
+                                  str(num_files))
 
-            self.print_summary()
+                self.metrics.finish()
+                self.print_summary()
+                self.write_metrics(log)
+            finally:
+                self.journal.close()
 
 """
 From the command line, pass JSON files to IridaImport, and set up the logger
@@ -854,6 +2017,54 @@ if __name__ == '__main__':
     parser.add_argument(
         '-i', '--history-id', dest='hist_id', default=False,
         help='The tool requires a History ID.')
+    parser.add_argument(
+        '-e', '--irida-engine', dest='irida_engine', default='session',
+        choices=['session', 'pipelined'],
+        help='How samples are requested from IRIDA: through the OAuth2 '
+             + 'session one level of resources at a time, or through the '
+             + 'pipelined client.')
+    parser.add_argument(
+        '-s', '--streaming', action='store_true', default=False,
+        dest='streaming',
+        help='Link and verify each sample\'s files as soon as the sample '
+             + 'is resolved from IRIDA, instead of after every sample is '
+             + 'resolved.')
+    parser.add_argument(
+        '--incremental-history', action='store_true', default=False,
+        dest='incremental_history',
+        help='Add each sample\'s datasets to the history as soon as its '
+             + 'files are verified, instead of after every file is '
+             + 'verified.')
+    parser.add_argument(
+        '--plan', action='store_true', default=False, dest='plan',
+        help='Print what the import would do and how many requests it '
+             + 'would make to IRIDA and Galaxy, without changing the library '
+             + 'or the history. Needs --token, so that the OAuth2 code in '
+             + 'the parameter file is left for the import.')
+    parser.add_argument(
+        '-r', '--resume', action='store_true', default=False, dest='resume',
+        help='Continue an import from where an earlier run of it stopped, '
+             + 'as recorded in the journal_file set in config.ini.')
+    parser.add_argument(
+        '--profile', dest='profile', metavar='stats_file',
+        help='Profile the import, and write the profile to this file.')
+    parser.add_argument(
+        '--profile-mode', dest='profile_mode', default='deterministic',
+        choices=ImportProfiler.MODES,
+        help='deterministic: time every call of the main thread with '
+             + 'cProfile, for pstats to read. sampling: sample the stacks '
+             + 'of every thread at a fixed interval, and write them in the '
+             + 'collapsed format read by flame graph tools.')
+    parser.add_argument(
+        '--profile-interval', dest='profile_interval', type=float,
+        default=0.01, metavar='seconds',
+        help='The interval between stack samples in the sampling mode.')
+    parser.add_argument(
+        '--profile-memory', action='store_true', default=False,
+        dest='profile_memory',
+        help='Also take snapshots of the live objects by type every 10 '
+             + 'seconds, and write them to the stats file\'s path with '
+             + '.memory.json added.')
 
     args = parser.parse_args()
     if len(sys.argv) == 1:
@@ -879,12 +2090,31 @@ if __name__ == '__main__':
                        + ' directory!')
             logging.info(message)
             print(message)
+    elif args.plan:
+        if not args.token:
+            # Getting a token would use up the parameter file's OAuth2 code,
+            # which the import needs
+            parser.error('--plan needs an access token from --token')
+        importer.plan_import(args.json_parameter_file, token=args.token,
+                             irida_engine=args.irida_engine)
     else:
+        import_to_galaxy = importer.import_to_galaxy
+        if args.profile:
+            import_to_galaxy = ImportProfiler(
+                args.profile, mode=args.profile_mode,
+                interval=args.profile_interval,
+                memory=args.profile_memory).profiled(import_to_galaxy)
         try:
             file_to_open = args.json_parameter_file
-            importer.import_to_galaxy(file_to_open, args.log, args.hist_id,
-                                      token=args.token)
+            import_to_galaxy(file_to_open, args.log, args.hist_id,
+                             token=args.token,
+                             irida_engine=args.irida_engine,
+                             streaming=args.streaming,
+                             resume=args.resume,
+                             incremental_history=args.incremental_history)
         except Exception:
             logging.exception('')
+            importer.metrics.finish()
             importer.print_summary(failed=True)
+            importer.write_metrics(args.log)
             raise
@@ -0,0 +1,106 @@
+import threading
+import time
+
+from collections import OrderedDict
+
+
+class LibraryStateCache:
+
+    """
+    Known library states, kept so later imports in the same process can
+    reuse them.
+
+    States are stored by library, e.g. by Galaxy URL and library id. At most
+    max_libraries states are kept: the least recently used state is evicted
+    first. A state older than ttl seconds is discarded instead of being used.
+    """
+
+    def __init__(self, max_libraries=16, ttl=300, clock=time.time):
+        """
+        Create a library state cache.
+
+        :type max_libraries: int
+        :param max_libraries: the maximum number of library states to keep
+        :type ttl: float
+        :param ttl: the number of seconds a library state may be used for
+        after it was stored
+        :type clock: function
+        :param clock: returns the current time in seconds
+        """
+        self.max_libraries = max_libraries
+        self.ttl = ttl
+        self.clock = clock
+        self._entries = OrderedDict()  # key -> (time stored, state)
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def get(self, key):
+        """
+        Get a library's state.
+
+        :param key: the key of the library
+        :return: the library's state, or None if it is not cached or has
+        expired
+        """
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return None
+
+            stored, state = entry
+            if self.clock() - stored > self.ttl:
+                return None
+
+            # Move the library to the most recently used end
+            self._entries[key] = entry
+            return state
+
+    def put(self, key, state):
+        """
+        Store a library's state, evicting the least recently used libraries
+        if there are too many.
+
+        :param key: the key of the library
+        :param state: the library's state
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (self.clock(), state)
+            while len(self._entries) > max(self.max_libraries, 0):
+                self._entries.popitem(last=False)
+
+    def get_or_create(self, key, create):
+        """
+        Get a library's state, storing a new one if there is none.
+
+        :param key: the key of the library
+        :type create: function
+        :param create: returns a new state for the library
+        :return: the library's state
+        """
+        with self._lock:
+            state = self.get(key)
+            if state is None:
+                state = create()
+                self.put(key, state)
+            return state
+
+    def invalidate(self, key):
+        """
+        Discard a library's state, so it is read again when next used.
+
+        :param key: the key of the library
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """Discard every library's state"""
+        with self._lock:
+            self._entries.clear()
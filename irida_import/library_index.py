@@ -0,0 +1,169 @@
+import threading
+
+
+class LibraryIndex:
+
+    """
+    The known contents of a Galaxy library.
+
+    Folders and datasets are indexed by their type and name, where the name
+    is the item's full path in the library, e.g. '/illumina_reads/sample1'.
+    Several items may share a type and name. A dataset's size in bytes,
+    state and the id of its library dataset dataset association (LDDA) are
+    kept too, when the listing it came from included them.
+
+    An index may be changed by several threads at once, e.g. by the linking
+    and verification stages of a streaming import.
+    """
+
+    METADATA_KEYS = ('file_size', 'state', 'ldda_id')
+
+    def __init__(self, items=None):
+        """
+        Create a library index.
+
+        :type items: list
+        :param items: library content dicts with at least an 'id', 'type' and
+        'name', as listed by Galaxy
+        """
+        self._items = {}  # (type, name) -> list of item dicts
+        self._keys_by_id = {}  # id -> (type, name)
+        self.loaded = False
+        # The paths of folders whose contents are known
+        self.loaded_folders = set()
+        self.root_folder_id = None
+        self._lock = threading.RLock()
+
+        if items is not None:
+            self.load(items)
+
+    def __len__(self):
+        return len(self._keys_by_id)
+
+    def __iter__(self):
+        for items in self._items.values():
+            for item in items:
+                yield item
+
+    def load(self, items):
+        """
+        Add every item of a library contents listing, and mark the index as
+        loaded.
+
+        :type items: list
+        :param items: library content dicts
+        """
+        for item in items:
+            self.add(item)
+        self.loaded = True
+
+    def load_folder(self, folder_path, items):
+        """
+        Add every item of a folder contents listing, and mark the folder as
+        loaded.
+
+        :type folder_path: str
+        :param folder_path: the folder's path, or '' for the root folder
+        :type items: list
+        :param items: folder content dicts, named relative to the folder
+        """
+        with self._lock:
+            for item in items:
+                item = dict(item)
+                item['name'] = folder_path + '/' + item['name']
+                # Folder listings give a readable 'file_size' e.g. '1.2 KB',
+                # and the size in bytes as 'raw_size'
+                if 'raw_size' in item:
+                    item['file_size'] = item['raw_size']
+                elif not isinstance(item.get('file_size'), (int, long)):
+                    item.pop('file_size', None)
+                self.add(item)
+            self.loaded_folders.add(folder_path)
+
+    def folder_loaded(self, folder_path):
+        """
+        Find out if the contents of a folder are known.
+
+        :type folder_path: str
+        :param folder_path: the folder's path, or '' for the root folder
+        :return: True if the whole library or the folder has been loaded
+        """
+        return self.loaded or folder_path in self.loaded_folders
+
+    def add(self, item):
+        """
+        Add an item to the index, or update it if an item with the same id
+        is already indexed.
+
+        :type item: dict
+        :param item: a library content dict with at least an 'id', 'type' and
+        'name'
+        """
+        key = (item['type'], item['name'])
+        entry = {'id': item['id'], 'type': item['type'], 'name': item['name']}
+        for metadata_key in self.METADATA_KEYS:
+            if metadata_key in item:
+                entry[metadata_key] = item[metadata_key]
+
+        with self._lock:
+            if item['id'] in self._keys_by_id:
+                self.remove(item['id'])
+            self._items.setdefault(key, []).append(entry)
+            self._keys_by_id[item['id']] = key
+
+    def remove(self, item_id):
+        """
+        Remove an item from the index, if it is indexed.
+
+        :type item_id: str
+        :param item_id: the id of the item to remove
+        """
+        with self._lock:
+            key = self._keys_by_id.pop(item_id, None)
+            if key is not None:
+                items = [item for item in self._items[key]
+                         if item['id'] != item_id]
+                if items:
+                    self._items[key] = items
+                else:
+                    del self._items[key]
+
+    def get(self, item_type, name):
+        """
+        Get the items of a type with a name.
+
+        :type item_type: str
+        :param item_type: the item type e.g "folder" or "file"
+        :type name: str
+        :param name: the item's full path in the library
+        :return: a list of item dicts, in the order they were added
+        """
+        return list(self._items.get((item_type, name), []))
+
+    def find(self, item_id):
+        """
+        Get an item by its id.
+
+        :type item_id: str
+        :param item_id: the item's id
+        :return: the item dict, or None if it is not indexed
+        """
+        with self._lock:
+            key = self._keys_by_id.get(item_id)
+            if key is None:
+                return None
+            for item in self._items[key]:
+                if item['id'] == item_id:
+                    return item
+
+    def ids(self, item_type, name):
+        """
+        Get the ids of the items of a type with a name.
+
+        :type item_type: str
+        :param item_type: the item type e.g "folder" or "file"
+        :type name: str
+        :param name: the item's full path in the library
+        :return: a list of ids, in the order the items were added
+        """
+        return [item['id'] for item in self._items.get((item_type, name), [])]
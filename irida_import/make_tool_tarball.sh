@@ -1,5 +1,5 @@
 #!/bin/bash
 cp ../README.md README.md
 cp irida_import.xml.sample irida_import.xml
-tar -cvzf ../irida_import_tool.tar.gz README.md irida_import.xml irida_import.xml.sample config.ini.sample sample_file.py sample_pair.py sample.py tool_dependencies.xml irida_import.py 
+tar -cvzf ../irida_import_tool.tar.gz README.md irida_import.xml irida_import.xml.sample config.ini.sample import_journal.py import_metrics.py import_pipeline.py import_plan.py import_profiler.py irida_client.py library_cache.py library_index.py sample_file.py sample_pair.py sample.py tool_dependencies.xml verification.py wait_policy.py irida_import.py 
 rm README.md
@@ -1,7 +1,13 @@
-class Sample:
+from sample_pair import SamplePair
+
+
+class Sample(object):
 
     """A representation of a sample obtained from IRIDA"""
 
+    # Carts can hold many thousands of samples, so they have no __dict__
+    __slots__ = ('name', 'paired_path', 'unpaired_path', '_sample_reads')
+
     def __init__(self, name, paired_path, unpaired_path):
         """
         Initialize a sample instance
@@ -19,11 +25,10 @@ class Sample:
 
     def __repr__(self):
         num_files = 0
-        for item in self.get_files():
-            try:
-                for _file in item:
-                    num_files += 1
-            except TypeError:
+        for item in self.get_reads():
+            if isinstance(item, SamplePair):
+                num_files += 2
+            else:
                 num_files += 1
 
         return_string = self.name + ":\n"
@@ -1,7 +1,11 @@
-class SampleFile:
+class SampleFile(object):
 
     """A representation of a sample file obtained from IRIDA"""
 
+    # Carts can hold hundreds of thousands of files, so they have no __dict__
+    __slots__ = ('path', 'name', 'library_dataset_id', 'library_folder_id',
+                 'galaxy_path', 'verified', 'size', 'mtime')
+
     def __init__(self, name, path):
         """
         Create a sample file instance.
@@ -15,7 +19,12 @@ class SampleFile:
         self.path = path
         self.name = name
         self.library_dataset_id = None
+        self.library_folder_id = None
+        self.galaxy_path = None
         self.verified = False
+        # The local file's size and modification time, once it is statted
+        self.size = None
+        self.mtime = None
 
     def __eq__(self, sample_file):
         equal = False
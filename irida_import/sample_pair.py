@@ -1,7 +1,9 @@
-class SamplePair:
+class SamplePair(object):
 
     """A representation of a sample pair obtained from IRIDA"""
 
+    __slots__ = ('forward', 'reverse', 'name')
+
     def __init__(self, name, forward, reverse):
         """
         Create a sample file instance.
@@ -17,4 +19,5 @@ class SamplePair:
         self.name = name
 
     def __repr__(self):
-        return self.name + ": \npair -" + str(self.files)
+        return (self.name + ": \npair -" +
+                str([self.forward, self.reverse]))
@@ -0,0 +1,224 @@
+import gc
+import json
+import logging
+import multiprocessing
+import pytest
+import re
+import resource
+import time
+import traceback
+
+from ...irida_import import IridaImport
+from ...library_cache import LibraryStateCache
+from ...wait_policy import FixedWaitPolicy
+from ..galaxy_stub import StubGalaxyServer
+from ..irida_stub import StubIridaServer
+
+LIBRARY_NAME = 'Benchmark Library'
+EMAIL = 'bob@example.com'
+
+
+def configure(imp, galaxy_url):
+    """
+    Configure an importer the way config.ini.sample does, with lazy library
+    loading and split collections turned on
+    """
+    imp.ADMIN_KEY = 'benchmarkKey'
+    imp.GALAXY_URL = galaxy_url
+    imp.ILLUMINA_PATH = '/illumina_reads'
+    imp.REFERENCE_PATH = '/references'
+    imp.MAX_WAITS = 120
+    imp.MAX_RETRIES = 3
+    imp.GALAXY_MAX_CONCURRENT_REQUESTS = 4
+    imp.MAX_FILES_PER_LINK = 100
+    imp.MAX_PAIRS_PER_COLLECTION = 500
+    imp.MAX_CONCURRENT_FILE_STATS = 8
+    imp.wait_policy = FixedWaitPolicy(interval=0.1)
+    imp.MAX_CLIENT_ATTEMPTS = 1
+    imp.CLIENT_RETRY_DELAY = 1
+    imp.LAZY_LIBRARY_LOADING = True
+    imp.JOURNAL_FILE = None
+    imp.TOKEN_ENDPOINT = 'http://irida.invalid/api/oauth/token'
+    imp.CLIENT_ID = 'benchmarkClient'
+    imp.CLIENT_SECRET = 'benchmarkSecret'
+    imp.IRIDA_MAX_CONCURRENT_REQUESTS = 4
+
+
+def write_parameter_file(path, samples_dict):
+    """Write a parameter file like the one Galaxy passes the tool"""
+    json_params = {'_embedded': {
+        'samples': samples_dict,
+        'user': {'email': EMAIL},
+        'addtohistory': True,
+        'library': {'name': LIBRARY_NAME},
+        'oauth2': {'redirect': 'http://galaxy.invalid/redirect',
+                   'code': 'benchmarkCode'}
+    }}
+    with open(path, 'w') as param_file:
+        json.dump({'param_dict': {'json_params': json.dumps(json_params)}},
+                  param_file)
+
+
+def irida_endpoint(path):
+    """Group IRIDA request paths by endpoint, e.g. /api/samples/{id}/pairs"""
+    return re.sub(r'/\d+', '/{id}', path)
+
+
+@pytest.mark.benchmark
+class TestImportBenchmark:
+
+    """
+    Times whole imports against local stand-ins for IRIDA and Galaxy, and
+    reports the requests made to each endpoint and the peak memory used.
+
+    Each scenario runs in a process of its own, so its peak memory doesn't
+    depend on the scenarios run before it. The peak memory is that of the
+    whole process, stand-ins included, and how much it grew by during the
+    scenario is reported too.
+    """
+
+    @pytest.fixture(scope='function')
+    def file_dir(self, tmpdir):
+        return tmpdir.mkdir('sequence_files')
+
+    def run_import(self, *args, **kwargs):
+        """Run a scenario in a forked process, see run_scenario"""
+        receiver, sender = multiprocessing.Pipe(duplex=False)
+
+        def run():
+            error = None
+            try:
+                self.run_scenario(*args, **kwargs)
+            except BaseException:
+                error = traceback.format_exc()
+            sender.send(error)
+
+        scenario = multiprocessing.Process(target=run)
+        scenario.start()
+        error = receiver.recv()
+        scenario.join()
+        if error is not None:
+            pytest.fail(error)
+
+    def run_scenario(self, tmpdir, file_dir, num_samples, pairs_per_sample=1,
+                     singles_per_sample=1, latency=0, existing_files=0,
+                     pending_checks=0, slow_checks=0, runs=1,
+                     incremental_history=False, streaming=False,
+                     lazy_library_loading=True):
+        # A forked process's peak memory starts at its current memory
+        gc.collect()
+        start_memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        irida = StubIridaServer(num_samples, pairs_per_sample,
+                                singles_per_sample, latency,
+                                str(file_dir)).start()
+        galaxy = StubGalaxyServer(latency, pending_checks, EMAIL,
+                                  slow_checks=slow_checks).start()
+        try:
+            for file_path in irida.file_paths():
+                with open(file_path, 'w') as sequence_file:
+                    sequence_file.write('@read\nACGT\n+\nIIII\n')
+            library_id = galaxy.create_library(LIBRARY_NAME, existing_files)
+            history_id = galaxy.create_history()
+            param_path = str(tmpdir.join('param.json'))
+            write_parameter_file(param_path, irida.samples_dict())
+
+            imp = IridaImport()
+            def configure_import():
+                configure(imp, galaxy.url)
+                imp.LAZY_LIBRARY_LOADING = lazy_library_loading
+            imp.configure = configure_import
+            imp.library_cache = LibraryStateCache()
+            imp.logger = logging.getLogger('irida_import')
+            # Keep every imported file's line out of the benchmark report
+            imp.print_logged = imp.logger.info
+
+            # Only the last run is reported
+            for run in range(runs):
+                irida.request_counts.clear()
+                galaxy.request_counts.clear()
+                start = time.time()
+                imp.import_to_galaxy(param_path, None, history_id,
+                                     token=StubIridaServer.ACCESS_TOKEN,
+                                     incremental_history=incremental_history,
+                                     streaming=streaming)
+                wall_time = time.time() - start
+            peak_memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+            num_files = len(irida.file_paths())
+            assert len(galaxy.datasets(library_id)) == \
+                existing_files + num_files, 'Every file must be linked once'
+            history_datasets = [
+                content for content in galaxy.histories[history_id]
+                if content['history_content_type'] == 'dataset']
+            assert len(history_datasets) == num_files, \
+                'Every file must be added to the history once'
+
+            irida_counts = {}
+            for path, count in irida.request_counts.items():
+                endpoint = irida_endpoint(path)
+                irida_counts[endpoint] = irida_counts.get(endpoint, 0) + count
+            self.report(num_samples, num_files, wall_time, peak_memory,
+                        peak_memory - start_memory, imp.metrics.phases,
+                        irida_counts, galaxy.request_counts)
+        finally:
+            irida.stop()
+            galaxy.stop()
+
+    def report(self, num_samples, num_files, wall_time, peak_memory,
+               memory_growth, phases, irida_counts, galaxy_counts):
+        print('\n{0} samples, {1} files: {2:.2f}s, peak memory {3:.1f} MB '
+              '({4:.1f} MB more than before the scenario)'
+              .format(num_samples, num_files, wall_time,
+                      peak_memory / 1024.0, memory_growth / 1024.0))
+        for name, seconds in phases.items():
+            print('  {0}: {1:.2f}s'.format(name, seconds))
+        for name, counts in (('IRIDA', irida_counts),
+                             ('Galaxy', galaxy_counts)):
+            print('  {0} requests: {1}'.format(name, sum(counts.values())))
+            for endpoint in sorted(counts):
+                print('    {0}: {1}'.format(endpoint, counts[endpoint]))
+
+    def test_10_samples(self, tmpdir, file_dir):
+        self.run_import(tmpdir, file_dir, 10)
+
+    def test_10_samples_with_latency(self, tmpdir, file_dir):
+        """Every request to IRIDA and Galaxy takes 20ms"""
+        self.run_import(tmpdir, file_dir, 10, latency=0.02)
+
+    def test_10_samples_large_library(self, tmpdir, file_dir):
+        """The library already holds 20,000 unrelated datasets"""
+        self.run_import(tmpdir, file_dir, 10, existing_files=20000)
+
+    def test_10_samples_large_library_full_loading(self, tmpdir, file_dir):
+        """The library already holds 20,000 unrelated datasets, and is read
+        in full before importing"""
+        self.run_import(tmpdir, file_dir, 10, existing_files=20000,
+                        lazy_library_loading=False)
+
+    def test_10_samples_slow_processing(self, tmpdir, file_dir):
+        """Galaxy reports each dataset as queued three times"""
+        self.run_import(tmpdir, file_dir, 10, pending_checks=3)
+
+    def test_10_samples_streaming_one_slow_file(self, tmpdir, file_dir):
+        """Samples are streamed, and one dataset is queued 20 times"""
+        self.run_import(tmpdir, file_dir, 10, slow_checks=20, streaming=True,
+                        incremental_history=True)
+
+    def test_10_samples_rerun(self, tmpdir, file_dir):
+        """The same cart is imported to the same history twice"""
+        self.run_import(tmpdir, file_dir, 10, runs=2)
+
+    def test_1000_samples(self, tmpdir, file_dir):
+        self.run_import(tmpdir, file_dir, 1000)
+
+    def test_1000_samples_one_slow_file(self, tmpdir, file_dir):
+        """Galaxy reports one dataset as queued 100 times"""
+        self.run_import(tmpdir, file_dir, 1000, slow_checks=100)
+
+    def test_1000_samples_one_slow_file_incremental(self, tmpdir, file_dir):
+        """As above, adding each sample to the history once verified"""
+        self.run_import(tmpdir, file_dir, 1000, slow_checks=100,
+                        incremental_history=True)
+
+    def test_10000_samples(self, tmpdir, file_dir):
+        self.run_import(tmpdir, file_dir, 10000)
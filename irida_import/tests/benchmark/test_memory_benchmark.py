@@ -0,0 +1,134 @@
+import gc
+import json
+import logging
+import pytest
+import resource
+import sys
+import time
+
+from ...irida_import import IridaImport
+from ...sample_file import SampleFile
+
+IRIDA_URL = 'http://irida.invalid'
+PAIRS_PER_SAMPLE = 1
+SINGLES_PER_SAMPLE = 2
+FILES_PER_SAMPLE = PAIRS_PER_SAMPLE * 2 + SINGLES_PER_SAMPLE
+
+
+class DictSampleFile:
+
+    """A sample file with a per-instance __dict__, as before __slots__"""
+
+    def __init__(self, name, path):
+        self.path = path
+        self.name = name
+        self.library_dataset_id = None
+        self.library_folder_id = None
+        self.galaxy_path = None
+        self.verified = False
+
+
+def file_resource(sample_num, file_num):
+    return {
+        'fileName': 'sample%d_file%d.fastq' % (sample_num, file_num),
+        'file': '/imaginary/path/sample%d_file%d.fastq' % (sample_num,
+                                                           file_num),
+        'links': [{'rel': 'self',
+                   'href': '%s/api/samples/%d/sequenceFiles/%d' % (
+                       IRIDA_URL, sample_num, file_num)}]
+    }
+
+
+def irida_resource(request_url):
+    """Make the resource IRIDA would send for a URL, as parsed JSON"""
+    parts = request_url[len(IRIDA_URL):].split('/')
+    sample_num = int(parts[3])
+    sample_url = '%s/api/samples/%d' % (IRIDA_URL, sample_num)
+    if len(parts) == 4:
+        resource = {'links': [
+            {'rel': 'sample/sequenceFiles/pairs', 'href': sample_url + '/pairs'},
+            {'rel': 'sample/sequenceFiles/unpaired',
+             'href': sample_url + '/unpaired'}]}
+    elif parts[4] == 'pairs':
+        pairs = []
+        for pair_num in range(PAIRS_PER_SAMPLE):
+            files = [file_resource(sample_num, pair_num * 2),
+                     file_resource(sample_num, pair_num * 2 + 1)]
+            pairs.append({
+                'identifier': pair_num,
+                'links': [
+                    {'rel': 'pair/forward',
+                     'href': files[0]['links'][0]['href']},
+                    {'rel': 'pair/reverse',
+                     'href': files[1]['links'][0]['href']}],
+                'files': files})
+        resource = {'resources': pairs}
+    else:
+        resource = {'resources': [
+            {'sequenceFile': file_resource(sample_num,
+                                           PAIRS_PER_SAMPLE * 2 + single_num)}
+            for single_num in range(SINGLES_PER_SAMPLE)]}
+    # Each response is parsed anew, so nothing is shared between samples
+    return json.loads(json.dumps(resource))
+
+
+def graph_size(root):
+    """Get the bytes used by the objects reachable from root"""
+    seen = set()
+    size = 0
+    pending = [root]
+    while pending:
+        obj = pending.pop()
+        if id(obj) in seen or isinstance(obj, type):
+            continue
+        seen.add(id(obj))
+        size += sys.getsizeof(obj)
+        pending.extend(gc.get_referents(obj))
+    return size
+
+
+@pytest.mark.benchmark
+class TestMemoryBenchmark:
+
+    """
+    Measures the memory used by the samples of a synthetic 100,000 file
+    cart, resolved from IRIDA resources made in process.
+    """
+
+    def test_100k_files(self):
+        num_samples = 100000 // FILES_PER_SAMPLE
+        samples_dict = [{
+            'name': 'sample%d' % sample_num,
+            '_embedded': {'sample_files': [{'_links': {'self': {
+                'href': '%s/api/samples/%d' % (IRIDA_URL, sample_num)}}}]}
+        } for sample_num in range(num_samples)]
+
+        imp = IridaImport()
+        imp.logger = logging.getLogger('irida_import')
+        imp.IRIDA_MAX_CONCURRENT_REQUESTS = 1
+        imp.make_irida_request = irida_resource
+
+        gc.collect()
+        start_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        start = time.time()
+        samples = imp.get_samples(samples_dict)
+        wall_time = time.time() - start
+        peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+        num_files = len(imp.get_sample_files(samples))
+        assert num_files == num_samples * FILES_PER_SAMPLE
+
+        samples_size = graph_size(samples)
+        file_size = sys.getsizeof(SampleFile('name', 'path'))
+        dict_file = DictSampleFile('name', 'path')
+        dict_file_size = (sys.getsizeof(dict_file) +
+                          sys.getsizeof(dict_file.__dict__))
+        print('\n{0} samples, {1} files resolved in {2:.2f}s'.format(
+            num_samples, num_files, wall_time))
+        print('  samples: {0:.1f} MB ({1:.0f} bytes per file)'.format(
+            samples_size / 1048576.0, samples_size / float(num_files)))
+        print('  a SampleFile without its strings: {0} bytes, '
+              'with a __dict__: {1} bytes'.format(file_size, dict_file_size))
+        print('  peak memory: {0:.1f} MB, {1:.1f} MB more than before '
+              'resolving'.format(peak_rss / 1024.0,
+                                 (peak_rss - start_rss) / 1024.0))
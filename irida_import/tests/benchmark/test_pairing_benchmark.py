@@ -0,0 +1,113 @@
+import logging
+import pytest
+import timeit
+
+from ...irida_import import IridaImport
+from ...sample import Sample
+from ...sample_pair import SamplePair
+
+
+def scan_pairs(imp, sample, paired_resource):
+    """Pair files the way get_samples did before indexing the pairs"""
+    for pair in paired_resource['resources']:
+        pair_name = str(pair['identifier'])
+        for link in pair['links']:
+            temp_link = dict()
+            temp_link['rel'] = "self"
+            temp_link["href"] = link['href']
+
+            for curr_file in pair['files']:
+                if temp_link in curr_file['links']:
+                    if link['rel'] == "pair/forward":
+                        forward = imp.get_sample_file(curr_file)
+                    elif link['rel'] == "pair/reverse":
+                        reverse = imp.get_sample_file(curr_file)
+
+        sample.add_pair(SamplePair(pair_name, forward, reverse))
+
+
+def make_file(file_num, num_links=3):
+    href = 'http://irida/api/sequenceFiles/%d' % file_num
+    links = [{'rel': 'sequenceFile/link%d' % link_num,
+              'href': '%s/link%d' % (href, link_num)}
+             for link_num in range(num_links - 1)]
+    return {
+        'fileName': 'file%d.fastq' % file_num,
+        'file': '/imaginary/path/file%d.fastq' % file_num,
+        'links': links + [{'rel': 'self', 'href': href}]
+    }
+
+
+def make_pair(pair_num, files):
+    return {
+        'identifier': pair_num,
+        'links': [
+            {'rel': 'self',
+             'href': 'http://irida/api/pairs/%d' % pair_num},
+            {'rel': 'pair/forward',
+             'href': files[0]['links'][-1]['href']},
+            {'rel': 'pair/reverse',
+             'href': files[-1]['links'][-1]['href']}
+        ],
+        'files': files
+    }
+
+
+@pytest.mark.benchmark
+class TestPairingBenchmark:
+
+    """Compares indexed pairing in get_samples to scanning every file"""
+
+    REPEATS = 3
+
+    @pytest.fixture(scope='function')
+    def imp(self):
+        imp = IridaImport()
+        imp.logger = logging.getLogger('irida_import')
+        return imp
+
+    def compare(self, imp, name, paired_resource):
+        def scanned():
+            scan_pairs(imp, Sample('sample', '', ''), paired_resource)
+
+        def indexed():
+            imp.add_sample_reads(Sample('sample', '', ''), paired_resource,
+                                 {'resources': []})
+
+        scan_time = min(timeit.repeat(scanned, number=1, repeat=self.REPEATS))
+        index_time = min(timeit.repeat(indexed, number=1,
+                                       repeat=self.REPEATS))
+        print('\n{0}: scanned {1:.4f}s, indexed {2:.4f}s ({3:.1f}x)'.format(
+            name, scan_time, index_time, scan_time / max(index_time, 1e-9)))
+
+        scanned_sample = Sample('sample', '', '')
+        scan_pairs(imp, scanned_sample, paired_resource)
+        indexed_sample = Sample('sample', '', '')
+        imp.add_sample_reads(indexed_sample, paired_resource,
+                             {'resources': []})
+        assert [(pair.forward.path, pair.reverse.path)
+                for pair in scanned_sample.get_reads()] == \
+            [(pair.forward.path, pair.reverse.path)
+             for pair in indexed_sample.get_reads()]
+
+    def test_many_pairs(self, imp):
+        """5,000 pairs of two files with three links each"""
+        pairs = [make_pair(pair_num, [make_file(pair_num * 2),
+                                      make_file(pair_num * 2 + 1)])
+                 for pair_num in range(5000)]
+        self.compare(imp, '5,000 pairs', {'resources': pairs})
+
+    def test_many_links(self, imp):
+        """2,000 pairs of two files with twenty links each"""
+        pairs = [make_pair(pair_num, [make_file(pair_num * 2, 20),
+                                      make_file(pair_num * 2 + 1, 20)])
+                 for pair_num in range(2000)]
+        self.compare(imp, '2,000 pairs with 20 links per file',
+                     {'resources': pairs})
+
+    def test_large_pairs(self, imp):
+        """20 pairs that each list 2,000 files"""
+        pairs = [make_pair(pair_num, [make_file(pair_num * 2000 + file_num)
+                                      for file_num in range(2000)])
+                 for pair_num in range(20)]
+        self.compare(imp, '20 pairs of 2,000 files', {'resources': pairs})
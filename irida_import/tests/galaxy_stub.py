@@ -0,0 +1,333 @@
+import BaseHTTPServer
+import json
+import os.path
+import re
+import threading
+import time
+import urlparse
+
+from .irida_stub import _ThreadedHTTPServer
+
+
+class StubGalaxyServer:
+
+    """
+    A local stand-in for the parts of the Galaxy library and history API used
+    by the tool.
+
+    Libraries, folders, datasets and histories are kept in memory. Linked
+    datasets take the size of their local file, and are reported as queued
+    for a number of state checks before they are 'ok'.
+    """
+
+    # Request counts are kept by method and route, e.g.
+    # 'GET /api/folders/{id}/contents'
+    ROUTES = [
+        ('GET', '/api/libraries', '_api_list_libraries'),
+        ('POST', '/api/libraries', '_api_create_library'),
+        ('GET', '/api/libraries/{id}', '_api_show_library'),
+        ('GET', '/api/libraries/{id}/contents', '_api_library_contents'),
+        ('POST', '/api/libraries/{id}/contents', '_api_add_library_contents'),
+        ('GET', '/api/libraries/{id}/contents/{id}',
+         '_api_show_library_item'),
+        ('DELETE', '/api/libraries/{id}/contents/{id}',
+         '_api_delete_library_item'),
+        ('POST', '/api/libraries/{id}/permissions', '_api_set_permissions'),
+        ('GET', '/api/folders/{id}/contents', '_api_folder_contents'),
+        ('GET', '/api/roles', '_api_list_roles'),
+        ('GET', '/api/version', '_api_version'),
+        ('GET', '/api/histories/{id}/contents', '_api_history_contents'),
+        ('POST', '/api/histories/{id}/contents', '_api_add_history_contents'),
+        ('PUT', '/api/histories/{id}/contents/{id}',
+         '_api_update_history_item'),
+    ]
+
+    def __init__(self, latency=0, pending_checks=0, email='bob@example.com',
+                 version='16.01', slow_checks=0):
+        """
+        Create a stub Galaxy server. It is not started until start() is
+        called.
+
+        :type latency: float
+        :param latency: seconds to wait before answering each request
+        :type pending_checks: int
+        :param pending_checks: how many times a linked dataset's state is
+        reported as 'queued' before it is 'ok'
+        :type email: str
+        :param email: the email of the only user, whose role may own
+        libraries
+        :type version: str
+        :param version: the Galaxy release to report
+        :type slow_checks: int
+        :param slow_checks: how many times the first linked dataset's state
+        is reported as 'queued' instead, if set
+        """
+        self.latency = latency
+        self.pending_checks = pending_checks
+        self.email = email
+        self.version = version
+        self.slow_checks = slow_checks
+        self.linked = 0
+        self.request_counts = {}
+        self.lock = threading.RLock()
+        self.libraries = {}
+        self.items = {}  # library items by id
+        self.children = {}  # ids of library items by their folder's id
+        self.histories = {}
+        self.history_items = {}  # history contents by id
+        self.server = None
+        self._next_id = 0
+        self._routes = [
+            (method, re.compile('^' + route.replace('{id}', '([^/]+)') + '$'),
+             method + ' ' + route, getattr(self, handler))
+            for method, route, handler in self.ROUTES]
+
+    def start(self):
+        """Start serving on a free local port"""
+        stub = self
+
+        class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                stub.handle(self)
+
+            def do_POST(self):
+                stub.handle(self)
+
+            def do_PUT(self):
+                stub.handle(self)
+
+            def do_DELETE(self):
+                stub.handle(self)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = _ThreadedHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = 'http://127.0.0.1:%d' % self.server.server_address[1]
+
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return self
+
+    def stop(self):
+        """Stop serving"""
+        self.server.shutdown()
+        self.server.server_close()
+
+    def create_library(self, name, existing_files=0, files_per_folder=100):
+        """
+        Create a library, optionally filled with datasets that are not part
+        of any import.
+
+        :type name: str
+        :param name: the name of the library
+        :type existing_files: int
+        :param existing_files: the number of datasets to fill it with
+        :type files_per_folder: int
+        :param files_per_folder: how many of those datasets share a folder
+        :return: the library's id
+        """
+        with self.lock:
+            library_id = self._new_id('L')
+            root = self._add_item(library_id, 'folder', '/', None)
+            self.libraries[library_id] = {
+                'id': library_id, 'name': name, 'deleted': False,
+                'root_folder_id': root['id']}
+
+            if existing_files:
+                existing = self._add_item(library_id, 'folder', '/existing',
+                                          root['id'])
+            for file_num in range(existing_files):
+                if file_num % files_per_folder == 0:
+                    folder = self._add_item(
+                        library_id, 'folder',
+                        '/existing/folder%d' % (file_num // files_per_folder),
+                        existing['id'])
+                dataset = self._add_item(
+                    library_id, 'file',
+                    '%s/file%d.fastq' % (folder['name'], file_num),
+                    folder['id'])
+                dataset['file_size'] = 1
+            return library_id
+
+    def create_history(self):
+        """Create a history, and get its id"""
+        with self.lock:
+            history_id = self._new_id('H')
+            self.histories[history_id] = []
+            return history_id
+
+    def datasets(self, library_id):
+        """Get the datasets in a library"""
+        with self.lock:
+            return [item for item in self.items.values()
+                    if item['library_id'] == library_id and
+                    item['type'] == 'file']
+
+    def handle(self, request):
+        if self.latency:
+            time.sleep(self.latency)
+
+        url = urlparse.urlparse(request.path)
+        length = int(request.headers.get('Content-Length') or 0)
+        body = request.rfile.read(length) if length else ''
+        payload = json.loads(body) if body else {}
+        params = dict(urlparse.parse_qsl(url.query))
+
+        for method, pattern, name, handler in self._routes:
+            match = pattern.match(url.path)
+            if method == request.command and match:
+                with self.lock:
+                    self.request_counts[name] = (
+                        self.request_counts.get(name, 0) + 1)
+                    response = handler(payload, params, *match.groups())
+                self._respond(request, 200, response)
+                return
+
+        self._respond(request, 404, {'err_msg': 'not found'})
+
+    def _respond(self, request, status, body):
+        content = json.dumps(body)
+        request.send_response(status)
+        request.send_header('Content-Type', 'application/json')
+        request.send_header('Content-Length', str(len(content)))
+        request.end_headers()
+        request.wfile.write(content)
+
+    def _new_id(self, prefix):
+        self._next_id += 1
+        return '%s%d' % (prefix, self._next_id)
+
+    def _add_item(self, library_id, item_type, name, parent_id):
+        item = {'id': self._new_id('F' if item_type == 'folder' else 'D'),
+                'library_id': library_id, 'type': item_type, 'name': name,
+                'parent_id': parent_id}
+        if item_type == 'file':
+            item['ldda_id'] = self._new_id('L')
+        self.items[item['id']] = item
+        self.children.setdefault(parent_id, []).append(item['id'])
+        return item
+
+    def _state(self, item):
+        """Report a dataset's state, counting down its pending checks"""
+        if item.get('pending', 0) > 0:
+            item['pending'] -= 1
+            return 'queued'
+        return 'ok'
+
+    def _summary(self, item):
+        return {'id': item['id'], 'name': item['name'], 'type': item['type'],
+                'url': '/api/libraries/%s/contents/%s' % (item['library_id'],
+                                                          item['id'])}
+
+    def _dataset_details(self, item):
+        return {'id': item['id'], 'name': os.path.basename(item['name']),
+                'file_size': item['file_size'], 'state': self._state(item),
+                'ldda_id': item['ldda_id']}
+
+    def _api_list_libraries(self, payload, params):
+        return [dict(library) for library in self.libraries.values()]
+
+    def _api_create_library(self, payload, params):
+        library_id = self.create_library(payload['name'])
+        return {'id': library_id, 'name': payload['name']}
+
+    def _api_show_library(self, payload, params, library_id):
+        return dict(self.libraries[library_id])
+
+    def _api_library_contents(self, payload, params, library_id):
+        return [self._summary(item) for item in self.items.values()
+                if item['library_id'] == library_id]
+
+    def _api_add_library_contents(self, payload, params, library_id):
+        folder_id = (payload.get('folder_id') or
+                     self.libraries[library_id]['root_folder_id'])
+        folder_name = self.items[folder_id]['name'].rstrip('/')
+
+        if payload['create_type'] == 'folder':
+            folder = self._add_item(library_id, 'folder',
+                                    folder_name + '/' + payload['name'],
+                                    folder_id)
+            summary = self._summary(folder)
+            summary['name'] = payload['name']
+            return [summary]
+
+        added = []
+        for file_path in payload['filesystem_paths'].split('\n'):
+            dataset = self._add_item(
+                library_id, 'file',
+                folder_name + '/' + os.path.basename(file_path), folder_id)
+            dataset['file_size'] = os.path.getsize(file_path)
+            dataset['pending'] = self.pending_checks
+            if self.slow_checks and not self.linked:
+                dataset['pending'] = self.slow_checks
+            self.linked += 1
+            summary = self._summary(dataset)
+            summary['name'] = os.path.basename(file_path)
+            added.append(summary)
+        return added
+
+    def _api_show_library_item(self, payload, params, library_id, item_id):
+        return self._dataset_details(self.items[item_id])
+
+    def _api_delete_library_item(self, payload, params, library_id, item_id):
+        item = self.items.pop(item_id, None)
+        if item is not None:
+            self.children[item['parent_id']].remove(item_id)
+        return {'id': item_id, 'deleted': True}
+
+    def _api_set_permissions(self, payload, params, library_id):
+        return {'id': library_id}
+
+    def _api_folder_contents(self, payload, params, folder_id):
+        contents = []
+        for item_id in self.children.get(folder_id, []):
+            item = self.items[item_id]
+            entry = {'id': item['id'], 'type': item['type'],
+                     'name': os.path.basename(item['name'])}
+            if item['type'] == 'file':
+                entry['raw_size'] = item['file_size']
+                entry['file_size'] = '%d bytes' % item['file_size']
+                entry['state'] = self._state(item)
+                entry['ldda_id'] = item['ldda_id']
+            contents.append(entry)
+        return {'folder_contents': contents, 'metadata': {}}
+
+    def _api_list_roles(self, payload, params):
+        return [{'id': 'R1', 'name': self.email}]
+
+    def _api_version(self, payload, params):
+        return {'version_major': self.version, 'extra': {}}
+
+    def _api_history_contents(self, payload, params, history_id):
+        return list(self.histories[history_id])
+
+    def _api_add_history_contents(self, payload, params, history_id):
+        if payload.get('type') == 'dataset_collection':
+            content = {'id': self._new_id('C'), 'name': payload['name'],
+                       'history_content_type': 'dataset_collection'}
+            if payload.get('hide_source_items'):
+                self._hide_elements(payload['element_identifiers'])
+        else:
+            content = {'id': self._new_id('HDA'),
+                       'history_content_type': 'dataset',
+                       'visible': True, 'deleted': False, 'state': 'ok',
+                       'copied_from_ldda_id':
+                       self.items[payload['content']]['ldda_id']}
+        self.histories[history_id].append(content)
+        self.history_items[content['id']] = content
+        return content
+
+    def _hide_elements(self, element_identifiers):
+        for element in element_identifiers:
+            if element.get('src') == 'hda':
+                self.history_items[element['id']]['visible'] = False
+            else:
+                self._hide_elements(element.get('element_identifiers', []))
+
+    def _api_update_history_item(self, payload, params, history_id, item_id):
+        content = self.history_items.get(item_id, {})
+        content.update(payload)
+        return content
@@ -0,0 +1,172 @@
+import BaseHTTPServer
+import json
+import SocketServer
+import threading
+import time
+import urlparse
+
+
+class StubIridaServer:
+
+    """
+    A local stand-in for the parts of the IRIDA REST API used by the tool.
+
+    Serves a project of generated samples. Each sample has a sample resource
+    linking to its pairs and unpaired resources.
+    """
+
+    ACCESS_TOKEN = 'stubToken'
+
+    def __init__(self, num_samples=1, pairs_per_sample=1, singles_per_sample=1,
+                 latency=0, file_dir='/imaginary/path'):
+        """
+        Create a stub IRIDA server. It is not started until start() is called.
+
+        :type num_samples: int
+        :param num_samples: the number of samples in the project
+        :type pairs_per_sample: int
+        :param pairs_per_sample: the number of pairs each sample has
+        :type singles_per_sample: int
+        :param singles_per_sample: the number of single end files each
+        sample has
+        :type latency: float
+        :param latency: seconds to wait before answering each request
+        :type file_dir: str
+        :param file_dir: the local directory the sequence files are in
+        """
+        self.num_samples = num_samples
+        self.pairs_per_sample = pairs_per_sample
+        self.singles_per_sample = singles_per_sample
+        self.latency = latency
+        self.file_dir = file_dir
+        self.request_counts = {}
+        self.lock = threading.Lock()
+        self.resources = {}
+        self.server = None
+
+    def start(self):
+        """Start serving on a free local port"""
+        stub = self
+
+        class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                stub.handle(self)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = _ThreadedHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = 'http://127.0.0.1:%d' % self.server.server_address[1]
+        self._make_resources()
+
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return self
+
+    def stop(self):
+        """Stop serving"""
+        self.server.shutdown()
+        self.server.server_close()
+
+    def sample_url(self, sample_num):
+        return '%s/api/samples/%d' % (self.url, sample_num)
+
+    def samples_dict(self):
+        """The samples as Galaxy passes them to the tool"""
+        return [{
+            'name': 'sample%d' % sample_num,
+            '_links': {'self': {'href': ''}},
+            '_embedded': {'sample_files': [
+                {'_links': {'self': {'href': self.sample_url(sample_num)}}}]}
+        } for sample_num in range(self.num_samples)]
+
+    def file_paths(self):
+        """The local paths of every sequence file in the project"""
+        paths = []
+        for sample_num in range(self.num_samples):
+            for file_num in range(self.pairs_per_sample * 2 +
+                                  self.singles_per_sample):
+                paths.append(self._file_path(sample_num, file_num))
+        return paths
+
+    def handle(self, request):
+        if self.latency:
+            time.sleep(self.latency)
+
+        path = urlparse.urlparse(request.path).path
+        with self.lock:
+            self.request_counts[path] = self.request_counts.get(path, 0) + 1
+
+        expected = 'Bearer ' + self.ACCESS_TOKEN
+        if request.headers.get('Authorization') != expected:
+            self._respond(request, 401, {'error': 'unauthorized'})
+        elif path in self.resources:
+            self._respond(request, 200, {'resource': self.resources[path]})
+        else:
+            self._respond(request, 404, {'error': 'not found'})
+
+    def _respond(self, request, status, body):
+        content = json.dumps(body)
+        request.send_response(status)
+        request.send_header('Content-Type', 'application/json')
+        request.send_header('Content-Length', str(len(content)))
+        request.end_headers()
+        request.wfile.write(content)
+
+    def _file_path(self, sample_num, file_num):
+        return '%s/sample%d_file%d.fastq' % (self.file_dir, sample_num,
+                                             file_num)
+
+    def _file_resource(self, sample_num, file_num):
+        return {
+            'fileName': 'sample%d_file%d.fastq' % (sample_num, file_num),
+            'file': self._file_path(sample_num, file_num),
+            'links': [{
+                'rel': 'self',
+                'href': '%s/api/samples/%d/sequenceFiles/%d' % (
+                    self.url, sample_num, file_num)
+            }]
+        }
+
+    def _make_resources(self):
+        for sample_num in range(self.num_samples):
+            sample_path = '/api/samples/%d' % sample_num
+            self.resources[sample_path] = {'links': [{
+                'rel': 'sample/sequenceFiles/pairs',
+                'href': self.url + sample_path + '/pairs'
+            }, {
+                'rel': 'sample/sequenceFiles/unpaired',
+                'href': self.url + sample_path + '/unpaired'
+            }]}
+
+            pairs = []
+            for pair_num in range(self.pairs_per_sample):
+                forward = self._file_resource(sample_num, pair_num * 2)
+                reverse = self._file_resource(sample_num, pair_num * 2 + 1)
+                pairs.append({
+                    'identifier': pair_num,
+                    'links': [
+                        {'rel': 'self', 'href': '%s/api/samples/%d/pairs/%d'
+                         % (self.url, sample_num, pair_num)},
+                        {'rel': 'pair/forward',
+                         'href': forward['links'][0]['href']},
+                        {'rel': 'pair/reverse',
+                         'href': reverse['links'][0]['href']}
+                    ],
+                    'files': [forward, reverse]
+                })
+            self.resources[sample_path + '/pairs'] = {'resources': pairs}
+
+            singles = []
+            for single_num in range(self.singles_per_sample):
+                file_num = self.pairs_per_sample * 2 + single_num
+                singles.append({'sequenceFile':
+                                self._file_resource(sample_num, file_num)})
+            self.resources[sample_path + '/unpaired'] = {'resources': singles}
+
+
+class _ThreadedHTTPServer(SocketServer.ThreadingMixIn,
+                          BaseHTTPServer.HTTPServer):
+    daemon_threads = True
@@ -0,0 +1,118 @@
+import pytest
+
+from ...import_journal import ImportJournal, journal_key
+from ...sample import Sample
+from ...sample_file import SampleFile
+from ...sample_pair import SamplePair
+
+
+@pytest.mark.unit
+class TestImportJournal:
+
+    """ TestImportJournal performs unit tests on ImportJournal."""
+
+    @pytest.fixture(scope='function')
+    def journal_path(self, tmpdir):
+        return str(tmpdir.join('journal.sqlite'))
+
+    def make_sample(self):
+        sample = Sample('sample1', 'http://irida/pairs', 'http://irida/unpaired')
+        sample.add_pair(SamplePair('pair1',
+                                   SampleFile('f.fastq', '/data/f.fastq'),
+                                   SampleFile('r.fastq', '/data/r.fastq')))
+        sample.add_file(SampleFile('s.fastq', '/data/s.fastq'))
+        return sample
+
+    def linked_file(self):
+        sample_file = SampleFile('s.fastq', '/data/s.fastq')
+        sample_file.galaxy_path = '/illumina_reads/sample1/s.fastq'
+        sample_file.library_dataset_id = 'D1'
+        sample_file.library_folder_id = 'F1'
+        sample_file.verified = True
+        return sample_file
+
+    def test_journal_key(self):
+        """Test imports of the same samples to the same library share a key"""
+        samples = [{'name': 'sample1', 'id': 1}]
+        key = journal_key('http://galaxy', 'lib', samples)
+
+        assert key == journal_key('http://galaxy', 'lib',
+                                  [{'id': 1, 'name': 'sample1'}])
+        assert key != journal_key('http://galaxy', 'other lib', samples)
+        assert key != journal_key('http://galaxy', 'lib', [])
+
+    def test_resume(self, journal_path):
+        """Test everything recorded is restored when resuming"""
+        journal = ImportJournal(journal_path, 'key')
+        journal.record_samples([self.make_sample()])
+        journal.record_folders({'/illumina_reads/sample1': 'F1'})
+        journal.record_files([self.linked_file()])
+        journal.close()
+
+        journal = ImportJournal(journal_path, 'key', resume=True)
+        samples = journal.samples()
+        restored = SampleFile('s.fastq', '/data/s.fastq')
+
+        assert len(samples) == 1
+        assert samples[0].name == 'sample1'
+        assert samples[0].unpaired_path == 'http://irida/unpaired'
+        pair, single = samples[0].get_reads()
+        assert (pair.name, pair.forward.path, pair.reverse.path) == \
+            ('pair1', '/data/f.fastq', '/data/r.fastq')
+        assert single.path == '/data/s.fastq'
+        assert journal.folder_ids(['/illumina_reads/sample1', '/other']) == \
+            {'/illumina_reads/sample1': 'F1'}
+        assert journal.restore_file(restored,
+                                    '/illumina_reads/sample1/s.fastq')
+        assert (restored.library_dataset_id, restored.library_folder_id,
+                restored.verified) == ('D1', 'F1', True)
+
+    def test_start_again(self, journal_path):
+        """Test what was recorded is discarded when not resuming"""
+        journal = ImportJournal(journal_path, 'key')
+        journal.record_samples([self.make_sample()])
+        journal.record_folders({'/illumina_reads/sample1': 'F1'})
+        journal.record_files([self.linked_file()])
+        other = ImportJournal(journal_path, 'other key')
+        other.record_folders({'/illumina_reads/sample2': 'F2'})
+        journal.close()
+        other.close()
+
+        journal = ImportJournal(journal_path, 'key')
+
+        assert journal.samples() is None
+        assert journal.folder_ids(['/illumina_reads/sample1']) == {}
+        assert not journal.restore_file(SampleFile('s.fastq', '/data/s.fastq'),
+                                        '/illumina_reads/sample1/s.fastq')
+        assert ImportJournal(journal_path, 'other key', resume=True) \
+            .folder_ids(['/illumina_reads/sample2']) == \
+            {'/illumina_reads/sample2': 'F2'}
+
+    def test_resume_partly_resolved(self, journal_path):
+        """Test samples added as they are resolved are resumed from, but
+        are not taken as every sample until they all are recorded"""
+        journal = ImportJournal(journal_path, 'key')
+        journal.add_samples([self.make_sample()])
+        journal.close()
+
+        journal = ImportJournal(journal_path, 'key', resume=True)
+        assert journal.samples() is None
+        resolved = journal.resolved_samples()
+        assert [sample.name for sample in resolved] == ['sample1']
+
+        second = self.make_sample()
+        second.name = 'sample2'
+        journal.record_samples(resolved + [second])
+        assert [sample.name for sample in journal.samples()] == \
+            ['sample1', 'sample2']
+
+    def test_deleted_file_not_restored(self):
+        """Test a file whose dataset was deleted is not restored"""
+        journal = ImportJournal(':memory:', 'key')
+        deleted = self.linked_file()
+        deleted.library_dataset_id = None
+        deleted.verified = False
+        journal.record_files([deleted])
+
+        assert not journal.restore_file(SampleFile('s.fastq', '/data/s.fastq'),
+                                        '/illumina_reads/sample1/s.fastq')
@@ -0,0 +1,103 @@
+import json
+import pytest
+
+from mock import Mock
+from ...import_metrics import ImportMetrics, endpoint
+
+
+@pytest.mark.unit
+class TestImportMetrics:
+
+    """ TestImportMetrics performs unit tests on ImportMetrics."""
+
+    def test_endpoint(self):
+        """Test requests for resources of the same kind share an endpoint"""
+        assert endpoint('GET', 'http://irida/api/samples/12/pairs') == \
+            'GET /api/samples/{id}/pairs'
+        assert endpoint(
+            'GET', 'http://galaxy/api/folders/F1b2c3/contents?key=k') == \
+            'GET /api/folders/{id}/contents'
+        assert endpoint('POST', 'http://galaxy/api/libraries') == \
+            'POST /api/libraries'
+
+    def test_phase(self):
+        """Test a phase entered more than once is timed in total"""
+        metrics = ImportMetrics()
+
+        with metrics.phase('linking'):
+            pass
+        with metrics.phase('verification'):
+            pass
+        with metrics.phase('linking'):
+            pass
+
+        assert metrics.phases.keys() == ['linking', 'verification']
+
+    def test_request_failed(self):
+        """Test a failed request is still recorded"""
+        metrics = ImportMetrics()
+
+        with pytest.raises(IOError):
+            with metrics.request('IRIDA', 'GET', 'http://irida/api/samples/1'):
+                raise IOError('Not found')
+
+        assert metrics.requests[('IRIDA', 'GET /api/samples/{id}')][0] == 1
+
+    def test_watch(self):
+        """Test requests are timed by endpoint and still made"""
+        galaxy_instance = Mock()
+        galaxy_instance.make_get_request.return_value = 'response'
+        metrics = ImportMetrics()
+
+        metrics.watch(galaxy_instance, 'Galaxy')
+        response = galaxy_instance.make_get_request(
+            'http://galaxy/api/libraries/L1', params={})
+        galaxy_instance.make_get_request('http://galaxy/api/libraries/L2')
+        galaxy_instance.make_post_request('http://galaxy/api/libraries',
+                                          payload={})
+
+        assert response == 'response'
+        requests = metrics.to_dict()['requests']['Galaxy']
+        assert requests['GET /api/libraries/{id}']['count'] == 2
+        assert requests['POST /api/libraries']['count'] == 1
+
+    def test_write(self, tmpdir):
+        """Test the metrics are written as JSON"""
+        metrics = ImportMetrics()
+        with metrics.phase('linking'):
+            metrics.record_request('Galaxy', 'POST /api/libraries', 0.5)
+        metrics.finish()
+        path = str(tmpdir.join('log_file.metrics.json'))
+
+        metrics.write(path)
+
+        with open(path) as metrics_file:
+            written = json.load(metrics_file)
+        assert written['phases'].keys() == ['linking']
+        assert written['requests']['Galaxy']['POST /api/libraries'] == {
+            'count': 1, 'total_seconds': 0.5, 'mean_seconds': 0.5,
+            'max_seconds': 0.5}
+        assert 'wall_seconds' in written
+
+    def test_summary_lines(self):
+        """Test the phases and requests are summarized"""
+        metrics = ImportMetrics()
+        metrics.phases['linking'] = 2.0
+        metrics.record_request('IRIDA', 'GET /api/samples/{id}', 0.01)
+        metrics.record_request('IRIDA', 'GET /api/samples/{id}', 0.03)
+
+        lines = metrics.summary_lines()
+
+        assert '    linking: 2.0s' in lines
+        assert 'Requests to IRIDA: 2' in lines
+        assert '    GET /api/samples/{id}: 2 (mean 20 ms, max 30 ms)' in lines
+
+    def test_request_count(self):
+        """Test requests are counted by service"""
+        metrics = ImportMetrics()
+        metrics.record_request('Galaxy', 'GET /api/libraries', 0.01)
+        metrics.record_request('Galaxy', 'POST /api/libraries', 0.01)
+        metrics.record_request('IRIDA', 'GET /api/samples/{id}', 0.01)
+
+        assert metrics.request_count('Galaxy') == 2
+        assert metrics.request_count('IRIDA') == 1
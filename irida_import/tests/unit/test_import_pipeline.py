@@ -0,0 +1,245 @@
+import logging
+import pytest
+import threading
+import time
+
+from mock import Mock
+from ...import_pipeline import IncrementalHistory, StreamingImport
+from ...sample import Sample
+from ...sample_file import SampleFile
+
+
+@pytest.mark.unit
+class TestStreamingImport:
+
+    """ TestStreamingImport performs unit tests on StreamingImport."""
+
+    def make_sample(self, name):
+        sample = Sample(name, '', '')
+        sample.add_file(SampleFile(name + '.fastq',
+                                   '/imaginary/path/' + name + '.fastq'))
+        return sample
+
+    def verifier(self, on_arrived=None, failing=()):
+        """Verify files as they arrive, failing the named ones"""
+        def verify_sample_files(sample_files, incoming):
+            arrived_files = list(sample_files)
+            done = False
+            while not done:
+                arrived, done = incoming(True)
+                arrived_files.extend(arrived)
+                if arrived and on_arrived is not None:
+                    on_arrived(arrived)
+            return [sample_file for sample_file in arrived_files
+                    if sample_file.name in failing]
+        return verify_sample_files
+
+    @pytest.fixture(scope='function')
+    def importer(self):
+        """An importer that links and verifies samples instantly"""
+        importer = Mock()
+        importer.add_samples_if_nec.side_effect = lambda samples: len(samples)
+        importer.get_sample_files.side_effect = lambda samples: [
+            sample_file for sample in samples
+            for sample_file in sample.get_reads()]
+        importer.verify_sample_files.side_effect = self.verifier()
+        return importer
+
+    def test_links_before_resolution_finishes(self, importer):
+        """Test a sample is linked and verified while later samples are
+        still being resolved"""
+        verified = threading.Event()
+        samples = [self.make_sample('s1'), self.make_sample('s2')]
+
+        def iter_samples(samples_dict):
+            yield samples[0]
+            # The next sample can't resolve until the first is verified
+            assert verified.wait(5)
+            yield samples[1]
+
+        importer.iter_samples.side_effect = iter_samples
+        importer.verify_sample_files.side_effect = self.verifier(
+            on_arrived=lambda arrived: verified.set())
+
+        resolved, num_files, failed = StreamingImport(importer).run([{}, {}])
+
+        assert resolved == samples
+        assert num_files == 2
+        assert failed == []
+        linked = [sample for call in importer.add_samples_if_nec.call_args_list
+                  for sample in call[0][0]]
+        assert linked == samples
+
+    def test_resumed_samples(self, importer):
+        """Test samples resolved by an earlier run are not resolved again,
+        and the rest are journaled as they are resolved"""
+        resumed = self.make_sample('s1')
+        fresh = self.make_sample('s2')
+        importer.iter_samples.return_value = iter([fresh])
+
+        resolved, num_files, failed = StreamingImport(importer).run(
+            [{'name': 's1'}, {'name': 's2'}], [resumed])
+
+        assert resolved == [resumed, fresh]
+        importer.iter_samples.assert_called_once_with([{'name': 's2'}])
+        importer.journal.add_samples.assert_called_once_with([fresh])
+
+    def test_failed_files(self, importer):
+        """Test the files that fail verification are returned"""
+        samples = [self.make_sample('s1'), self.make_sample('s2')]
+        importer.iter_samples.return_value = iter(samples)
+        importer.verify_sample_files.side_effect = self.verifier(
+            failing=['s2.fastq'])
+
+        resolved, num_files, failed = StreamingImport(importer).run([{}, {}])
+
+        assert resolved == samples
+        assert failed == samples[1].get_reads()
+
+    def test_resolution_error(self, importer):
+        """Test an error resolving a sample is raised"""
+        def iter_samples(samples_dict):
+            yield self.make_sample('s1')
+            raise IOError('IRIDA is down')
+
+        importer.iter_samples.side_effect = iter_samples
+
+        with pytest.raises(IOError):
+            StreamingImport(importer).run([{}, {}])
+
+    def test_linking_error(self, importer):
+        """Test an error linking is raised, and nothing is verified"""
+        arrived_files = []
+        importer.iter_samples.return_value = iter(
+            [self.make_sample(name) for name in ('s1', 's2', 's3')])
+        importer.add_samples_if_nec.side_effect = ValueError('File not found')
+        importer.verify_sample_files.side_effect = self.verifier(
+            on_arrived=arrived_files.extend)
+
+        with pytest.raises(ValueError):
+            StreamingImport(importer, logging.getLogger('irida_import')).run(
+                [{}, {}, {}])
+        assert arrived_files == []
+
+    def test_files_join_verification(self, importer):
+        """Test files linked while others are being verified are taken
+        into verification without waiting for them"""
+        verifying = threading.Event()
+        linked = threading.Event()
+        samples = [self.make_sample('s1'), self.make_sample('s2')]
+        rounds = []
+
+        def iter_samples(samples_dict):
+            yield samples[0]
+            assert verifying.wait(5)
+            yield samples[1]
+
+        def add_samples_if_nec(samples):
+            if samples[0].name == 's2':
+                linked.set()
+            return len(samples)
+
+        def verify_sample_files(sample_files, incoming):
+            done = False
+            while not done:
+                arrived, done = incoming(not rounds)
+                rounds.append([sample_file.name for sample_file in arrived])
+                if len(rounds) == 1:
+                    # The first file is still pending when the second is
+                    # linked
+                    verifying.set()
+                    assert linked.wait(5)
+                    time.sleep(0.1)
+            return []
+
+        importer.iter_samples.side_effect = iter_samples
+        importer.add_samples_if_nec.side_effect = add_samples_if_nec
+        importer.verify_sample_files.side_effect = verify_sample_files
+
+        StreamingImport(importer).run([{}, {}])
+
+        assert rounds[0] == ['s1.fastq']
+        assert rounds[1] == ['s2.fastq']
+
+
+@pytest.mark.unit
+class TestIncrementalHistory:
+
+    """ TestIncrementalHistory performs unit tests on IncrementalHistory."""
+
+    def make_sample(self, name, verified=False):
+        sample = Sample(name, '', '')
+        for num in range(2):
+            sample_file = SampleFile('%s_%d.fastq' % (name, num),
+                                     '/imaginary/path/%s_%d.fastq' % (name,
+                                                                      num))
+            sample_file.library_dataset_id = 'D%s_%d' % (name, num)
+            sample_file.verified = verified
+            sample.add_file(sample_file)
+        return sample
+
+    @pytest.fixture(scope='function')
+    def importer(self):
+        """An importer that adds datasets to the history instantly"""
+        importer = Mock()
+        importer.get_sample_files.side_effect = lambda samples: [
+            sample_file for sample in samples
+            for sample_file in sample.get_reads()]
+        importer.add_datasets_to_history.side_effect = (
+            lambda hist_id, dataset_ids: ['H' + dataset_id[1:]
+                                          for dataset_id in dataset_ids])
+        return importer
+
+    def test_sample_added_when_verified(self, importer):
+        """Test a sample is added as soon as all of its files are verified,
+        and the collections are made at the end"""
+        added = threading.Event()
+        add_datasets = importer.add_datasets_to_history.side_effect
+
+        def add_datasets_to_history(hist_id, dataset_ids):
+            added.set()
+            return add_datasets(hist_id, dataset_ids)
+
+        importer.add_datasets_to_history.side_effect = add_datasets_to_history
+        s1, s2 = self.make_sample('s1'), self.make_sample('s2')
+        history = IncrementalHistory(importer, 'hist').start()
+        history.add_samples([s1, s2])
+
+        history.file_verified(s1.get_reads()[0])
+        history.file_verified(s2.get_reads()[0])
+        assert not added.wait(0.1), \
+            'A sample must not be added before all of its files are verified'
+        history.file_verified(s1.get_reads()[1])
+        assert added.wait(5)
+        collection_array = history.finish()
+
+        importer.add_datasets_to_history.assert_called_once_with(
+            'hist', ['Ds1_0', 'Ds1_1'])
+        assert collection_array == importer.add_samples_to_history.return_value
+        importer.add_samples_to_history.assert_called_once_with(
+            [s1, s2], 'hist', make_paired_collection=True,
+            added={'Ds1_0': 'Hs1_0', 'Ds1_1': 'Hs1_1'})
+
+    def test_verified_samples(self, importer):
+        """Test samples whose files are verified already are added at once"""
+        sample = self.make_sample('s1', verified=True)
+        history = IncrementalHistory(importer, 'hist').start()
+
+        history.add_samples([sample])
+        history.finish(make_paired_collection=False)
+
+        importer.add_datasets_to_history.assert_called_once_with(
+            'hist', ['Ds1_0', 'Ds1_1'])
+        assert not importer.add_samples_to_history.call_args[1][
+            'make_paired_collection']
+
+    def test_error(self, importer):
+        """Test an error adding a sample is raised when finishing"""
+        importer.add_datasets_to_history.side_effect = IOError('Galaxy is down')
+        history = IncrementalHistory(importer, 'hist').start()
+
+        history.add_samples([self.make_sample('s1', verified=True)])
+
+        with pytest.raises(IOError):
+            history.finish()
+        assert not importer.add_samples_to_history.called
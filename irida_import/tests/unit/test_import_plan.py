@@ -0,0 +1,30 @@
+import pytest
+
+from ...import_plan import ImportPlan
+
+
+@pytest.mark.unit
+class TestImportPlan:
+
+    """ TestImportPlan performs unit tests on ImportPlan."""
+
+    def test_lines(self):
+        """Test every part of the plan is described"""
+        plan = ImportPlan('boblib')
+        plan.folders_to_create = ['/illumina_reads/bob']
+        plan.files_to_link = ['/illumina_reads/bob/file1']
+        plan.history_datasets = 1
+        plan.irida_requests = 3
+        plan.galaxy_requests['Creating folders'] = 1
+        plan.galaxy_requests['Linking files'] = 1
+
+        lines = plan.lines()
+
+        assert "Library 'boblib' exists" in lines
+        assert lines[lines.index('Folders to create (1):') + 1] == \
+            '    /illumina_reads/bob'
+        assert 'Files to link (1):' in lines
+        assert 'Requests to IRIDA: 3' in lines
+        assert 'Requests to Galaxy: at least 2' in lines
+        assert '    Linking files: 1' in lines
+
@@ -0,0 +1,75 @@
+import json
+import pstats
+import pytest
+import time
+
+from ...import_profiler import ImportProfiler
+
+
+def busy(seconds):
+    """Spend some time in a recognizable function"""
+    end = time.time() + seconds
+    while time.time() < end:
+        pass
+    return 'done'
+
+
+@pytest.mark.unit
+class TestImportProfiler:
+
+    """ TestImportProfiler performs unit tests on ImportProfiler."""
+
+    def test_deterministic(self, tmpdir):
+        """Test the stats are written for pstats to read"""
+        path = str(tmpdir.join('import.prof'))
+        profiler = ImportProfiler(path)
+
+        assert profiler.profiled(busy)(0.01) == 'done'
+
+        stats = pstats.Stats(path)
+        assert any(function[2] == 'busy' for function in stats.stats)
+
+    def test_sampling(self, tmpdir):
+        """Test stacks are sampled and written in the collapsed format"""
+        path = str(tmpdir.join('import.stacks'))
+        profiler = ImportProfiler(path, mode='sampling', interval=0.001)
+
+        profiler.run(busy, 0.1)
+
+        with open(path) as stacks_file:
+            lines = stacks_file.read().splitlines()
+        assert lines
+        assert any(':busy:' in line for line in lines)
+        stack, count = lines[0].rsplit(' ', 1)
+        assert stack.startswith('MainThread;')
+        assert int(count) > 0
+
+    def test_written_when_failed(self, tmpdir):
+        """Test the profile is written when the function raises"""
+        path = str(tmpdir.join('import.prof'))
+
+        def fail():
+            raise IOError('Galaxy is down')
+
+        with pytest.raises(IOError):
+            ImportProfiler(path).run(fail)
+
+        assert tmpdir.join('import.prof').check()
+
+    def test_memory(self, tmpdir):
+        """Test memory snapshots are taken at the start and the end"""
+        path = str(tmpdir.join('import.prof'))
+        profiler = ImportProfiler(path, memory=True)
+
+        profiler.run(busy, 0)
+
+        with open(path + '.memory.json') as snapshots_file:
+            snapshots = json.load(snapshots_file)
+        assert len(snapshots) == 2
+        type_names = [type_name for type_name, count, size
+                      in snapshots[-1]['types']]
+        assert 'dict' in type_names
+
+    def test_unknown_mode(self):
+        with pytest.raises(ValueError):
+            ImportProfiler('import.prof', mode='tracing')
@@ -0,0 +1,133 @@
+import logging
+import pprint
+import pytest
+
+from requests.exceptions import HTTPError
+from requests_oauthlib import OAuth2Session
+from ...irida_import import IridaImport
+from ...irida_client import PipelinedIridaClient
+from ...sample_pair import SamplePair
+from ..irida_stub import StubIridaServer
+
+
+@pytest.mark.unit
+class TestPipelinedIridaClient:
+
+    """Tests the pipelined IRIDA client against a local stub IRIDA server"""
+
+    @pytest.fixture(scope='function')
+    def irida_server(self):
+        """Start a stub IRIDA server"""
+        server = StubIridaServer(num_samples=6, pairs_per_sample=2,
+                                 singles_per_sample=1, latency=0.01).start()
+        yield server
+        server.stop()
+
+    @pytest.fixture(scope='function')
+    def imp(self):
+        """Create an IridaImport instance with an IRIDA session"""
+        imp = IridaImport()
+        imp.irida = OAuth2Session(
+            client_id='webClient',
+            token={'access_token': StubIridaServer.ACCESS_TOKEN,
+                   'token_type': 'Bearer'})
+        imp.pp = pprint.PrettyPrinter(indent=4)
+        imp.logger = logging.getLogger('irida_import')
+        imp.IRIDA_MAX_CONCURRENT_REQUESTS = 4
+        return imp
+
+    def reads_summary(self, samples):
+        """Describe samples by name and the paths of their reads"""
+        summary = []
+        for sample in samples:
+            reads = []
+            for read in sample.get_reads():
+                if isinstance(read, SamplePair):
+                    reads.append((read.name, read.forward.path,
+                                  read.reverse.path))
+                else:
+                    reads.append(read.path)
+            summary.append((sample.name, sample.paired_path,
+                            sample.unpaired_path, reads))
+        return summary
+
+    def test_resolve_samples_same_as_session(self, imp, irida_server):
+        """Test the pipelined client resolves the same samples as get_samples"""
+        samples_dict = irida_server.samples_dict()
+
+        expected = imp.get_samples(samples_dict)
+        samples = imp.get_samples_pipelined(samples_dict)
+
+        assert self.reads_summary(samples) == self.reads_summary(expected), \
+            'The pipelined client must resolve identical samples in order'
+        assert len(samples[0].get_reads()) == 3, \
+            'Each sample must have its pairs and single end files'
+
+    def test_iter_samples_same_as_session(self, imp, irida_server):
+        """Test iter_samples yields the same samples as get_samples"""
+        samples_dict = irida_server.samples_dict()
+
+        expected = imp.get_samples(samples_dict)
+        samples = list(imp.iter_samples(samples_dict))
+
+        assert self.reads_summary(samples) == self.reads_summary(expected), \
+            'Samples must be resolved identically, in order'
+
+    def test_resolve_samples_requests_each_resource_once(self, irida_server):
+        """Test every sample, pairs and unpaired resource is requested once"""
+        imp = IridaImport()
+        client = PipelinedIridaClient(
+            {'access_token': StubIridaServer.ACCESS_TOKEN}, 3)
+        sample_requests = [imp.get_sample_request(sample_input) for
+                           sample_input in irida_server.samples_dict()]
+
+        samples = client.resolve_samples(sample_requests, imp.make_sample,
+                                         imp.add_sample_reads)
+
+        assert [sample.name for sample in samples] == \
+            [name for name, path in sample_requests]
+        assert len(irida_server.request_counts) == 3 * len(samples)
+        assert set(irida_server.request_counts.values()) == set([1])
+
+    def test_resolve_samples_unauthorized(self, irida_server):
+        """Test a rejected token raises the HTTP error"""
+        imp = IridaImport()
+        client = PipelinedIridaClient({'access_token': 'wrongToken'}, 2)
+        sample_requests = [imp.get_sample_request(sample_input) for
+                           sample_input in irida_server.samples_dict()]
+
+        with pytest.raises(HTTPError):
+            client.resolve_samples(sample_requests, imp.make_sample,
+                                   imp.add_sample_reads)
+
+    def test_resolve_samples_missing_resource(self, irida_server):
+        """Test a missing sample raises the HTTP error"""
+        imp = IridaImport()
+        client = PipelinedIridaClient(
+            {'access_token': StubIridaServer.ACCESS_TOKEN}, 2)
+        sample_requests = [('missing', irida_server.url + '/api/samples/99')]
+
+        with pytest.raises(HTTPError):
+            client.resolve_samples(sample_requests, imp.make_sample,
+                                   imp.add_sample_reads)
+
+    def test_resolve_samples_first_failure(self):
+        """Test samples before a failed one are still resolved, so the
+        failure raised is the first in sample order"""
+        server = StubIridaServer(num_samples=1, latency=0.1).start()
+        try:
+            imp = IridaImport()
+            client = PipelinedIridaClient(
+                {'access_token': StubIridaServer.ACCESS_TOKEN}, 2)
+            # The second sample fails at once, before the first arrives
+            sample_requests = [('sample0', server.sample_url(0)),
+                               ('refused', 'http://127.0.0.1:1/api/samples/1')]
+
+            def add_sample_reads(sample, paired, unpaired):
+                raise ValueError('Bad reads of ' + sample.name)
+
+            with pytest.raises(ValueError):
+                client.resolve_samples(sample_requests, imp.make_sample,
+                                       add_sample_reads)
+        finally:
+            server.stop()
@@ -1,20 +1,44 @@
 import ast
+import glob
 import os
 import json
 import logging
 import pprint
 import pytest
 import mock
-
+import sqlite3
+import shutil
+import stat
+import subprocess
+import sys
+import time
+
+from collections import OrderedDict
 from requests_oauthlib import OAuth2Session
 from mock import Mock
-from bioblend import galaxy
+from bioblend import ConnectionError, galaxy
 from bioblend.galaxy.objects import (GalaxyInstance, Library, Folder, client)
 from bioblend.galaxy.objects.wrappers import LibraryContentInfo
+from ...import_journal import ImportJournal
 from ...irida_import import IridaImport
+from ...library_cache import LibraryStateCache
+from ...library_index import LibraryIndex
 from ...sample import Sample
 from ...sample_file import SampleFile
 from ...sample_pair import SamplePair
+from ...wait_policy import FixedWaitPolicy
+from ..galaxy_stub import StubGalaxyServer
+from ..irida_stub import StubIridaServer
+
+
+def fake_stat(mocker, size=5678, missing=lambda path: False):
+    """Stat imaginary paths as files of the same size"""
+    def stat_path(path):
+        if missing(path):
+            raise OSError(2, 'No such file or directory', path)
+        return os.stat_result((stat.S_IFREG | 0644, 0, 0, 1, 0, 0, size,
+                               0, 0, 0))
+    return mocker.patch('os.stat', side_effect=stat_path)
 
 
 @pytest.mark.unit
@@ -53,8 +77,13 @@ class TestIridaImport:
         imp.reg_gi.datasets = mock.create_autospec(galaxy.datasets.DatasetClient)
         imp.reg_gi.libraries = mock.create_autospec(galaxy.libraries.LibraryClient)
         imp.reg_gi.libraries.get_folders.return_value = [{'id': '321'}, {}]
+        imp.reg_gi.folders = mock.create_autospec(galaxy.folders.FoldersClient)
+        imp.reg_gi.config = mock.create_autospec(galaxy.config.ConfigClient)
+        # A Galaxy that can't hide datasets while making a collection
+        imp.reg_gi.config.get_version.return_value = {'version_major': '15.03'}
         imp.library = mock.create_autospec(galaxy.objects.wrappers.Library)
         imp.library.id = "123"
+        imp.library_cache = LibraryStateCache()
         imp.reg_gi.histories = mock.create_autospec(galaxy.histories.HistoryClient)
         imp.histories = mock.create_autospec(galaxy.histories.HistoryClient)
         imp.reg_gi.users = mock.create_autospec(galaxy.users)
@@ -62,6 +91,10 @@ class TestIridaImport:
         imp.uploaded_files_log = []
         imp.pp = pprint.PrettyPrinter(indent=4)
         imp.skipped_files_log = []
+        imp.retried_files_log = OrderedDict()
+        imp.failed_files_log = []
+        imp.resumed_files_log = []
+        imp.journal = ImportJournal(':memory:', 'test')
         imp.configure = Mock()
         imp.logger = logging.getLogger('irida_import')
         self.add_irida_constants(imp)
@@ -79,6 +112,14 @@ class TestIridaImport:
         irida_instance.CLIENT_ID = 'webClient'
         irida_instance.CLIENT_SECRET = 'webClientSecret'
         irida_instance.TOKEN_ENDPOINT = 'http://localhost:8080/api/oauth/token'
+        irida_instance.IRIDA_MAX_CONCURRENT_REQUESTS = 1
+        irida_instance.LAZY_LIBRARY_LOADING = False
+        irida_instance.MAX_FILES_PER_LINK = 100
+        irida_instance.MAX_PAIRS_PER_COLLECTION = 0
+        irida_instance.GALAXY_MAX_CONCURRENT_REQUESTS = 1
+        irida_instance.MAX_CONCURRENT_FILE_STATS = 1
+        irida_instance.JOURNAL_FILE = None
+        irida_instance.wait_policy = FixedWaitPolicy(sleep=Mock())
 
     @pytest.fixture(scope='class')
     def file_list(self):
@@ -139,6 +180,84 @@ class TestIridaImport:
             assert isinstance(sample, Sample), 'The list must contain samples'
         assert len(samples) == 1, 'Number of samples is incorrect'
 
+    def make_pair_resource(self, identifier, forward_href, reverse_href,
+                           file_hrefs):
+        """Make a pair resource as if read from IRIDA"""
+        return {
+            'identifier': identifier,
+            'links': [{'rel': 'self', 'href': 'http://irida/pairs/1'},
+                      {'rel': 'pair/forward', 'href': forward_href},
+                      {'rel': 'pair/reverse', 'href': reverse_href}],
+            'files': [{'fileName': href.rsplit('/', 1)[1] + '.fastq',
+                       'file': '/imaginary' + href.rsplit('/', 1)[1],
+                       'links': [{'rel': 'self', 'href': href}]}
+                      for href in file_hrefs]
+        }
+
+    def test_add_sample_reads(self, imp):
+        """Test forward and reverse files are found by their links"""
+        sample = Sample('bobname', 'paired', 'unpaired')
+        pair = self.make_pair_resource(
+            1, 'http://irida/files/2', 'http://irida/files/1',
+            ['http://irida/files/1', 'http://irida/files/2'])
+        single = {'sequenceFile': {'fileName': '3.fastq', 'file': '/3'}}
+
+        imp.add_sample_reads(sample, {'resources': [pair]},
+                             {'resources': [single]})
+
+        pair_read, single_read = sample.get_reads()
+        assert pair_read.name == '1'
+        assert pair_read.forward.name == '2.fastq', \
+            'The forward file must be the one the forward link points to'
+        assert pair_read.reverse.name == '1.fastq', \
+            'The reverse file must be the one the reverse link points to'
+        assert single_read.name == '3.fastq'
+
+    def test_add_sample_reads_missing_mate(self, imp):
+        """Test a pair without its reverse file raises an error"""
+        sample = Sample('bobname', 'paired', 'unpaired')
+        complete_pair = self.make_pair_resource(
+            1, 'http://irida/files/1', 'http://irida/files/2',
+            ['http://irida/files/1', 'http://irida/files/2'])
+        broken_pair = self.make_pair_resource(
+            2, 'http://irida/files/3', 'http://irida/files/4',
+            ['http://irida/files/3'])
+
+        with pytest.raises(ValueError):
+            imp.add_sample_reads(sample,
+                                 {'resources': [complete_pair, broken_pair]},
+                                 {'resources': []})
+
+    def test_fetch_irida_resources_order(self, imp):
+        """Test that concurrently fetched resources keep request order"""
+        imp.IRIDA_MAX_CONCURRENT_REQUESTS = 4
+        urls = ['http://irida/resource/%d' % i for i in range(20)]
+        imp.make_irida_request = Mock(side_effect=lambda url: {'url': url})
+
+        resources = imp.fetch_irida_resources(urls)
+
+        assert [res['url'] for res in resources] == urls, \
+            'Resources must be returned in the order they were requested'
+        assert imp.make_irida_request.call_count == len(urls), \
+            'Each resource must be requested once'
+
+    def test_fetch_irida_resources_error(self, imp):
+        """Test that the first failed request in order raises its error"""
+        imp.IRIDA_MAX_CONCURRENT_REQUESTS = 4
+        urls = ['http://irida/resource/%d' % i for i in range(10)]
+
+        def request(url):
+            if url.endswith('/3'):
+                raise ValueError('first')
+            if url.endswith('/7'):
+                raise IOError('second')
+            return {}
+
+        imp.make_irida_request = Mock(side_effect=request)
+
+        with pytest.raises(ValueError):
+            imp.fetch_irida_resources(urls)
+
     def test_get_first_or_make_lib_empty(self, imp):
         """Test library creation if there are no preexisting libraries"""
         wanted_name = 'boblib'
@@ -147,7 +266,7 @@ class TestIridaImport:
         lib_to_make.deleted = False
         lib_to_make.id = 1
         imp.gi.libraries.create = Mock(return_value=lib_to_make)
-        imp.gi.libraries.list = Mock(return_value=[])
+        imp.gi.libraries.get_previews = Mock(return_value=[])
         email = 'bob@lala.com'
         users = [self.make_role('sally@lala.com', 59),
                  self.make_role(email, 34)]
@@ -170,7 +289,7 @@ class TestIridaImport:
         chaff_lib = self.make_lib('boblib', True)
         chaff_lib2 = self.make_lib('boblib2', False)
         libs_in_gal = [lib_to_make, chaff_lib, chaff_lib2]
-        imp.gi.libraries.list = Mock(return_value=libs_in_gal)
+        imp.gi.libraries.get_previews = Mock(return_value=libs_in_gal)
         imp.gi.libraries.create = Mock(return_value=lib_to_make)
         email = 'bob@lala.com'
         users = [self.make_role('sally@lala.com', 59),
@@ -184,6 +303,8 @@ class TestIridaImport:
         assert lib_made is not None, 'library must be returned'
         assert lib_made.name == wanted_name, 'Library must have correct name'
         assert lib_made.deleted is False, 'Library must not be deleted'
+        # A preview doesn't come with the library's contents
+        imp.gi.libraries.get_previews.assert_called_once_with(name=wanted_name)
 
     def make_lib(self, name, is_deleted):
         """Set up a library to be used by a test"""
@@ -242,30 +363,216 @@ class TestIridaImport:
             imp.exists_in_lib = Mock(return_value=False)
             imp.create_folder_if_nec(folder_path)
 
+    def test_create_folders_if_nec(self, imp):
+        """ Test only missing folders are made, parents first """
+        imp.GALAXY_MAX_CONCURRENT_REQUESTS = 4
+        imp.reg_gi.libraries.show_library.return_value = [
+            {'id': 'F1', 'type': 'folder', 'name': '/illumina_reads'},
+            {'id': 'F2', 'type': 'folder', 'name': '/illumina_reads/sample1'}]
+        made = []
+
+        def create_folder(library_id, name, base_folder_id=None):
+            made.append((name, base_folder_id))
+            return [{'id': 'F' + name, 'name': name}]
+        imp.reg_gi.libraries.create_folder.side_effect = create_folder
+
+        sample1 = Sample('sample1', 'paired', 'unpaired')
+        sample1.add_pair(SamplePair('pair1', SampleFile('a', '/a'),
+                                    SampleFile('b', '/b')))
+        sample2 = Sample('sample2', 'paired', 'unpaired')
+        sample2.add_pair(SamplePair('pair1', SampleFile('c', '/c'),
+                                    SampleFile('d', '/d')))
+        sample2.add_pair(SamplePair('pair2', SampleFile('e', '/e'),
+                                    SampleFile('f', '/f')))
+        folder_paths = imp.plan_folders([sample1, sample2, sample1])
+
+        assert folder_paths == [
+            '/illumina_reads/sample1', '/illumina_reads/sample1/pair1',
+            '/illumina_reads/sample2', '/illumina_reads/sample2/pair1',
+            '/illumina_reads/sample2/pair2'], \
+            'Each folder must be planned once'
+
+        folder_ids = imp.create_folders_if_nec(folder_paths)
+
+        assert folder_ids == {
+            '/illumina_reads/sample1': 'F2',
+            '/illumina_reads/sample1/pair1': 'Fpair1',
+            '/illumina_reads/sample2': 'Fsample2',
+            '/illumina_reads/sample2/pair1': 'Fpair1',
+            '/illumina_reads/sample2/pair2': 'Fpair2'}
+        assert made[0] == ('sample2', 'F1'), 'Parents must be made first'
+        assert sorted(made[1:]) == [('pair1', 'F2'), ('pair1', 'Fsample2'),
+                                    ('pair2', 'Fsample2')]
+        assert imp.exists_in_lib('folder', 'name',
+                                 '/illumina_reads/sample2/pair2') == ['Fpair2']
+
     def test_exists_in_lib(self, imp):
         """ Test if a folder can be found in a library among chaff items """
         imp.library = self.make_lib('wolib', False)
         imp.gi.libraries.get = Mock(return_value=imp.library)
 
 
-        items = {}
-        items['sally.fastq']={}
-        items['sally.fastq']['id']=123
-        items['sally.fastq']['type']='file'
-        items['sally.fastq']['name']='sally.fastq'
-
-        items['bob.fasta']={}
-        items['bob.fasta']['id']=234
-        items['bob.fasta']['type']='file'
-        items['bob.fasta']['name']='bob.fasta'
-
-        imp.folds = items
+        imp.library_cache.put((imp.GALAXY_URL, imp.library.id), LibraryIndex([
+            {'id': 123, 'type': 'file', 'name': 'sally.fastq'},
+            {'id': 234, 'type': 'file', 'name': 'bob.fasta'},
+            {'id': 345, 'type': 'folder', 'name': 'bob.fasta'},
+            {'id': 456, 'type': 'file', 'name': 'bob.fasta'}
+        ]))
 
         exists = imp.exists_in_lib('file', 'name', 'bob.fasta')
-        assert exists, 'file must exist in library'
+        assert exists == [234, 456], \
+            'Every file with the name, and only files, must be found'
+        assert imp.exists_in_lib('file', 'id', 123) == [123], \
+            'Files must also be found by other attributes'
+        assert not imp.exists_in_lib('folder', 'name', 'sally.fastq'), \
+            'A file must not be found as a folder'
+        assert not imp.reg_gi.libraries.show_library.called, \
+            'A loaded library index must not be fetched again'
+
+    def test_library_state_per_library(self, imp):
+        """ Test each library has its own state, which can be invalidated """
+        imp.reg_gi.libraries.show_library.return_value = [
+            {'id': 'F1', 'type': 'folder', 'name': '/illumina_reads'}]
+        assert imp.exists_in_lib('folder', 'name', '/illumina_reads')
+
+        imp.library = self.make_lib('otherlib', False)
+        imp.library.id = "456"
+        imp.reg_gi.libraries.show_library.return_value = []
+        assert not imp.exists_in_lib('folder', 'name', '/illumina_reads'), \
+            'The state of another library must not be used'
 
-    def test_add_samples_if_nec(self, imp, file_list):
+        imp.library.id = "123"
+        assert imp.exists_in_lib('folder', 'name', '/illumina_reads'), \
+            'The state of a library must be reused'
+        assert imp.reg_gi.libraries.show_library.call_count == 2
+
+        imp.invalidate_library_state()
+        assert not imp.exists_in_lib('folder', 'name', '/illumina_reads'), \
+            'An invalidated library state must be read again'
+        assert imp.reg_gi.libraries.show_library.call_count == 3
+
+    def test_exists_in_lib_lazy(self, imp):
+        """ Test only the folders containing the items are listed """
+        imp.LAZY_LIBRARY_LOADING = True
+        imp.reg_gi.libraries.show_library.return_value = {
+            'root_folder_id': 'F0'}
+        folder_contents = {
+            'F0': [{'id': 'F1', 'type': 'folder', 'name': 'illumina_reads'},
+                   {'id': 'F2', 'type': 'folder', 'name': 'references'}],
+            'F1': [{'id': 'F3', 'type': 'folder', 'name': 'sample1'},
+                   {'id': '1', 'type': 'file', 'name': 'sally.fastq'}],
+            'F3': [{'id': '2', 'type': 'file', 'name': 'bob.fastq'}]
+        }
+        imp.reg_gi.folders.show_folder.side_effect = (
+            lambda folder_id, contents: {
+                'folder_contents': folder_contents[folder_id]})
+
+        assert imp.exists_in_lib('folder', 'name',
+                                 '/illumina_reads/sample1') == ['F3']
+        assert imp.exists_in_lib('file', 'name',
+                                 '/illumina_reads/sally.fastq') == ['1']
+        assert imp.exists_in_lib('file', 'name',
+                                 '/illumina_reads/sample1/bob.fastq') == ['2']
+        assert not imp.exists_in_lib('folder', 'name',
+                                     '/illumina_reads/sample2/pair')
+
+        listed = [call[0][0] for call in
+                  imp.reg_gi.folders.show_folder.call_args_list]
+        assert listed == ['F0', 'F1', 'F3'], \
+            'Each folder that is used must be listed once'
+        imp.reg_gi.libraries.show_library.assert_called_once_with("123")
+
+    def test_existing_file_lazy(self, imp, mocker):
+        """ Test datasets are matched by the sizes and states listed """
+        imp.LAZY_LIBRARY_LOADING = True
+        mocker.patch('os.path.getsize', return_value=5678)
+        imp.library_cache.put((imp.GALAXY_URL, imp.library.id), LibraryIndex())
+        imp.library_state().load_folder('/illumina_reads', [
+            {'id': '1', 'type': 'file', 'name': 'bob.fastq',
+             'file_size': '5.5 KB', 'raw_size': 1234, 'state': 'ok'},
+            {'id': '2', 'type': 'file', 'name': 'bob.fastq',
+             'file_size': '5.5 KB', 'raw_size': 5678, 'state': 'error'},
+            {'id': '3', 'type': 'file', 'name': 'bob.fastq',
+             'file_size': '5.5 KB', 'raw_size': 5678, 'state': 'ok'}])
+
+        found = imp.existing_file('/imaginary/bob.fastq',
+                                  '/illumina_reads/bob.fastq')
+
+        assert found == '3', 'The dataset of the same size that is ok is found'
+        assert not imp.reg_gi.libraries.show_dataset.called, \
+            'Datasets with a known size and state must not be requested'
+        assert not imp.reg_gi.folders.show_folder.called
+
+    def test_existing_file_full(self, imp, mocker):
+        """ Test a folder is listed once for datasets without metadata """
+        mocker.patch('os.path.getsize', return_value=5678)
+        imp.reg_gi.libraries.show_library.return_value = [
+            {'id': 'F1', 'type': 'folder', 'name': '/illumina_reads'},
+            {'id': '1', 'type': 'file', 'name': '/illumina_reads/bob.fastq'},
+            {'id': '2', 'type': 'file', 'name': '/illumina_reads/sally.fastq'}]
+        imp.reg_gi.folders.show_folder.return_value = {'folder_contents': [
+            {'id': '1', 'type': 'file', 'name': 'bob.fastq',
+             'raw_size': 5678, 'state': 'ok'},
+            {'id': '2', 'type': 'file', 'name': 'sally.fastq',
+             'raw_size': 5679, 'state': 'ok'}]}
+
+        assert imp.existing_file('/imaginary/bob.fastq',
+                                 '/illumina_reads/bob.fastq') == '1'
+        assert imp.existing_file('/imaginary/sally.fastq',
+                                 '/illumina_reads/sally.fastq') == '2'
+        imp.reg_gi.folders.show_folder.assert_called_once_with(
+            'F1', contents=True)
+        assert not imp.reg_gi.libraries.show_dataset.called
+
+    def test_existing_file_state_expires(self, imp, mocker):
+        """ Test the library's state is kept for the whole import, even
+        once it has expired in the cache """
+        now = [1000.0]
+        imp.LAZY_LIBRARY_LOADING = True
+        imp.library_cache = LibraryStateCache(ttl=60, clock=lambda: now[0])
+        mocker.patch('os.path.getsize', return_value=5678)
+        imp.reg_gi.libraries.show_library.return_value = {
+            'root_folder_id': 'F0'}
+        folder_contents = {
+            'F0': [{'id': 'F1', 'type': 'folder', 'name': 'illumina_reads'}],
+            'F1': [{'id': '1', 'type': 'file', 'name': 'bob.fastq',
+                    'raw_size': 5678, 'state': 'ok'}]}
+        imp.reg_gi.folders.show_folder.side_effect = (
+            lambda folder_id, contents: {
+                'folder_contents': folder_contents[folder_id]})
+
+        assert imp.exists_in_lib('file', 'name',
+                                 '/illumina_reads/bob.fastq') == ['1']
+        now[0] += 61
+        found = imp.existing_file('/imaginary/bob.fastq',
+                                  '/illumina_reads/bob.fastq')
+
+        assert found == '1'
+        assert imp.reg_gi.folders.show_folder.call_count == 2, \
+            'Each folder must only be listed once during an import'
+
+    def test_existing_file_shown(self, imp, mocker):
+        """ Test a finished dataset's details are kept once requested """
+        imp.LAZY_LIBRARY_LOADING = True
+        mocker.patch('os.path.getsize', return_value=5678)
+        imp.library_cache.put((imp.GALAXY_URL, imp.library.id), LibraryIndex())
+        imp.library_state().load_folder('/illumina_reads', [])
+        imp.library_state().add({'id': '1', 'type': 'file',
+                                 'name': '/illumina_reads/bob.fastq'})
+        imp.reg_gi.libraries.show_dataset.return_value = {
+            'id': '1', 'name': 'bob.fastq', 'file_size': 5678, 'state': 'ok',
+            'ldda_id': 'L1'}
+
+        for attempt in range(2):
+            assert imp.existing_file('/imaginary/bob.fastq',
+                                     '/illumina_reads/bob.fastq') == '1'
+
+        assert imp.reg_gi.libraries.show_dataset.call_count == 1
+        assert imp.library_state().find('1')['ldda_id'] == 'L1'
+
+    def test_add_samples_if_nec(self, imp, file_list, mocker):
         """ Test if a new sample file is added to the library """
+        fake_stat(mocker)
 
         imp.exists_in_lib = Mock()
         imp.exists_in_lib.side_effect = [[123], [234]]
@@ -350,6 +657,195 @@ class TestIridaImport:
 
         assert not collection_array, 'List should be empty, collections was set to false'
 
+    def test_add_samples_to_history_concurrent(self, imp):
+        """ Test collections keep their names and order when datasets are
+        added concurrently """
+        imp.GALAXY_MAX_CONCURRENT_REQUESTS = 4
+        delays = {'D1': 0.03, 'D2': 0.02, 'D3': 0.01, 'D4': 0, 'D5': 0}
+
+        def upload(hist_id, dataset_id):
+            time.sleep(delays[dataset_id])
+            return {'id': 'H' + dataset_id[1:]}
+        imp.histories.upload_dataset_from_library.side_effect = upload
+
+        sample = Sample("bobname", "paired", "unpaired")
+        for pair_num, dataset_ids in ((1, ('D1', 'D2')), (2, ('D3', 'D4'))):
+            forward = SampleFile('fwd%d' % pair_num, '/imaginary/fwd.fastq')
+            reverse = SampleFile('rev%d' % pair_num, '/imaginary/rev.fastq')
+            forward.library_dataset_id, reverse.library_dataset_id = \
+                dataset_ids
+            sample.add_pair(SamplePair('pair%d' % pair_num, forward, reverse))
+        single = SampleFile('single', '/imaginary/single.fastq')
+        single.library_dataset_id = 'D5'
+        sample.add_file(single)
+
+        collection_array = imp.add_samples_to_history([sample], 'hist')
+
+        assert [(collection['name'],
+                 [element['id']
+                  for element in collection['element_identifiers']])
+                for collection in collection_array] == \
+            [('bobname', ['H1', 'H2']), ('bobname__2', ['H3', 'H4'])]
+        assert imp.histories.upload_dataset_from_library.call_count == 5
+        hidden = sorted(call[0][1] for call in
+                        imp.histories.update_dataset.call_args_list)
+        assert hidden == ['H1', 'H2', 'H3', 'H4']
+        imp.histories.create_dataset_collection.assert_called_once_with(
+            'hist', mock.ANY)
+
+    def make_paired_sample(self):
+        sample = Sample("bobname", "paired", "unpaired")
+        forward = SampleFile('fwd', '/imaginary/fwd.fastq')
+        reverse = SampleFile('rev', '/imaginary/rev.fastq')
+        forward.library_dataset_id, reverse.library_dataset_id = 'D1', 'D2'
+        sample.add_pair(SamplePair('pair1', forward, reverse))
+        return sample
+
+    def test_add_samples_to_history_hide_source_items(self, imp):
+        """ Test Galaxy hides paired datasets as it makes the collection """
+        imp.reg_gi.config.get_version.return_value = {'version_major': '16.01'}
+        imp.reg_gi.url = 'http://localhost:8888/api'
+        imp.histories.upload_dataset_from_library.side_effect = (
+            lambda hist_id, dataset_id: {'id': 'H' + dataset_id[1:]})
+
+        imp.add_samples_to_history([self.make_paired_sample()], 'hist')
+        imp.add_samples_to_history([self.make_paired_sample()], 'hist')
+
+        assert not imp.histories.update_dataset.called
+        assert not imp.histories.create_dataset_collection.called
+        url, = imp.reg_gi.make_post_request.call_args[0]
+        payload = imp.reg_gi.make_post_request.call_args[1]['payload']
+        assert url == 'http://localhost:8888/api/histories/hist/contents'
+        assert payload['hide_source_items']
+        assert payload['type'] == 'dataset_collection'
+        assert payload['collection_type'] == 'list:paired'
+        assert imp.reg_gi.config.get_version.call_count == 1, \
+            'Galaxy\'s version must only be asked for once'
+
+    def test_add_samples_to_history_hide_source_items_fails(self, imp):
+        """ Test datasets are hidden one by one if Galaxy can't hide them
+        while making the collection """
+        imp.reg_gi.config.get_version.return_value = {'version_major': '16.01'}
+        imp.reg_gi.url = 'http://localhost:8888/api'
+        imp.reg_gi.make_post_request.side_effect = ConnectionError(
+            'Unexpected HTTP status code: 400')
+        imp.histories.upload_dataset_from_library.side_effect = (
+            lambda hist_id, dataset_id: {'id': 'H' + dataset_id[1:]})
+
+        imp.add_samples_to_history([self.make_paired_sample()], 'hist')
+
+        hidden = sorted(call[0][1] for call in
+                        imp.histories.update_dataset.call_args_list)
+        assert hidden == ['H1', 'H2']
+        assert imp.histories.create_dataset_collection.call_count == 1
+        assert not imp.can_hide_source_items()
+
+    def make_paired_samples(self, num_pairs):
+        samples = []
+        for pair_num in range(num_pairs):
+            sample = Sample('sample%d' % pair_num, 'paired', 'unpaired')
+            forward = SampleFile('fwd', '/imaginary/fwd%d.fastq' % pair_num)
+            reverse = SampleFile('rev', '/imaginary/rev%d.fastq' % pair_num)
+            forward.library_dataset_id = 'D%d' % (2 * pair_num)
+            reverse.library_dataset_id = 'D%d' % (2 * pair_num + 1)
+            sample.add_pair(SamplePair('pair', forward, reverse))
+            samples.append(sample)
+        return samples
+
+    def test_add_samples_to_history_chunked(self, imp):
+        """ Test large carts are put in several collections """
+        imp.MAX_PAIRS_PER_COLLECTION = 2
+        imp.histories.upload_dataset_from_library.side_effect = (
+            lambda hist_id, dataset_id: {'id': 'H' + dataset_id[1:]})
+
+        collection_array = imp.add_samples_to_history(
+            self.make_paired_samples(5), 'hist')
+
+        assert len(collection_array) == 5
+        collections = [call[0][1] for call in
+                       imp.histories.create_dataset_collection.call_args_list]
+        assert [len(collection['element_identifiers'])
+                for collection in collections] == [2, 2, 1]
+        assert collections[0]['name'].endswith(' (1 of 3)')
+        assert collections[2]['name'].endswith(' (3 of 3)')
+        assert [pair['name'] for collection in collections
+                for pair in collection['element_identifiers']] == [
+            'sample0', 'sample1', 'sample2', 'sample3', 'sample4']
+
+    def test_add_samples_to_history_chunked_hiding_fails(self, imp):
+        """ Test only the datasets of the collections Galaxy didn't make
+        are hidden one by one """
+        imp.MAX_PAIRS_PER_COLLECTION = 2
+        imp.reg_gi.config.get_version.return_value = {'version_major': '16.01'}
+        imp.reg_gi.url = 'http://localhost:8888/api'
+        imp.reg_gi.make_post_request.side_effect = [
+            {'id': 'C1'}, ConnectionError('Unexpected HTTP status code: 400')]
+        imp.histories.upload_dataset_from_library.side_effect = (
+            lambda hist_id, dataset_id: {'id': 'H' + dataset_id[1:]})
+
+        imp.add_samples_to_history(self.make_paired_samples(3), 'hist')
+
+        hidden = sorted(call[0][1] for call in
+                        imp.histories.update_dataset.call_args_list)
+        assert hidden == ['H4', 'H5']
+        assert imp.reg_gi.make_post_request.call_count == 2
+        assert imp.histories.create_dataset_collection.call_count == 1
+
+    def test_add_samples_to_history_reuse(self, imp):
+        """ Test datasets already copied to the history aren't copied
+        again """
+        imp.library_state().load_folder('/illumina_reads/bobname/pair1', [
+            {'id': 'D1', 'type': 'file', 'name': 'fwd', 'ldda_id': 'L1'},
+            {'id': 'D2', 'type': 'file', 'name': 'rev', 'ldda_id': 'L2'}])
+        imp.histories.show_history.return_value = [
+            {'id': 'H8', 'history_content_type': 'dataset',
+             'copied_from_ldda_id': 'L2', 'deleted': True, 'state': 'ok'},
+            {'id': 'H9', 'history_content_type': 'dataset',
+             'copied_from_ldda_id': 'L1', 'deleted': False, 'state': 'ok'},
+            {'id': 'C1', 'history_content_type': 'dataset_collection'}]
+        imp.histories.upload_dataset_from_library.side_effect = (
+            lambda hist_id, dataset_id: {'id': 'H' + dataset_id[1:]})
+
+        collection_array = imp.add_samples_to_history(
+            [self.make_paired_sample()], 'hist')
+
+        assert imp.histories.show_history.call_count == 1
+        imp.histories.upload_dataset_from_library.assert_called_once_with(
+            'hist', 'D2')
+        assert [element['id'] for element in
+                collection_array[0]['element_identifiers']] == ['H9', 'H2']
+
+    def test_add_samples_to_history_added(self, imp):
+        """ Test datasets added while the import went on aren't added
+        again """
+        imp.histories.upload_dataset_from_library.side_effect = (
+            lambda hist_id, dataset_id: {'id': 'H' + dataset_id[1:]})
+
+        collection_array = imp.add_samples_to_history(
+            [self.make_paired_sample()], 'hist', added={'D1': 'H7'})
+
+        imp.histories.upload_dataset_from_library.assert_called_once_with(
+            'hist', 'D2')
+        assert [element['id'] for element in
+                collection_array[0]['element_identifiers']] == ['H7', 'H2']
+
+    def test_add_samples_to_history_unknown_lddas(self, imp):
+        """ Test the history isn't listed when no dataset could be in it """
+        imp.histories.upload_dataset_from_library.side_effect = (
+            lambda hist_id, dataset_id: {'id': 'H' + dataset_id[1:]})
+
+        imp.add_samples_to_history([self.make_paired_sample()], 'hist')
+
+        assert not imp.histories.show_history.called
+        assert imp.histories.upload_dataset_from_library.call_count == 2
+
+    def test_can_hide_source_items_old_galaxy(self, imp):
+        """ Test a Galaxy without the version API can't hide datasets """
+        imp.reg_gi.config.get_version.side_effect = ConnectionError(
+            'Unexpected HTTP status code: 404')
+
+        assert not imp.can_hide_source_items()
+
     def test_link(self, imp, folder_list):
         """Test uploading a local sample file to Galaxy as a link"""
         imp.library = mock.create_autospec(Library)
@@ -370,6 +866,358 @@ class TestIridaImport:
         uploaded = imp.link(sample_file, sample_folder_path)
         assert uploaded == single_file_list, 'The correct file must be made'
 
+    def test_add_samples_if_nec_batched(self, imp, mocker):
+        """ Test files for the same folder and type are linked together """
+        fake_stat(mocker)
+        imp.existing_file = Mock(return_value=False)
+        imp.create_folders_if_nec = Mock(
+            side_effect=lambda paths: dict(
+                (path, 'F' + path.rsplit('/', 1)[1]) for path in paths))
+
+        def upload(library_id, paths, **kwargs):
+            return [{'id': 'id_' + os.path.basename(path),
+                     'name': os.path.basename(path)}
+                    for path in paths.split('\n')]
+        imp.reg_gi.libraries.upload_from_galaxy_filesystem.side_effect = upload
+
+        sample = Sample("bobname", "paired", "unpaired")
+        forward = SampleFile('file1', "/imaginary/path/file1.fastq")
+        reverse = SampleFile('file2', "/imaginary/path/file2.fastq")
+        sample.add_pair(SamplePair('pair1', forward, reverse))
+        singles = [SampleFile('file3', "/imaginary/path/file3.fastq"),
+                   SampleFile('file4', "/imaginary/path/file4.fastq"),
+                   SampleFile('file5', "/imaginary/path/file5.fasta")]
+        for single in singles:
+            sample.add_file(single)
+
+        num_added = imp.add_samples_if_nec([sample])
+
+        assert num_added == 5
+        calls = imp.reg_gi.libraries.upload_from_galaxy_filesystem.call_args_list
+        assert [(call[0][1], call[1]['folder_id'], call[1]['file_type'])
+                for call in calls] == [
+            ("/imaginary/path/file1.fastq\n/imaginary/path/file2.fastq",
+             'Fpair1', 'fastqsanger'),
+            ("/imaginary/path/file3.fastq\n/imaginary/path/file4.fastq",
+             'Fbobname', 'fastqsanger'),
+            ("/imaginary/path/file5.fasta", 'Fbobname', 'auto')], \
+            'Files must be linked once per folder and file type'
+        for sample_file in [forward, reverse] + singles:
+            assert sample_file.library_dataset_id == \
+                'id_' + os.path.basename(sample_file.path), \
+                'Each file must get the id of its own dataset'
+        assert forward.library_folder_id == 'Fpair1'
+        assert len(imp.uploaded_files_log) == 5
+
+    def test_add_samples_if_nec_resumed(self, imp, mocker, tmpdir):
+        """ Test files and folders added by an earlier run are not added
+        again """
+        fake_stat(mocker)
+        imp.existing_file = Mock(return_value=False)
+        imp.create_folders_if_nec = Mock(
+            side_effect=lambda paths: dict(
+                (path, 'F' + path.rsplit('/', 1)[1]) for path in paths))
+        imp.reg_gi.libraries.upload_from_galaxy_filesystem.side_effect = (
+            lambda library_id, paths, **kwargs: [{'id': 'D2'}])
+        journal_path = str(tmpdir.join('journal.sqlite'))
+
+        def make_sample():
+            sample = Sample("bobname", "paired", "unpaired")
+            sample.add_file(SampleFile('file1', "/imaginary/path/file1.fastq"))
+            sample.add_file(SampleFile('file2', "/imaginary/path/file2.fastq"))
+            return sample
+
+        # The first run links one file before it is interrupted
+        imp.journal = ImportJournal(journal_path, 'key')
+        imp.journal.record_folders({'/illumina_reads/bobname': 'Fbobname'})
+        first = make_sample().get_reads()[0]
+        first.galaxy_path = '/illumina_reads/bobname/file1'
+        first.library_dataset_id = 'D1'
+        first.library_folder_id = 'Fbobname'
+        first.verified = True
+        imp.journal.record_files([first])
+        imp.journal.close()
+
+        imp.journal = ImportJournal(journal_path, 'key', resume=True)
+        sample = make_sample()
+        imp.add_samples_if_nec([sample])
+
+        imp.create_folders_if_nec.assert_called_once_with([])
+        imp.existing_file.assert_called_once_with(
+            "/imaginary/path/file2.fastq", '/illumina_reads/bobname/file2',
+            size=5678)
+        assert imp.reg_gi.libraries.upload_from_galaxy_filesystem.call_count == 1
+        assert [(sample_file.library_dataset_id, sample_file.verified)
+                for sample_file in sample.get_reads()] == \
+            [('D1', True), ('D2', False)]
+        assert len(imp.resumed_files_log) == 1
+
+    def test_stat_sample_files(self, imp, mocker):
+        """ Test each file is statted once, and its size is kept """
+        os_stat = fake_stat(mocker, size=42,
+                            missing=lambda path: 'missing' in path)
+        imp.MAX_CONCURRENT_FILE_STATS = 2
+        present = [SampleFile('file1', '/imaginary/run1/file1.fastq'),
+                   SampleFile('file2', '/imaginary/run2/file2.fastq')]
+        missing = SampleFile('missing', '/imaginary/run2/missing.fastq')
+
+        assert imp.stat_sample_files(present + [missing]) == [missing]
+        assert imp.stat_sample_files(present + [missing]) == [missing]
+
+        assert [sample_file.size for sample_file in present] == [42, 42]
+        assert os_stat.call_count == 4, \
+            'Only the missing file must be statted again'
+
+    def test_add_samples_if_nec_missing(self, imp, mocker):
+        """ Test every missing file is reported before the library is
+        changed """
+        fake_stat(mocker, missing=lambda path: 'missing' in path)
+        imp.create_folders_if_nec = Mock()
+        sample = Sample("bobname", "paired", "unpaired")
+        sample.add_file(SampleFile('missing1', "/imaginary/missing1.fastq"))
+        sample.add_file(SampleFile('file2', "/imaginary/file2.fastq"))
+        sample.add_file(SampleFile('missing3', "/imaginary/missing3.fastq"))
+
+        with pytest.raises(ValueError) as error:
+            imp.add_samples_if_nec([sample])
+
+        assert '2 file(s) not found' in str(error.value)
+        assert '/imaginary/missing1.fastq' in str(error.value)
+        assert '/imaginary/missing3.fastq' in str(error.value)
+        assert not imp.create_folders_if_nec.called
+        assert not imp.reg_gi.libraries.upload_from_galaxy_filesystem.called
+
+    def test_make_plan(self, imp, mocker):
+        """ Test a plan is made by reading the library, without changes """
+        fake_stat(mocker, missing=lambda path: 'missing' in path)
+        imp.gi.gi = mock.create_autospec(galaxy.GalaxyInstance)
+        imp.token = 'token'
+        imp.MAX_FILES_PER_LINK = 2
+        imp.find_lib = Mock(return_value=imp.library)
+        existing_folders = ['/illumina_reads', '/references',
+                            '/illumina_reads/bobname']
+        imp.exists_in_lib = Mock(
+            side_effect=lambda item_type, attr, path:
+            ['F1'] if path in existing_folders else [])
+        imp.existing_file = Mock(
+            side_effect=lambda path, galaxy_name, size: 'D1' if 'old' in path
+            else False)
+
+        sample = Sample("bobname", "paired", "unpaired")
+        sample.add_pair(SamplePair(
+            'pair1', SampleFile('fwd', "/imaginary/path/fwd.fastq"),
+            SampleFile('rev', "/imaginary/path/rev.fastq")))
+        for name in ('old', 'new1', 'new2', 'new3', 'missing'):
+            sample.add_file(SampleFile(name, "/imaginary/path/%s.fastq" % name))
+
+        plan = imp.make_plan([sample], 'boblib')
+
+        assert plan.library_exists
+        assert plan.folders_to_create == ['/illumina_reads/bobname/pair1']
+        assert plan.files_to_link == [
+            '/illumina_reads/bobname/pair1/fwd',
+            '/illumina_reads/bobname/pair1/rev',
+            '/illumina_reads/bobname/new1', '/illumina_reads/bobname/new2',
+            '/illumina_reads/bobname/new3']
+        assert plan.files_to_skip == ['/illumina_reads/bobname/old']
+        assert plan.missing_files == ["/imaginary/path/missing.fastq"]
+        # Files in a new folder are not looked for
+        assert imp.existing_file.call_count == 4
+        assert plan.irida_requests == 3
+        assert plan.galaxy_requests['Creating folders'] == 1
+        assert plan.galaxy_requests['Linking files'] == 3
+        assert plan.galaxy_requests['Verifying files'] == 2
+        assert (plan.history_datasets, plan.hidden_datasets,
+                plan.history_collections) == (6, 2, 1)
+
+        imp.MAX_PAIRS_PER_COLLECTION = 1
+        sample.add_pair(SamplePair(
+            'pair2', SampleFile('fwd2', "/imaginary/path/fwd2.fastq"),
+            SampleFile('rev2', "/imaginary/path/rev2.fastq")))
+        assert imp.make_plan([sample], 'boblib').history_collections == 2
+        assert not imp.reg_gi.libraries.upload_from_galaxy_filesystem.called
+        assert not imp.reg_gi.folders.create_folder.called
+
+    def test_plan_import(self, tmpdir):
+        """Test planning an import against stub IRIDA and Galaxy servers,
+        requesting samples through the OAuth2 session"""
+        irida = StubIridaServer(num_samples=2, file_dir=str(tmpdir)).start()
+        galaxy_server = StubGalaxyServer().start()
+        try:
+            for file_path in irida.file_paths():
+                with open(file_path, 'w') as sequence_file:
+                    sequence_file.write('@read\nACGT\n+\nIIII\n')
+            library_id = galaxy_server.create_library('boblib')
+            json_params = {'_embedded': {
+                'samples': irida.samples_dict(),
+                'user': {'email': 'bob@example.com'},
+                'addtohistory': True,
+                'library': {'name': 'boblib'},
+                'oauth2': {'redirect': 'http://galaxy.invalid/redirect',
+                           'code': 'unusedCode'}}}
+            param_path = str(tmpdir.join('param.json'))
+            with open(param_path, 'w') as param_file:
+                json.dump({'param_dict': {
+                    'json_params': json.dumps(json_params)}}, param_file)
+
+            imp = IridaImport()
+            imp.configure = Mock()
+            self.add_irida_constants(imp)
+            imp.GALAXY_URL = galaxy_server.url
+            imp.library_cache = LibraryStateCache()
+            imp.print_logged = Mock()
+
+            plan = imp.plan_import(param_path,
+                                   token=StubIridaServer.ACCESS_TOKEN,
+                                   irida_engine='session')
+        finally:
+            irida.stop()
+            galaxy_server.stop()
+
+        assert len(plan.files_to_link) == len(irida.file_paths())
+        assert galaxy_server.datasets(library_id) == [], \
+            'Planning must not change the library'
+
+    def test_make_plan_new_library(self, imp, mocker):
+        """ Test nothing is looked up in a library that doesn't exist """
+        fake_stat(mocker)
+        imp.gi.gi = mock.create_autospec(galaxy.GalaxyInstance)
+        imp.token = None
+        imp.find_lib = Mock(return_value=None)
+        imp.exists_in_lib = Mock()
+        imp.existing_file = Mock()
+        sample = Sample("bobname", "paired", "unpaired")
+        sample.add_file(SampleFile('file1', "/imaginary/path/file1.fastq"))
+
+        plan = imp.make_plan([sample], 'boblib', add_to_history=False)
+
+        assert not plan.library_exists
+        assert plan.folders_to_create == [
+            '/illumina_reads', '/references', '/illumina_reads/bobname']
+        assert plan.files_to_link == ['/illumina_reads/bobname/file1']
+        assert not imp.exists_in_lib.called
+        assert not imp.existing_file.called
+        assert plan.irida_requests == 4
+        assert plan.galaxy_requests['Creating the library'] == 3
+        assert 'Adding datasets to the history' not in plan.galaxy_requests
+
+    def test_link_files_out_of_order(self, imp):
+        """ Test linked datasets are matched to their files by name """
+        imp.reg_gi.libraries.upload_from_galaxy_filesystem.return_value = [
+            {'id': '2', 'name': 'file2.fastq'},
+            {'id': '1', 'name': 'file1.fastq'}]
+        files = [SampleFile('file1', '/imaginary/path/file1.fastq'),
+                 SampleFile('file2', '/imaginary/path/file2.fastq')]
+
+        imp.link_files([('/bob/file1', files[0]), ('/bob/file2', files[1])],
+                       'F1', 'fastqsanger')
+
+        assert [sample_file.library_dataset_id for sample_file in files] == \
+            ['1', '2']
+
+    def test_print_summary_failed_files(self, imp):
+        """ Test an import with unverified files isn't reported as a
+        success """
+        imp.print_logged = Mock()
+        imp.failed_files_log = [{'galaxy_name': '/illumina_reads/bob.fastq'}]
+
+        imp.print_summary()
+
+        lines = [call[0][0] for call in imp.print_logged.call_args_list]
+        assert lines[0] == ('Import partially completed: 1 file(s) could '
+                            'not be verified.')
+        assert 'Import completed successfully.' not in lines
+        assert 'File with Galaxy path: /illumina_reads/bob.fastq' in lines
+
+    def test_verify_sample_files_incoming(self, imp):
+        """ Test files that join verification are recorded in the journal
+        as soon as they are verified """
+        first = SampleFile('first', '/imaginary/first.fastq')
+        second = SampleFile('second', '/imaginary/second.fastq')
+        for num, sample_file in enumerate((first, second)):
+            sample_file.galaxy_path = '/illumina_reads/' + sample_file.name
+            sample_file.library_dataset_id = 'D%d' % num
+        arrivals = [([second], False), ([], True)]
+        recorded = []
+
+        def verify(sample_files, incoming):
+            first.verified = True
+            incoming(False)
+            restored = SampleFile('first', '/imaginary/first.fastq')
+            imp.journal.restore_file(restored, first.galaxy_path)
+            recorded.append(restored.verified)
+            incoming(False)
+            return [second]
+
+        imp.verification_scheduler = Mock()
+        imp.verification_scheduler.return_value.verify.side_effect = verify
+
+        failed = imp.verify_sample_files([first], lambda wait: arrivals.pop(0))
+
+        assert failed == [second]
+        assert recorded == [True], \
+            'A verified file must be recorded before verification ends'
+        restored = SampleFile('second', '/imaginary/second.fastq')
+        assert imp.journal.restore_file(restored, second.galaxy_path)
+        assert not restored.verified
+
+    def test_retry_sample_files(self, imp):
+        """ Test only failed files are linked and verified again """
+        imp.MAX_RETRIES = 3
+        flaky = SampleFile('flaky', '/imaginary/path/flaky.fastq')
+        flaky.galaxy_path = '/illumina_reads/s1/flaky'
+        flaky.library_folder_id = 'F1'
+        pending = SampleFile('pending', '/imaginary/path/pending.fastq')
+        pending.galaxy_path = '/illumina_reads/s1/pending'
+        pending.library_folder_id = 'F1'
+        pending.library_dataset_id = 'D2'
+        imp.link_files = Mock()
+        imp.verify_sample_files = Mock(side_effect=[[flaky], []])
+
+        failed = imp.retry_sample_files([flaky, pending])
+
+        assert failed == []
+        assert imp.verify_sample_files.call_args_list == [
+            mock.call([flaky, pending]), mock.call([flaky])]
+        # Only the deleted dataset is linked again, the pending one is
+        # verified again
+        imp.link_files.assert_called_with(
+            [('/illumina_reads/s1/flaky', flaky)], 'F1', 'fastqsanger',
+            retry=True)
+        assert imp.link_files.call_count == 2
+        assert imp.retried_files_log == OrderedDict([
+            ('/illumina_reads/s1/flaky', 2), ('/illumina_reads/s1/pending', 1)])
+
+    def test_retry_sample_files_gives_up(self, imp):
+        """ Test files are retried at most MAX_RETRIES times """
+        imp.MAX_RETRIES = 2
+        flaky = SampleFile('flaky', '/imaginary/path/flaky.fastq')
+        flaky.galaxy_path = '/illumina_reads/s1/flaky'
+        imp.link_files = Mock()
+        imp.verify_sample_files = Mock(return_value=[flaky])
+
+        assert imp.retry_sample_files([flaky]) == [flaky]
+        assert imp.verify_sample_files.call_count == 2
+        assert imp.retried_files_log['/illumina_reads/s1/flaky'] == 2
+
+    def test_make_irida_request_timed(self, imp):
+        """ Test requests to IRIDA are timed by endpoint """
+        imp.irida.get.return_value.json.return_value = {'resource': {}}
+
+        imp.make_irida_request('http://irida/api/samples/1/pairs')
+        imp.make_irida_request('http://irida/api/samples/2/pairs')
+
+        requests = imp.metrics.to_dict()['requests']['IRIDA']
+        assert requests['GET /api/samples/{id}/pairs']['count'] == 2
+
+    def test_write_metrics(self, imp, tmpdir):
+        """ Test the metrics are written next to the log """
+        log = str(tmpdir.join('log_file'))
+
+        imp.write_metrics(log)
+
+        assert os.path.isfile(log + '.metrics.json')
+
     def test_assign_ownership_if_nec(self, imp):
         # TODO: write the functionality for this to test
         return True
@@ -385,16 +1233,17 @@ class TestIridaImport:
             imp.histories = None
             lib = mock.create_autospec(Library)
             imp.get_first_or_make_lib = Mock(return_value=lib)
-            imp.create_folder_if_nec = Mock()
+            imp.create_folder_if_nec = Mock(return_value='F1')
             imp.add_samples_if_nec = mock.create_autospec(IridaImport.add_samples_if_nec)
-            imp.samples_uploaded_successfully = mock.create_autospec(IridaImport.samples_uploaded_successfully)
+            imp.get_sample_files = Mock(return_value=[])
+            imp.verify_sample_files = Mock(return_value=[])
             imp.add_samples_to_history = (
                 mock.create_autospec(IridaImport.add_samples_to_history))
             imp.assign_ownership_if_nec = Mock()
             imp.get_IRIDA_session = Mock()
             imp.get_sample_file = Mock()
             imp.get_sample_meta = Mock()
-            imp.get_samples = Mock()
+            imp.get_samples = Mock(return_value=[])
             imp.configure = Mock()
             imp.MAX_RETRIES = 3
             imp.make_irida_request = Mock()
@@ -412,3 +1261,39 @@ class TestIridaImport:
                 'One library should be created'
             assert imp.create_folder_if_nec.call_count >= 2, \
                 'At least the illumina and reference folders must be made'
+            with pytest.raises(sqlite3.ProgrammingError):
+                # The journal must be closed
+                imp.journal.samples()
+
+    def test_resume_needs_journal_file_cli(self, tmpdir):
+        """Test the command line reports the error of resuming without a
+        journal file, rather than failing to summarise the import"""
+        module_dir = os.path.dirname(os.path.dirname(os.path.dirname(
+            os.path.abspath(__file__))))
+        for path in glob.glob(os.path.join(module_dir, '*.py')):
+            shutil.copy(path, str(tmpdir))
+        shutil.copy(os.path.join(module_dir, 'irida_import.xml.sample'),
+                    str(tmpdir))
+        shutil.copy(os.path.join(module_dir, 'config.ini.sample'),
+                    str(tmpdir.join('config.ini')))
+
+        tool = subprocess.Popen(
+            [sys.executable, 'irida_import.py', '--resume',
+             '-p', 'params.json', '-l', 'log_file'],
+            cwd=str(tmpdir), stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        out, err = tool.communicate()
+
+        assert tool.returncode != 0
+        assert 'ValueError: Resuming an import needs journal_file' in err
+        assert 'AttributeError' not in err
+        assert 'Import failed.' in out
+
+    def test_resume_needs_journal_file(self):
+        """Test an import can't be resumed without a journal file"""
+        imp = IridaImport()
+        imp.configure = Mock()
+        self.add_irida_constants(imp)
+
+        with pytest.raises(ValueError):
+            imp.import_to_galaxy('/imaginary/params.dat', None, 'hist',
+                                 resume=True)
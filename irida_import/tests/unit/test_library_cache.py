@@ -0,0 +1,71 @@
+import pytest
+
+from ...library_cache import LibraryStateCache
+
+
+class FakeClock:
+
+    """A clock that only moves when told to"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.mark.unit
+class TestLibraryStateCache:
+
+    """ TestLibraryStateCache performs unit tests on LibraryStateCache."""
+
+    @pytest.fixture(scope='function')
+    def clock(self):
+        return FakeClock()
+
+    def test_get_or_create(self, clock):
+        """Test a library's state is created once and then reused"""
+        cache = LibraryStateCache(max_libraries=2, ttl=60, clock=clock)
+        state = cache.get_or_create('lib1', dict)
+
+        assert cache.get_or_create('lib1', dict) is state
+        assert cache.get('lib2') is None
+        assert len(cache) == 1
+
+    def test_ttl(self, clock):
+        """Test an expired library state is not used"""
+        cache = LibraryStateCache(max_libraries=2, ttl=60, clock=clock)
+        state = cache.get_or_create('lib1', dict)
+
+        clock.now += 59
+        assert cache.get('lib1') is state, 'A fresh state must be used'
+        clock.now += 2
+        assert cache.get('lib1') is None, 'An expired state must not be used'
+        assert cache.get_or_create('lib1', dict) is not state
+
+    def test_lru_eviction(self, clock):
+        """Test the least recently used library is evicted first"""
+        cache = LibraryStateCache(max_libraries=2, ttl=60, clock=clock)
+        cache.put('lib1', 'state1')
+        cache.put('lib2', 'state2')
+        cache.get('lib1')
+        cache.put('lib3', 'state3')
+
+        assert 'lib1' in cache
+        assert 'lib2' not in cache, 'The least recently used must be evicted'
+        assert 'lib3' in cache
+        assert len(cache) == 2
+
+    def test_invalidate(self, clock):
+        """Test invalidated libraries are discarded"""
+        cache = LibraryStateCache(clock=clock)
+        cache.put('lib1', 'state1')
+        cache.put('lib2', 'state2')
+
+        cache.invalidate('lib1')
+        cache.invalidate('unknown')
+        assert 'lib1' not in cache
+        assert 'lib2' in cache
+
+        cache.clear()
+        assert len(cache) == 0
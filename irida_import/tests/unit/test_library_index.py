@@ -0,0 +1,95 @@
+import pytest
+
+from ...library_index import LibraryIndex
+
+
+@pytest.mark.unit
+class TestLibraryIndex:
+
+    """ TestLibraryIndex performs unit tests on LibraryIndex."""
+
+    @pytest.fixture(scope='function')
+    def index(self):
+        """Create a library index as if read from Galaxy"""
+        return LibraryIndex([
+            {'id': 'F1', 'type': 'folder', 'name': '/illumina_reads',
+             'url': '/api/libraries/lala/contents/F1'},
+            {'id': 'F2', 'type': 'folder', 'name': '/illumina_reads/sample1'},
+            {'id': '1', 'type': 'file',
+             'name': '/illumina_reads/sample1/file1.fastq'},
+            {'id': '2', 'type': 'file',
+             'name': '/illumina_reads/sample1/file1.fastq'}
+        ])
+
+    def test_ids(self, index):
+        """Test items are found by type and name, with duplicates"""
+        assert index.loaded, 'An index made from a listing must be loaded'
+        assert len(index) == 4
+        assert index.ids('folder', '/illumina_reads') == ['F1']
+        assert index.ids('file', '/illumina_reads/sample1/file1.fastq') == \
+            ['1', '2'], 'Every item with the name must be found in order'
+        assert index.ids('file', '/illumina_reads/sample1') == [], \
+            'A folder must not be found as a file'
+
+    def test_add(self, index):
+        """Test items are added incrementally"""
+        index.add({'id': 'F3', 'type': 'folder',
+                   'name': '/illumina_reads/sample2'})
+        index.add({'id': '3', 'type': 'file',
+                   'name': '/illumina_reads/sample1/file1.fastq'})
+
+        assert index.ids('folder', '/illumina_reads/sample2') == ['F3']
+        assert index.ids('file', '/illumina_reads/sample1/file1.fastq') == \
+            ['1', '2', '3']
+
+    def test_add_existing_id(self, index):
+        """Test adding an item with an indexed id replaces the old item"""
+        index.add({'id': '1', 'type': 'file',
+                   'name': '/illumina_reads/sample1/renamed.fastq'})
+
+        assert len(index) == 4
+        assert index.ids('file', '/illumina_reads/sample1/file1.fastq') == \
+            ['2']
+        assert index.ids('file', '/illumina_reads/sample1/renamed.fastq') == \
+            ['1']
+
+    def test_remove(self, index):
+        """Test removed items are no longer found"""
+        index.remove('1')
+        index.remove('2')
+        index.remove('unknown')
+
+        assert len(index) == 2
+        assert index.ids('file', '/illumina_reads/sample1/file1.fastq') == []
+
+    def test_load_folder(self, index):
+        """Test folder contents are named by path and keep their metadata"""
+        index.load_folder('/illumina_reads/sample1', [
+            {'id': '2', 'type': 'file', 'name': 'file1.fastq',
+             'file_size': '1.2 KB', 'raw_size': 1234, 'state': 'ok'},
+            {'id': '3', 'type': 'file', 'name': 'file2.fastq',
+             'file_size': '1.2 KB', 'state': 'queued'},
+            {'id': 'F4', 'type': 'folder', 'name': 'pair1'}])
+
+        assert index.folder_loaded('/illumina_reads/sample1')
+        assert index.get('file', '/illumina_reads/sample1/file1.fastq') == [
+            {'id': '1', 'type': 'file',
+             'name': '/illumina_reads/sample1/file1.fastq'},
+            {'id': '2', 'type': 'file', 'file_size': 1234, 'state': 'ok',
+             'name': '/illumina_reads/sample1/file1.fastq'}]
+        assert index.get('file', '/illumina_reads/sample1/file2.fastq') == [
+            {'id': '3', 'type': 'file', 'state': 'queued',
+             'name': '/illumina_reads/sample1/file2.fastq'}], \
+            'A readable size must not be kept as the size in bytes'
+        assert index.ids('folder', '/illumina_reads/sample1/pair1') == ['F4']
+
+    def test_find(self, index):
+        """Test items are found by id, with their metadata"""
+        index.load_folder('/illumina_reads/sample1', [
+            {'id': '2', 'type': 'file', 'name': 'file1.fastq',
+             'raw_size': 1234, 'state': 'ok', 'ldda_id': 'L2'}])
+
+        assert index.find('F1') == {'id': 'F1', 'type': 'folder',
+                                    'name': '/illumina_reads'}
+        assert index.find('2')['ldda_id'] == 'L2'
+        assert index.find('unknown') is None
@@ -0,0 +1,47 @@
+import pytest
+
+from ...sample import Sample
+from ...sample_file import SampleFile
+from ...sample_pair import SamplePair
+
+
+@pytest.mark.unit
+class TestSample:
+
+    """ TestSample performs unit tests on Sample, SamplePair and SampleFile."""
+
+    def make_sample(self):
+        sample = Sample('bobname', 'paired', 'unpaired')
+        sample.add_pair(SamplePair(
+            'pair1', SampleFile('forward', '/imaginary/path/forward.fastq'),
+            SampleFile('reverse', '/imaginary/path/reverse.fastq')))
+        sample.add_file(SampleFile('single', '/imaginary/path/single.fastq'))
+        return sample
+
+    def test_repr(self):
+        """Test a sample counts both files of each pair"""
+        sample = self.make_sample()
+
+        assert 'Number of files: 3' in repr(sample)
+        assert 'forward @ /imaginary/path/forward.fastq' in \
+            repr(sample.get_reads()[0])
+
+    def test_no_dict(self):
+        """Test samples and their files only have their own attributes"""
+        sample = self.make_sample()
+        pair, single = sample.get_reads()
+
+        for item in (sample, pair, pair.forward, single):
+            assert not hasattr(item, '__dict__')
+            with pytest.raises(AttributeError):
+                item.unknown = True
+
+    def test_sample_file_defaults(self):
+        sample_file = SampleFile('single', '/imaginary/path/single.fastq')
+
+        assert sample_file.library_dataset_id is None
+        assert sample_file.library_folder_id is None
+        assert sample_file.galaxy_path is None
+        assert not sample_file.verified
+        assert sample_file == SampleFile('other',
+                                         '/imaginary/path/single.fastq')
@@ -0,0 +1,212 @@
+import mock
+import pytest
+import threading
+import time
+
+from mock import Mock
+from bioblend import galaxy
+from ...library_index import LibraryIndex
+from ...sample_file import SampleFile
+from ...verification import VerificationScheduler
+from ...wait_policy import BackoffWaitPolicy, FixedWaitPolicy
+
+
+@pytest.mark.unit
+class TestVerificationScheduler:
+
+    """ TestVerificationScheduler performs unit tests on VerificationScheduler."""
+
+    @pytest.fixture(scope='function')
+    def gi(self):
+        """Create a Galaxy instance to verify datasets with"""
+        gi = mock.create_autospec(galaxy.GalaxyInstance)
+        gi.folders = mock.create_autospec(galaxy.folders.FoldersClient)
+        gi.libraries = mock.create_autospec(galaxy.libraries.LibraryClient)
+        gi.libraries.delete_library_dataset.return_value = {'deleted': True}
+        return gi
+
+    def make_file(self, name, dataset_id, folder_id):
+        sample_file = SampleFile(name, '/imaginary/path/' + name)
+        sample_file.library_dataset_id = dataset_id
+        sample_file.library_folder_id = folder_id
+        return sample_file
+
+    def list_states(self, gi, rounds):
+        """Make folder listings return a round of states at a time"""
+        def show_folder(folder_id, contents):
+            return {'folder_contents': [
+                {'id': dataset_id, 'type': 'file', 'state': state}
+                for dataset_id, state in rounds[0][folder_id].items()]}
+        gi.folders.show_folder.side_effect = show_folder
+
+        def next_round(seconds):
+            rounds.pop(0)
+        return next_round
+
+    def test_verify(self, gi):
+        """Test pending datasets are polled together once per round"""
+        sleep = Mock()
+        files = [self.make_file('a', '1', 'F1'), self.make_file('b', '2', 'F1'),
+                 self.make_file('c', '3', 'F2')]
+        sleep.side_effect = self.list_states(gi, [
+            {'F1': {'1': 'queued', '2': 'ok'}, 'F2': {'3': 'running'}},
+            {'F1': {'1': 'ok', '2': 'ok'}, 'F2': {'3': 'ok'}}])
+        scheduler = VerificationScheduler(
+            gi, 'lib', 3, 3, wait_policy=FixedWaitPolicy(sleep=sleep))
+
+        failed = scheduler.verify(files)
+
+        assert failed == []
+        assert all(sample_file.verified for sample_file in files)
+        assert sleep.call_count == 1, 'There must be one wait per round'
+        assert gi.folders.show_folder.call_count == 4, \
+            'Each folder must be listed once per round'
+        assert not gi.libraries.show_dataset.called
+
+    def test_verify_failures(self, gi):
+        """Test failed datasets are deleted and pending ones given up on"""
+        sleep = Mock()
+        lib_state = LibraryIndex([{'id': '2', 'type': 'file',
+                                   'name': '/illumina_reads/b'}])
+        errored = self.make_file('b', '2', 'F1')
+        stuck = self.make_file('c', '3', 'F1')
+        sleep.side_effect = self.list_states(gi, [
+            {'F1': {'2': 'error', '3': 'queued'}},
+            {'F1': {'3': 'queued'}},
+            {'F1': {'3': 'queued'}}])
+        scheduler = VerificationScheduler(
+            gi, 'lib', 1, 3, lib_state=lib_state,
+            wait_policy=FixedWaitPolicy(sleep=sleep))
+
+        failed = scheduler.verify([errored, stuck])
+
+        assert failed == [errored, stuck]
+        assert errored.library_dataset_id is None, \
+            'A dataset in an error state must be deleted'
+        assert lib_state.ids('file', '/illumina_reads/b') == []
+        assert stuck.library_dataset_id == '3', \
+            'A pending dataset must not be deleted'
+        assert gi.libraries.delete_library_dataset.call_count == 1
+        assert sleep.call_count == 1, \
+            'A pending dataset must be checked max_waits + 1 times'
+
+    def test_verify_backoff_time_limit(self, gi):
+        """Test a backoff policy gives up after max_waits fixed waits"""
+        sleep = Mock()
+        stuck = self.make_file('c', '3', 'F1')
+        gi.folders.show_folder.return_value = {'folder_contents': [
+            {'id': '3', 'type': 'file', 'state': 'queued'}]}
+        scheduler = VerificationScheduler(
+            gi, 'lib', 3, 3, wait_policy=BackoffWaitPolicy(
+                initial=1, factor=2, maximum=30, jitter=0, sleep=sleep))
+
+        failed = scheduler.verify([stuck])
+
+        assert failed == [stuck]
+        assert [args[0][0] for args in sleep.call_args_list] == [1, 2, 4, 8], \
+            'A pending dataset must be given up on after 3 * 5 seconds'
+
+    def test_folders_listed_concurrently(self, gi):
+        """Test folders are listed at the same time, up to the limit"""
+        lock = threading.Lock()
+        listing = []
+        most = [0]
+        files = [self.make_file(name, name, 'F' + name)
+                 for name in ('1', '2', '3')]
+
+        def show_folder(folder_id, contents):
+            with lock:
+                listing.append(folder_id)
+                most[0] = max(most[0], len(listing))
+            time.sleep(0.1)
+            with lock:
+                listing.remove(folder_id)
+            return {'folder_contents': [
+                {'id': folder_id[1:], 'type': 'file', 'state': 'ok'}]}
+        gi.folders.show_folder.side_effect = show_folder
+        scheduler = VerificationScheduler(
+            gi, 'lib', 3, 3, wait_policy=FixedWaitPolicy(sleep=Mock()),
+            max_concurrent_requests=2)
+
+        assert scheduler.verify(files) == []
+        assert all(sample_file.verified for sample_file in files)
+        assert most[0] == 2, \
+            'Up to max_concurrent_requests folders must be listed at once'
+
+    def test_folders_remembered(self, gi):
+        """Test listed folders are added to the library's state, keeping
+        the states of finished datasets only"""
+        lib_state = LibraryIndex([{'id': 'F1', 'type': 'folder',
+                                   'name': '/illumina_reads/s1'}])
+        sample_file = self.make_file('a', '1', 'F1')
+        gi.folders.show_folder.return_value = {'folder_contents': [
+            {'id': '1', 'type': 'file', 'name': 'a', 'state': 'ok',
+             'raw_size': 10, 'file_size': '10 bytes'},
+            {'id': '2', 'type': 'file', 'name': 'b', 'state': 'queued',
+             'raw_size': 0, 'file_size': '0 bytes'}]}
+        scheduler = VerificationScheduler(
+            gi, 'lib', 1, 3, lib_state=lib_state,
+            wait_policy=FixedWaitPolicy(sleep=Mock()))
+
+        assert scheduler.verify([sample_file]) == []
+        assert lib_state.folder_loaded('/illumina_reads/s1')
+        finished, = lib_state.get('file', '/illumina_reads/s1/a')
+        assert (finished['file_size'], finished['state']) == (10, 'ok')
+        pending, = lib_state.get('file', '/illumina_reads/s1/b')
+        assert 'state' not in pending, \
+            'A pending state must not be kept, as it will change'
+
+    def test_verify_without_folder(self, gi):
+        """Test datasets without a known folder are requested one by one"""
+        sample_file = self.make_file('a', '1', None)
+        gi.libraries.show_dataset.return_value = {'state': 'ok'}
+        scheduler = VerificationScheduler(
+            gi, 'lib', 1, 3, wait_policy=FixedWaitPolicy(sleep=Mock()))
+
+        assert scheduler.verify([sample_file]) == []
+        gi.libraries.show_dataset.assert_called_once_with('lib', '1')
+
+    def test_on_verified(self, gi):
+        """Test each file is reported in the round it is verified in"""
+        sleep = Mock()
+        verified = []
+        files = [self.make_file('a', '1', 'F1'), self.make_file('b', '2', 'F1')]
+        sleep.side_effect = self.list_states(gi, [
+            {'F1': {'1': 'queued', '2': 'ok'}},
+            {'F1': {'1': 'ok', '2': 'ok'}}])
+        sleep.side_effect = lambda seconds, next_round=sleep.side_effect: (
+            verified.append('wait'), next_round(seconds))
+        scheduler = VerificationScheduler(
+            gi, 'lib', 3, 3, wait_policy=FixedWaitPolicy(sleep=sleep),
+            on_verified=lambda sample_file: verified.append(sample_file.name))
+
+        scheduler.verify(files)
+
+        assert verified == ['b', 'wait', 'a']
+
+    def test_incoming(self, gi):
+        """Test files that arrive during verification join the next round"""
+        sleep = Mock()
+        first, second = (self.make_file('a', '1', 'F1'),
+                         self.make_file('b', '2', 'F1'))
+        sleep.side_effect = self.list_states(gi, [
+            {'F1': {'1': 'queued'}},
+            {'F1': {'1': 'queued', '2': 'ok'}},
+            {'F1': {'1': 'ok', '2': 'ok'}}])
+        arrivals = [([], False), ([second], False), ([], True)]
+        waited = []
+
+        def incoming(wait):
+            waited.append(wait)
+            return arrivals.pop(0)
+
+        scheduler = VerificationScheduler(
+            gi, 'lib', 3, 3, wait_policy=FixedWaitPolicy(sleep=sleep))
+
+        failed = scheduler.verify([first], incoming)
+
+        assert failed == []
+        assert first.verified and second.verified
+        assert waited == [False, False, False], \
+            'Arrivals must not be waited for while files are pending'
+        assert gi.folders.show_folder.call_count == 3
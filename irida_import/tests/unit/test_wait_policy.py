@@ -0,0 +1,90 @@
+import pytest
+
+from ...sample_file import SampleFile
+from ...wait_policy import BackoffWaitPolicy, FixedWaitPolicy
+
+
+class FakeClock:
+
+    """A clock that only moves when slept on"""
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.mark.unit
+class TestWaitPolicy:
+
+    """ TestWaitPolicy performs unit tests on the wait policies."""
+
+    @pytest.fixture(scope='function')
+    def clock(self):
+        return FakeClock()
+
+    def test_fixed(self, clock):
+        """Test a fixed policy always waits the same time"""
+        policy = FixedWaitPolicy(5, sleep=clock.sleep)
+        for round_num in range(3):
+            policy.wait(round_num, [])
+
+        assert clock.sleeps == [5, 5, 5]
+
+    def test_backoff(self, clock):
+        """Test waits grow exponentially up to the maximum"""
+        policy = BackoffWaitPolicy(initial=1, factor=2, maximum=10, jitter=0,
+                                   sleep=clock.sleep)
+        for round_num in range(6):
+            policy.wait(round_num, [])
+
+        assert clock.sleeps == [1, 2, 4, 8, 10, 10]
+        assert clock.now == 35
+
+    def test_backoff_jitter(self, clock):
+        """Test jitter shortens waits by at most its fraction"""
+        policy = BackoffWaitPolicy(initial=4, factor=2, maximum=10,
+                                   jitter=0.5, sleep=clock.sleep,
+                                   random=lambda: 0.5)
+        policy.wait(0, [])
+        policy.wait(5, [])
+
+        assert clock.sleeps == [3, 7.5]
+
+    def test_backoff_file_size(self, clock, mocker):
+        """Test large pending files make waits longer"""
+        sizes = {'/small.fastq': 1000, '/large.fastq': 50000}
+        mocker.patch('os.path.getsize', side_effect=lambda path: sizes[path])
+        policy = BackoffWaitPolicy(initial=1, factor=2, maximum=30, jitter=0,
+                                   bytes_per_second=1000, sleep=clock.sleep)
+        small = SampleFile('small.fastq', '/small.fastq')
+        large = SampleFile('large.fastq', '/large.fastq')
+
+        policy.wait(0, [small])
+        policy.wait(0, [small, large])
+
+        assert clock.sleeps == [2, 30], \
+            'The largest pending file must decide how long to wait'
+
+    def test_backoff_statted_file_size(self, clock, mocker):
+        """Test the size of a statted file is not read again"""
+        getsize = mocker.patch('os.path.getsize')
+        policy = BackoffWaitPolicy(initial=1, factor=2, maximum=30, jitter=0,
+                                   bytes_per_second=1000, sleep=clock.sleep)
+        statted = SampleFile('statted.fastq', '/statted.fastq')
+        statted.size = 4000
+
+        policy.wait(0, [statted])
+
+        assert clock.sleeps == [5]
+        assert not getsize.called
+
+    def test_time_limit(self):
+        """Test both policies give up after the same time"""
+        assert FixedWaitPolicy().time_limit(120) == 600
+        assert FixedWaitPolicy(2).time_limit(120) == 240
+        assert BackoffWaitPolicy(maximum=30).time_limit(120) == 600, \
+            'max_waits must not mean more time with longer waits'
@@ -0,0 +1,241 @@
+import logging
+import time
+
+from multiprocessing.pool import ThreadPool
+
+from wait_policy import FixedWaitPolicy
+
+
+class VerificationScheduler:
+
+    """
+    Verifies that library datasets were imported successfully.
+
+    Every pending dataset is checked each round, and the states of datasets
+    in the same library folder are read from a single folder listing, and
+    the folders are listed concurrently. The scheduler waits once per round,
+    not once per dataset, for as long as its wait policy says.
+    """
+
+    PENDING_STATES = ['new', 'upload', 'queued', 'running', 'setting_metadata']
+
+    def __init__(self, gi, library_id, max_waits, max_retries,
+                 lib_state=None, logger=None, wait_policy=None,
+                 on_verified=None, max_concurrent_requests=1):
+        """
+        Create a verification scheduler.
+
+        :type gi: bioblend.galaxy.GalaxyInstance
+        :param gi: the Galaxy instance the library is in
+        :type library_id: str
+        :param library_id: the id of the library the datasets are in
+        :type max_waits: int
+        :param max_waits: how long to wait for a pending dataset before
+        giving up on it, in waits of the default fixed interval whatever the
+        wait policy is
+        :type max_retries: int
+        :param max_retries: the number of times to retry deleting a failed
+        dataset
+        :type lib_state: LibraryIndex
+        :param lib_state: the library's state, which deleted datasets are
+        removed from, and the folders listed while verifying are added to
+        :type logger: logging.Logger
+        :param logger: the logger to write to
+        :type wait_policy: FixedWaitPolicy
+        :param wait_policy: decides how long to wait between rounds, five
+        seconds by default
+        :type on_verified: function
+        :param on_verified: called with each sample file as soon as it is
+        verified, before the rest of its round is checked
+        :type max_concurrent_requests: int
+        :param max_concurrent_requests: the most folders to list at the same
+        time
+        """
+        self.gi = gi
+        self.library_id = library_id
+        self.max_waits = max_waits
+        self.max_retries = max_retries
+        self.lib_state = lib_state
+        self.logger = logger or logging.getLogger('irida_import')
+        self.wait_policy = wait_policy or FixedWaitPolicy()
+        self.on_verified = on_verified
+        self.max_concurrent_requests = max_concurrent_requests
+
+    def verify(self, sample_files, incoming=None):
+        """
+        Wait until every sample file is imported or has failed.
+
+        A sample file whose dataset is in an error state is deleted from the
+        library. A sample file that is still pending after the wait policy's
+        time limit for max_waits is given up on, but not deleted.
+
+        Sample files can join while others are being verified: at the start
+        of each round, the files that have arrived since are taken from
+        incoming and checked in the same round as the rest.
+
+        :type sample_files: list
+        :param sample_files: the SampleFiles to verify
+        :type incoming: function
+        :param incoming: called at the start of each round with whether to
+        wait for more files, because none are pending. Returns a tuple of a
+        list of the SampleFiles that arrived since it was last called, and
+        whether no more will arrive.
+        :return: a list of the sample files that could not be verified
+        """
+        failed = []
+        time_limit = self.wait_policy.time_limit(self.max_waits)
+        # The seconds waited so far, and when each sample file started waiting
+        waited = 0
+        joined = {}
+        round_num = 0
+        pending = [sample_file for sample_file in sample_files
+                   if not sample_file.verified]
+        for sample_file in pending:
+            joined[id(sample_file)] = waited
+        more = incoming is not None
+
+        while pending or more:
+            if more:
+                arrived, done = incoming(not pending)
+                more = not done
+                arrived = [sample_file for sample_file in arrived
+                           if not sample_file.verified]
+                if arrived:
+                    pending.extend(arrived)
+                    for sample_file in arrived:
+                        joined[id(sample_file)] = waited
+                    # New files are checked as often as at the start
+                    round_num = 0
+                if not pending:
+                    continue
+
+            self.logger.debug(time.strftime("[%D %H:%M:%S]:") +
+                              ' Verifying integrity of %d file(s)'
+                              % len(pending))
+            states = self.get_states(pending)
+            still_pending = []
+
+            for sample_file in pending:
+                state = states[id(sample_file)]
+                if state == 'ok':  # uploaded succesfully
+                    self.logger.debug(time.strftime("[%D %H:%M:%S]:") +
+                                      ' OK! ' + sample_file.name)
+                    sample_file.verified = True
+                    if self.on_verified is not None:
+                        self.on_verified(sample_file)
+                elif state in self.PENDING_STATES:
+                    self.logger.debug(time.strftime("[%D %H:%M:%S]:") +
+                                      ' PENDING! (%s) %s' %
+                                      (state, sample_file.name))
+                    # Allow for rounding in the seconds waited
+                    if waited - joined[id(sample_file)] >= time_limit - 1e-9:
+                        failed.append(sample_file)
+                    else:
+                        still_pending.append(sample_file)
+                else:
+                    self.logger.debug(time.strftime("[%D %H:%M:%S]:") +
+                                      ' NOT OK! ' + sample_file.name)
+                    self.delete(sample_file)
+                    failed.append(sample_file)
+
+            pending = still_pending
+            if pending:
+                waited += self.wait_policy.wait(round_num, pending)
+                round_num += 1
+
+        return failed
+
+    def get_states(self, sample_files):
+        """
+        Get the states of sample files' datasets, listing each of their
+        library folders once. Up to max_concurrent_requests folders are
+        listed at the same time.
+
+        :type sample_files: list
+        :param sample_files: the SampleFiles to get the states of
+        :return: a dict of states by the id() of each sample file
+        """
+        by_folder = {}
+        for sample_file in sample_files:
+            by_folder.setdefault(sample_file.library_folder_id,
+                                 []).append(sample_file)
+
+        folder_ids = [folder_id for folder_id in by_folder
+                      if folder_id is not None]
+        workers = min(self.max_concurrent_requests, len(folder_ids))
+        if workers <= 1:
+            listings = [self.list_states(folder_id)
+                        for folder_id in folder_ids]
+        else:
+            pool = ThreadPool(workers)
+            try:
+                listings = pool.map(self.list_states, folder_ids)
+            finally:
+                pool.terminate()
+        folder_states = dict(zip(folder_ids, listings))
+
+        states = {}
+        for folder_id, folder_files in by_folder.items():
+            listed = folder_states.get(folder_id, {})
+            for sample_file in folder_files:
+                if sample_file.library_dataset_id in listed:
+                    state = listed[sample_file.library_dataset_id]
+                else:
+                    state = sample_file.state(self.gi, self.library_id)
+                states[id(sample_file)] = state
+
+        return states
+
+    def list_states(self, folder_id):
+        """
+        Get the states of the datasets in a library folder, and add the
+        folder's contents to the library's state.
+
+        :type folder_id: str
+        :param folder_id: the id of the folder
+        :return: a dict of states by library dataset id
+        """
+        contents = self.gi.folders.show_folder(folder_id, contents=True)
+        if self.lib_state is not None:
+            self.remember_folder(folder_id, contents['folder_contents'])
+        return dict((item['id'], item['state'])
+                    for item in contents['folder_contents']
+                    if 'state' in item)
+
+    def remember_folder(self, folder_id, items):
+        """
+        Add a folder listing to the library's state, so a later import of
+        the same files finds their sizes and states without asking Galaxy.
+        Only finished datasets keep their state, so the others are checked
+        again when they are next needed.
+
+        :type folder_id: str
+        :param folder_id: the id of the folder
+        :type items: list
+        :param items: the folder's content dicts
+        """
+        folder = self.lib_state.find(folder_id)
+        if folder is None:
+            return
+
+        listed = []
+        for item in items:
+            if item.get('state', 'ok') != 'ok':
+                item = dict(item)
+                del item['state']
+            listed.append(item)
+        self.lib_state.load_folder(folder['name'], listed)
+
+    def delete(self, sample_file):
+        """
+        Delete a failed sample file's dataset from the library.
+
+        :type sample_file: SampleFile
+        :param sample_file: the sample file to delete
+        """
+        for attempt in range(self.max_retries + 1):
+            if sample_file.delete(self.gi, self.library_id):
+                if self.lib_state is not None:
+                    self.lib_state.remove(sample_file.library_dataset_id)
+                sample_file.library_dataset_id = None
+                break
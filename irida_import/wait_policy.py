@@ -0,0 +1,135 @@
+import os.path
+import random
+import time
+
+
+class FixedWaitPolicy:
+
+    """Waits the same number of seconds between every verification round"""
+
+    # The seconds waited each round by default, and that a number of waits
+    # is counted in by every policy
+    INTERVAL = 5
+
+    def __init__(self, interval=INTERVAL, sleep=time.sleep):
+        """
+        Create a fixed wait policy.
+
+        :type interval: float
+        :param interval: the number of seconds to wait each round
+        :type sleep: function
+        :param sleep: called with the number of seconds to wait
+        """
+        self.interval = interval
+        self.sleep = sleep
+
+    def time_limit(self, max_waits):
+        """
+        Get how long to wait for a pending dataset before giving up on it.
+
+        :type max_waits: int
+        :param max_waits: the number of times to wait
+        :return: the number of seconds
+        """
+        return max_waits * self.interval
+
+    def delay(self, round_num, sample_files):
+        """
+        Get the number of seconds to wait after a verification round.
+
+        :type round_num: int
+        :param round_num: the number of rounds waited for already
+        :type sample_files: list
+        :param sample_files: the SampleFiles that are still pending
+        :return: the number of seconds to wait
+        """
+        return self.interval
+
+    def wait(self, round_num, sample_files):
+        """
+        Wait after a verification round.
+
+        :type round_num: int
+        :param round_num: the number of rounds waited for already
+        :type sample_files: list
+        :param sample_files: the SampleFiles that are still pending
+        :return: the number of seconds waited
+        """
+        seconds = self.delay(round_num, sample_files)
+        self.sleep(seconds)
+        return seconds
+
+
+class BackoffWaitPolicy(FixedWaitPolicy):
+
+    """
+    Waits exponentially longer each verification round, up to a maximum.
+
+    Each wait is shortened by a random fraction of up to jitter, so that
+    imports started together don't poll Galaxy together. If bytes_per_second
+    is set, the time Galaxy would need to process the largest pending file at
+    that rate is added to each wait, so small files are checked soon and
+    large files are checked less often.
+    """
+
+    def __init__(self, initial=1, factor=2, maximum=30, jitter=0.25,
+                 bytes_per_second=None, sleep=time.sleep,
+                 random=random.random):
+        """
+        Create an exponential backoff wait policy.
+
+        :type initial: float
+        :param initial: the number of seconds to wait after the first round
+        :type factor: float
+        :param factor: how many times longer each wait is than the last
+        :type maximum: float
+        :param maximum: the most seconds to wait after any round
+        :type jitter: float
+        :param jitter: the largest fraction a wait may be shortened by
+        :type bytes_per_second: float
+        :param bytes_per_second: the rate at which Galaxy is expected to
+        process files, or None not to consider file sizes
+        :type sleep: function
+        :param sleep: called with the number of seconds to wait
+        :type random: function
+        :param random: returns a random number in [0, 1)
+        """
+        self.initial = initial
+        self.factor = factor
+        self.maximum = maximum
+        self.jitter = jitter
+        self.bytes_per_second = bytes_per_second
+        self.sleep = sleep
+        self.random = random
+
+    def time_limit(self, max_waits):
+        """
+        Get how long to wait for a pending dataset before giving up on it.
+        The waits get longer, so max_waits is taken as waits of the default
+        fixed interval, to give up after the same time as a fixed policy.
+
+        :type max_waits: int
+        :param max_waits: the number of fixed waits
+        :return: the number of seconds
+        """
+        return max_waits * FixedWaitPolicy.INTERVAL
+
+    def delay(self, round_num, sample_files):
+        seconds = self.initial * self.factor ** round_num
+
+        if self.bytes_per_second and sample_files:
+            largest = max(self.file_size(sample_file)
+                          for sample_file in sample_files)
+            seconds += float(largest) / self.bytes_per_second
+
+        seconds = min(seconds, self.maximum)
+        return seconds * (1 - self.jitter * self.random())
+
+    def file_size(self, sample_file):
+        """Get the local size of a sample file, or 0 if it can't be read"""
+        if sample_file.size is not None:
+            return sample_file.size
+        try:
+            return os.path.getsize(sample_file.path)
+        except OSError:
+            return 0